@@ -37,6 +37,10 @@ class BaseAgent:
     or tool calls.  Every output is a validated Pydantic model.
     """
 
+    # True if execute() ignores the state it is given: the orchestrator's result
+    # cache may then reuse a result regardless of the current state
+    state_independent: bool = False
+
     def __init__(
         self,
         name: str,
@@ -21,6 +21,10 @@ class Settings:
     MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "128000"))
     HCMS_VECTOR_DIMENSION = int(os.getenv("HCMS_VECTOR_DIMENSION", "1536"))
 
+    # Orchestrator Scheduling
+    ORCHESTRATOR_MAX_CONCURRENCY = int(os.getenv("ORCHESTRATOR_MAX_CONCURRENCY", "16"))
+    ORCHESTRATOR_DAG_CACHE_SIZE = int(os.getenv("ORCHESTRATOR_DAG_CACHE_SIZE", "256"))
+
     # Networking & Security
     EVENT_BUS_HOST = os.getenv("EVENT_BUS_HOST", "127.0.0.1")
     EVENT_BUS_PORT = int(os.getenv("EVENT_BUS_PORT", "50051"))
@@ -9,3 +9,11 @@ class HallucinationDetectedError(HANERMABaseException):
 class InfiniteLoopBoundError(HANERMABaseException):
     """Raised when an agent attempts to hand off tasks in a recursive circle."""
     pass
+
+class BackpressureError(HANERMABaseException):
+    """Raised when a bounded message queue is full and its overflow policy is 'reject'."""
+    pass
+
+class EventWriteError(HANERMABaseException):
+    """Raised when recorded steps could not be committed to the transactional event store."""
+    pass
@@ -1,26 +1,42 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional, Tuple
 import numpy as np
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+import json
 import re
 
+END_OF_WORD = '</w>'
+_HARMONICS = np.arange(1, 4, dtype=np.int64)
+
+
 class BaseHyperTokenizer(ABC):
     """
     Abstract base class for HANERMA tokenizers with BPE support.
     Any tokenizer plugged into HANERMA must implement these methods.
+
+    BPE merges are learned once, by train() on a corpus or load_merges() from a
+    file, and kept as a rank table. A tokenizer that was never trained learns
+    its merges from the first text it encodes. Encoding applies the ranked
+    merges word by word and caches each word's token ids in an LRU.
     """
 
-    def __init__(self):
+    def __init__(self, word_cache_size: int = 10000):
         self.token_to_id: Dict[str, int] = {}
         self.id_to_token: Dict[int, str] = {}
         self.merges: Dict[tuple, str] = {}
+        self.merge_ranks: Dict[Tuple[str, str], int] = {}
+        self.word_cache_size = word_cache_size
+        self._word_cache: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._trained = False
 
     @abstractmethod
     def encode_and_compress(self, text: str) -> List[int]:
-        vocab = self.build_vocab(text)
-        self.merges = self.train_bpe(vocab, num_merges=100)
-        tokens = self.tokenize_bpe(text, self.merges)
-        return tokens
+        if not self._trained:
+            self.train([text])
+        return self.tokenize_bpe(text)
+
+    def encode_many(self, texts: List[str]) -> List[List[int]]:
+        return [self.encode_and_compress(text) for text in texts]
 
     @abstractmethod
     def decode(self, tokens: List[int]) -> str:
@@ -51,7 +67,7 @@ class BaseHyperTokenizer(ABC):
         words = text.split()
         vocab = defaultdict(int)
         for word in words:
-            word = ' '.join(list(word)) + ' </w>'
+            word = ' '.join(list(word)) + ' ' + END_OF_WORD
             vocab[word] += 1
         return vocab
 
@@ -65,10 +81,11 @@ class BaseHyperTokenizer(ABC):
 
     def merge_vocab(self, pair: tuple, v_in: Dict[str, int]) -> Dict[str, int]:
         v_out = {}
-        bigram = ' '.join(pair)
+        # Match whole symbols only: "a b" must not match inside "xa b"
+        bigram = re.compile(r'(?<!\S)' + re.escape(' '.join(pair)) + r'(?!\S)')
         replacement = ''.join(pair)
         for word in v_in:
-            w_out = word.replace(bigram, replacement)
+            w_out = bigram.sub(lambda _: replacement, word)
             v_out[w_out] = v_in[word]
         return v_out
 
@@ -83,42 +100,132 @@ class BaseHyperTokenizer(ABC):
             merges[best] = ''.join(best)
         return merges
 
-    def tokenize_bpe(self, text: str, merges: Dict[tuple, str]) -> List[int]:
-        words = text.split()
+    def train(self, corpus: Iterable[str], num_merges: int = 100):
+        """Learns the merge table from a corpus. Token ids are reassigned deterministically."""
+        vocab: Dict[str, int] = defaultdict(int)
+        for text in corpus:
+            for word, freq in self.build_vocab(text).items():
+                vocab[word] += freq
+        symbols = sorted({symbol for word in vocab for symbol in word.split()})
+        self._install_merges(self.train_bpe(vocab, num_merges), symbols)
+
+    def _install_merges(self, merges: Dict[tuple, str], symbols: Iterable[str] = ()):
+        """Base symbols first, then merged symbols in rank order: same corpus, same ids."""
+        self.merges = dict(merges)
+        self.merge_ranks = {pair: rank for rank, pair in enumerate(self.merges)}
+        self.token_to_id = {}
+        self.id_to_token = {}
+        self._word_cache.clear()
+        for symbol in list(symbols) + [symbol for pair in self.merges for symbol in pair] + list(self.merges.values()):
+            self._token_id(symbol)
+        self._trained = True
+
+    def save_merges(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "merges": [list(pair) for pair in self.merges],
+                "tokens": [self.id_to_token[i] for i in range(len(self.id_to_token))],
+            }, f)
+
+    def load_merges(self, path: str):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self._install_merges({tuple(pair): ''.join(pair) for pair in data["merges"]}, data["tokens"])
+
+    def _token_id(self, symbol: str) -> int:
+        token_id = self.token_to_id.get(symbol)
+        if token_id is None:
+            token_id = len(self.token_to_id)
+            self.token_to_id[symbol] = token_id
+            self.id_to_token[token_id] = symbol
+        return token_id
+
+    def _bpe_word(self, word: str) -> List[str]:
+        """Applies the lowest-ranked merge present until none applies."""
+        symbols = list(word) + [END_OF_WORD]
+        ranks = self.merge_ranks
+        while len(symbols) > 1:
+            best_rank, best = None, None
+            for pair in zip(symbols, symbols[1:]):
+                rank = ranks.get(pair)
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best = rank, pair
+            if best is None:
+                break
+            first, second = best
+            merged = []
+            i = 0
+            while i < len(symbols):
+                if i < len(symbols) - 1 and symbols[i] == first and symbols[i + 1] == second:
+                    merged.append(first + second)
+                    i += 2
+                else:
+                    merged.append(symbols[i])
+                    i += 1
+            symbols = merged
+        return symbols
+
+    def tokenize_bpe(self, text: str, merges: Optional[Dict[tuple, str]] = None) -> List[int]:
+        if merges is not None and merges != self.merges:
+            self._install_merges(merges)
         tokens = []
-        for word in words:
-            word = ' '.join(list(word)) + ' </w>'
-            for pair, merge in merges.items():
-                word = word.replace(' '.join(pair), merge)
-            symbols = word.split()
-            for sym in symbols:
-                if sym not in self.token_to_id:
-                    token_id = len(self.token_to_id)
-                    self.token_to_id[sym] = token_id
-                    self.id_to_token[token_id] = sym
-                tokens.append(self.token_to_id[sym])
+        cache = self._word_cache
+        for word in text.split():
+            ids = cache.get(word)
+            if ids is None:
+                ids = [self._token_id(symbol) for symbol in self._bpe_word(word)]
+                cache[word] = ids
+                if len(cache) > self.word_cache_size:
+                    cache.popitem(last=False)
+            else:
+                cache.move_to_end(word)
+            tokens.extend(ids)
         return tokens
 
     def count_tokens(self, text: str) -> int:
         return len(self.encode_and_compress(text))
 
     def embed(self, text: str, dim: int = 128) -> np.ndarray:
-        tokens = self.encode_and_compress(text)
-        if not tokens:
-            return np.zeros(dim, dtype=np.float32)
-
-        vec = np.zeros(dim, dtype=np.float64)
-        for i, tid in enumerate(tokens):
-            pos_weight = 1.0 / (1.0 + i * 0.1)
-            for harmonic in range(1, 4):
-                freq = tid * harmonic * 0.01
-                idx_sin = (tid * harmonic) % dim
-                idx_cos = (tid * harmonic + dim // 2) % dim
-                vec[idx_sin] += np.sin(freq) * pos_weight
-                vec[idx_cos] += np.cos(freq) * pos_weight
-
-        norm = np.linalg.norm(vec)
-        if norm > 0:
-            vec = vec / norm
-
-        return vec.astype(np.float32)
+        return self.embed_many([text], dim)[0]
+
+    def embed_many(self, texts: List[str], dim: int = 128) -> np.ndarray:
+        """
+        Harmonic token embeddings as an (n, dim) float32 matrix.
+
+        Token i with id t adds sin(t*h*0.01) and cos(t*h*0.01), weighted by
+        1 / (1 + 0.1*i), at slots (t*h) % dim and (t*h + dim//2) % dim for
+        harmonics h = 1..3; each row is then L2-normalized. All texts are
+        computed in one pass, and bincount accumulates the terms in the same
+        order as the original per-token loop, so vectors are bit-identical.
+        """
+        token_lists = self.encode_many(texts)
+        lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.int64)
+        total = int(lengths.sum())
+        vecs = np.zeros((len(texts), dim), dtype=np.float64)
+        if total == 0:
+            return vecs.astype(np.float32)
+
+        tids = np.fromiter((tid for tokens in token_lists for tid in tokens), dtype=np.int64, count=total)
+        positions = np.arange(total, dtype=np.int64)
+        if len(texts) > 1:
+            positions -= np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pos_weight = 1.0 / (1.0 + positions * 0.1)
+
+        products = tids[:, None] * _HARMONICS                      # (total, 3): t*h
+        freq = products * 0.01
+        # (token, harmonic, sin/cos) flattened in loop order
+        slots = (products[:, :, None] + np.array([0, dim // 2], dtype=np.int64)) % dim
+        terms = np.empty((total, 3, 2), dtype=np.float64)
+        terms[:, :, 0] = np.sin(freq)
+        terms[:, :, 1] = np.cos(freq)
+        terms *= pos_weight[:, None, None]
+        if len(texts) > 1:
+            # Row offsets keep texts apart in one flat accumulator
+            slots += (np.repeat(np.arange(len(texts), dtype=np.int64), lengths) * dim)[:, None, None]
+        vecs = np.bincount(slots.ravel(), weights=terms.ravel(), minlength=len(texts) * dim).reshape(len(texts), dim)
+
+        # Row by row: a 1-D dot is what np.linalg.norm computes for a single vector
+        norms = np.array([np.sqrt(row.dot(row)) for row in vecs])
+        nonzero = norms > 0
+        vecs[nonzero] /= norms[nonzero, None]
+        return vecs.astype(np.float32)
@@ -0,0 +1,73 @@
+"""
+Thresholded cosine-similarity neighbours for redundancy clustering.
+
+Small inputs use the exact n x n similarity matrix. Larger ones use a FAISS
+HNSW inner-product index over L2-normalized embeddings, which answers each
+k-nearest-neighbour query in roughly O(log n): a block whose k nearest
+neighbours all clear the threshold is re-queried with 2k, so dense clusters
+are not truncated. The ANN path trades a little recall for O(n log n) time
+and O(n) memory instead of the O(n^2) matrix.
+"""
+
+from typing import List
+
+import faiss
+import numpy as np
+
+EXACT_MAX_BLOCKS = 2048
+DEFAULT_NEIGHBORS = 32
+MAX_NEIGHBORS = 1024
+
+
+def normalized(embeddings: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(embeddings, dtype=np.float32).copy()
+    faiss.normalize_L2(vectors)  # zero vectors stay zero
+    return vectors
+
+
+def threshold_neighbors(embeddings: np.ndarray, threshold: float, method: str = "auto",
+                        exact_max_blocks: int = EXACT_MAX_BLOCKS, k: int = DEFAULT_NEIGHBORS,
+                        hnsw_m: int = 32) -> List[np.ndarray]:
+    """
+    For each row i, the sorted indices j != i with cosine(i, j) > threshold.
+    method: "exact", "ann", or "auto" (exact up to exact_max_blocks rows).
+    """
+    n = len(embeddings)
+    if n < 2:
+        return [np.zeros(0, dtype=np.int64) for _ in range(n)]
+    if method == "exact" or (method == "auto" and n <= exact_max_blocks):
+        return _exact_neighbors(embeddings, threshold)
+
+    vectors = normalized(embeddings)
+
+    index = faiss.IndexHNSWFlat(vectors.shape[1], hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    index.add(vectors)
+
+    neighbors: List[np.ndarray] = [None] * n
+    pending = np.arange(n)
+    k = min(k, n)
+    while len(pending):
+        index.hnsw.efSearch = max(64, k)
+        similarities, indices = index.search(vectors[pending], k)
+        truncated = []
+        for row, i in enumerate(pending):
+            # Results come best first: if even the k-th clears the threshold there may be more
+            if similarities[row, -1] > threshold and indices[row, -1] >= 0 and k < min(n, MAX_NEIGHBORS):
+                truncated.append(i)
+                continue
+            hits = (similarities[row] > threshold) & (indices[row] >= 0) & (indices[row] != i)
+            neighbors[i] = np.sort(indices[row][hits])
+        pending = np.array(truncated, dtype=np.int64)
+        k = min(2 * k, n, MAX_NEIGHBORS)
+    return neighbors
+
+
+def _exact_neighbors(embeddings: np.ndarray, threshold: float) -> List[np.ndarray]:
+    # float64, normalized like sklearn's cosine_similarity
+    vectors = np.asarray(embeddings, dtype=np.float64)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms[:, None]
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, -np.inf)
+    return [np.flatnonzero(row > threshold) for row in similarity]
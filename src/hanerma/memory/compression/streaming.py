@@ -0,0 +1,100 @@
+"""
+Bounded, pipelined stages for streaming context compression.
+
+Input text (a str, or a sync/async iterable of chunks of any size) is cut into
+windows of at most `window_words` words. Each window goes through a CPU stage
+(segment + embed + cluster) in an executor and then an async stage (condense +
+reconstruct) on the event loop, and its output is yielded as soon as it is
+ready. Stages are connected by queues of `max_pending` windows, so window k+1
+is analysed while window k is condensed and memory stays proportional to the
+window size, not the input length. Redundancy is only detected within a
+window.
+"""
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Union
+
+DEFAULT_WINDOW_WORDS = 2000
+DEFAULT_MAX_PENDING = 2
+
+TextSource = Union[str, Iterable[str], AsyncIterable[str]]
+
+_DONE = object()
+
+
+async def _chunks(source: TextSource) -> AsyncIterator[str]:
+    if isinstance(source, str):
+        yield source
+    elif hasattr(source, "__aiter__"):
+        async for chunk in source:
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+
+async def word_windows(source: TextSource, window_words: int = DEFAULT_WINDOW_WORDS) -> AsyncIterator[str]:
+    """
+    Space-joined windows of at most `window_words` words. A word split across
+    two chunks is kept whole.
+    """
+    if window_words < 1:
+        raise ValueError("window_words must be positive")
+    words: List[str] = []
+    tail = ""
+    async for chunk in _chunks(source):
+        text = tail + chunk
+        tail = ""
+        split = text.split()
+        # The last word may continue in the next chunk
+        if split and not text[-1].isspace():
+            tail = split.pop()
+        words.extend(split)
+        while len(words) >= window_words:
+            yield " ".join(words[:window_words])
+            del words[:window_words]
+    if tail:
+        words.append(tail)
+    while words:
+        yield " ".join(words[:window_words])
+        del words[:window_words]
+
+
+async def pipeline(windows: AsyncIterable[str],
+                   analyse: Callable[[str], Any],
+                   finish: Callable[[str, Any], Awaitable[str]],
+                   executor: Optional[Executor] = None,
+                   max_pending: int = DEFAULT_MAX_PENDING) -> AsyncIterator[str]:
+    """
+    Yield `await finish(window, analyse(window))` for each window, in order.
+    `analyse` runs in `executor` (the loop's default thread pool if None) and
+    must be picklable to use a process pool; `finish` runs on the loop.
+    """
+    loop = asyncio.get_running_loop()
+    analysed: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_pending))
+
+    async def produce():
+        try:
+            async for window in windows:
+                result = await loop.run_in_executor(executor, analyse, window)
+                await analysed.put((window, result))
+        except Exception as exc:
+            await analysed.put(exc)
+        else:
+            await analysed.put(_DONE)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await analysed.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            window, result = item
+            yield await finish(window, result)
+    finally:
+        # Consumer stopped early or failed: don't leave the producer blocked on the queue
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
@@ -1,11 +1,16 @@
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from concurrent.futures import Executor
 import numpy as np
 import asyncio
 import json
 import ast
 import re
-from sklearn.metrics.pairwise import cosine_similarity
 from hanerma.memory.compression.base_tokenizer import BaseHyperTokenizer
+from hanerma.memory.compression.similarity import EXACT_MAX_BLOCKS, threshold_neighbors
+from hanerma.memory.compression.streaming import (
+    DEFAULT_MAX_PENDING, DEFAULT_WINDOW_WORDS, TextSource, pipeline, word_windows
+)
+from hanerma.memory.embedding_cache import DEFAULT_EMBEDDING_CACHE, EmbeddingCache
 import spacy
 import requests
 
@@ -86,12 +91,21 @@ class XervCrayonAdapter(BaseHyperTokenizer):
     Uses sentence-transformers for cosine similarity analysis of sliding context windows,
     identifies redundant blocks, and performs async LLM condensation into Semantic Deltas.
     Preserves AST/code structures with absolute fidelity.
+
+    Sentence-transformer embeddings go through an EmbeddingCache (shared with
+    MemoryTieringManager by default) and all windows of a text are encoded in
+    one batched call of encode_batch_size.
     """
 
-    def __init__(self, profile: str = "lite", device: str = "auto"):
+    EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+    def __init__(self, profile: str = "lite", device: str = "auto", encode_batch_size: int = 64,
+                 embedding_cache: Optional[EmbeddingCache] = None):
+        self.encode_batch_size = encode_batch_size
+        self.embedding_cache = embedding_cache or DEFAULT_EMBEDDING_CACHE
         try:
             from sentence_transformers import SentenceTransformer
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2', device=device)
+            self.embedding_model = SentenceTransformer(self.EMBEDDING_MODEL, device=device)
             print(f"[XERV-CRAYON] Loaded sentence-transformers model")
         except ImportError:
             print("[XERV-CRAYON] sentence-transformers not available, using fallback")
@@ -165,84 +179,96 @@ class XervCrayonAdapter(BaseHyperTokenizer):
         Segment text into semantic blocks, preserving protected content.
         Uses sliding windows with AST preservation.
         """
-        blocks = []
+        windows = []
         words = text.split()
         i = 0
         
         while i < len(words):
             # Check for protected content in current window
             window_text = ' '.join(words[i:i+window_size])
+            end_idx = min(i+window_size, len(words))
             
             if self._is_protected_content(window_text):
                 # Protected block - preserve exactly
-                block_embedding = self._compute_embedding(window_text)
-                block = SemanticBlock(
-                    text=window_text,
-                    start_idx=i,
-                    end_idx=min(i+window_size, len(words)),
-                    embedding=block_embedding,
-                    is_protected=True,
-                    block_type="protected"
-                )
-                blocks.append(block)
+                windows.append((window_text, i, end_idx, True))
                 i += window_size
             else:
                 # Regular text block
-                block_embedding = self._compute_embedding(window_text)
-                block = SemanticBlock(
-                    text=window_text,
-                    start_idx=i,
-                    end_idx=min(i+window_size, len(words)),
-                    embedding=block_embedding,
-                    is_protected=False,
-                    block_type="text"
-                )
-                blocks.append(block)
+                windows.append((window_text, i, end_idx, False))
                 i += window_size // 2  # Overlapping windows
         
-        return blocks
+        # One batched encode for every window
+        embeddings = self._compute_embeddings([window[0] for window in windows])
+        return [
+            SemanticBlock(
+                text=window_text,
+                start_idx=start_idx,
+                end_idx=end_idx,
+                embedding=embedding,
+                is_protected=is_protected,
+                block_type="protected" if is_protected else "text"
+            )
+            for (window_text, start_idx, end_idx, is_protected), embedding in zip(windows, embeddings)
+        ]
 
     def _compute_embedding(self, text: str) -> np.ndarray:
         """Compute semantic embedding for text block."""
+        return self._compute_embeddings([text])[0]
+
+    def _compute_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        """Embeddings for several texts: cache hits plus one batched encode for the rest."""
+        if not texts:
+            return []
         if self.embedding_model:
-            return self.embedding_model.encode(text, convert_to_numpy=True)
+            return list(self.embedding_cache.encode(
+                self.embedding_model, self.EMBEDDING_MODEL, texts, batch_size=self.encode_batch_size))
         else:
             # Fallback: simple hash-based embedding
             import hashlib
-            hash_obj = hashlib.md5(text.encode())
-            hash_bytes = hash_obj.digest()
-            return np.frombuffer(hash_bytes, dtype=np.uint8).astype(np.float32) / 255.0
+            return [
+                np.frombuffer(hashlib.md5(text.encode()).digest(), dtype=np.uint8).astype(np.float32) / 255.0
+                for text in texts
+            ]
 
     def _cluster_similar_blocks(self, blocks: List[SemanticBlock], 
-                               similarity_threshold: float = 0.85) -> Dict[int, List[SemanticBlock]]:
+                               similarity_threshold: float = 0.85, method: str = "auto",
+                               exact_max_blocks: int = EXACT_MAX_BLOCKS) -> Dict[int, List[SemanticBlock]]:
         """
         Cluster blocks by semantic similarity using cosine similarity.
         Returns groups of highly similar blocks that can be condensed.
+
+        Up to exact_max_blocks candidate blocks the full similarity matrix is
+        used; beyond that (or with method="ann") neighbours above the threshold
+        come from a FAISS HNSW inner-product index, in O(n log n) time and O(n)
+        memory instead of O(n^2).
         """
         if len(blocks) < 2:
             return {}
         
-        # Compute similarity matrix
-        embeddings = np.array([block.embedding for block in blocks])
-        similarity_matrix = cosine_similarity(embeddings)
+        # Protected blocks never join a cluster, so they are left out of the search
+        candidates = [i for i, block in enumerate(blocks) if not block.is_protected]
+        if len(candidates) < 2:
+            return {}
+        embeddings = np.array([blocks[i].embedding for i in candidates])
+        neighbors = threshold_neighbors(embeddings, similarity_threshold, method=method,
+                                        exact_max_blocks=exact_max_blocks)
         
         # Find clusters
         clusters = {}
         visited = set()
         
-        for i, block in enumerate(blocks):
-            if i in visited or block.is_protected:
+        for position, i in enumerate(candidates):
+            if i in visited:
                 continue
                 
-            cluster = [block]
+            cluster = [blocks[i]]
             visited.add(i)
             
             # Find similar blocks
-            for j, other_block in enumerate(blocks):
-                if j not in visited and not other_block.is_protected:
-                    if similarity_matrix[i, j] > similarity_threshold:
-                        cluster.append(other_block)
-                        visited.add(j)
+            for j in (candidates[p] for p in neighbors[position]):
+                if j not in visited:
+                    cluster.append(blocks[j])
+                    visited.add(j)
             
             if len(cluster) > 1:  # Only cluster if multiple similar blocks
                 cluster_id = len(clusters)
@@ -310,28 +336,58 @@ class XervCrayonAdapter(BaseHyperTokenizer):
     async def compress_context_semantic(self, text: str, compression_ratio: float = 0.1) -> str:
         """
         True semantic information bottleneck with zero data loss.
+
+        Text is compressed in windows of DEFAULT_WINDOW_WORDS (2000) words, so
+        redundancy is only detected within a window: a passage repeated in
+        different windows is compressed in each, not merged across them.
         """
         if len(text.strip()) == 0:
             return text
-            
-        # Segment text into semantic blocks with AST preservation
+        return "".join([piece async for piece in self.compress_context_stream(text, compression_ratio)])
+
+    async def compress_context_stream(self, source: TextSource, compression_ratio: float = 0.1,
+                                      window_words: int = DEFAULT_WINDOW_WORDS,
+                                      executor: Optional[Executor] = None,
+                                      max_pending: int = DEFAULT_MAX_PENDING) -> AsyncIterator[str]:
+        """
+        Compress `source` (a str or a sync/async iterable of chunks) window by
+        window, yielding each compressed window as soon as it is ready; the
+        pieces concatenate to the full result. Segmentation, embedding and
+        clustering run in `executor` (default thread pool) so the event loop is
+        never blocked, and at most `max_pending` windows are held in memory.
+        """
+        first = True
+        windows = word_windows(source, window_words)
+        async for piece in pipeline(windows, self._analyse_window,
+                                    lambda window, analysed: self._finish_window(window, analysed, compression_ratio, executor),
+                                    executor=executor, max_pending=max_pending):
+            if piece:
+                yield piece if first else " " + piece
+                first = False
+
+    def _analyse_window(self, text: str) -> Tuple[List[SemanticBlock], Dict[int, List[SemanticBlock]]]:
+        # Segment text into semantic blocks with AST preservation, then cluster similar blocks
         blocks = self._segment_text_into_blocks(text)
-        
-        # Cluster similar blocks
-        clusters = self._cluster_similar_blocks(blocks)
-        
+        return blocks, self._cluster_similar_blocks(blocks)
+
+    async def _finish_window(self, text: str, analysed, compression_ratio: float,
+                             executor: Optional[Executor] = None) -> str:
+        blocks, clusters = analysed
+
         # Async compression of clusters
         compressed_deltas = await self._compress_clusters(clusters)
-        
+
         # Reconstruct text
         compressed_text = self._reconstruct_text(blocks, compressed_deltas)
-        
+
         # Ensure we meet compression ratio if needed
         current_ratio = len(compressed_text) / len(text) if len(text) > 0 else 1.0
         if current_ratio > compression_ratio:
-            # Additional lossless compression for protected content
-            compressed_text = self._compress_protected_only(compressed_text, compression_ratio)
-        
+            # Additional lossless compression for protected content (spaCy parse: CPU-bound)
+            loop = asyncio.get_running_loop()
+            compressed_text = await loop.run_in_executor(
+                executor, self._compress_protected_only, compressed_text, compression_ratio)
+
         return compressed_text
 
     def _compress_protected_only(self, text: str, target_ratio: float) -> str:
@@ -387,18 +443,17 @@ class XervCrayonAdapter(BaseHyperTokenizer):
     def compress_context(self, text: str, ratio: float = 0.1) -> str:
         """
         Main compression entry point - now uses true semantic bottleneck.
+        Synchronous code only: inside a running event loop, await
+        compress_context_semantic() or iterate compress_context_stream().
         """
-        # Run async compression in a new event loop if needed
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # We're in an async context, run synchronously
-                return asyncio.run(self.compress_context_semantic(text, ratio))
-            else:
-                return loop.run_until_complete(self.compress_context_semantic(text, ratio))
+            asyncio.get_running_loop()
         except RuntimeError:
-            # No event loop, create one
             return asyncio.run(self.compress_context_semantic(text, ratio))
+        raise RuntimeError(
+            "compress_context() cannot be called from a running event loop; "
+            "use 'await compress_context_semantic(text)' or iterate compress_context_stream(text)"
+        )
 
     def get_compression_ratio(self, original_text: str, compressed_text: str) -> float:
         if len(original_text) == 0:
@@ -409,7 +464,7 @@ class XervCrayonAdapter(BaseHyperTokenizer):
     def embed(self, text: str, dim: int = 128) -> np.ndarray:
         """Enhanced embedding using sentence-transformers if available."""
         if self.embedding_model:
-            embedding = self.embedding_model.encode(text, convert_to_numpy=True)
+            embedding = self._compute_embedding(text)
             if dim != embedding.shape[0]:
                 # Truncate or pad to requested dimension
                 if dim < embedding.shape[0]:
@@ -422,6 +477,15 @@ class XervCrayonAdapter(BaseHyperTokenizer):
             # Fallback embedding
             return self._compute_embedding(text)[:dim]
 
+    def embed_many(self, texts: List[str], dim: int = 128) -> np.ndarray:
+        """Batched embed(): one encode call for every text not already cached, as an (n, dim) float32 matrix."""
+        if not texts:
+            return np.zeros((0, dim), dtype=np.float32)
+        vectors = np.stack(self._compute_embeddings(texts)).astype(np.float32)
+        if vectors.shape[1] >= dim:
+            return vectors[:, :dim]
+        return np.pad(vectors, ((0, 0), (0, dim - vectors.shape[1])))
+
     def get_efficiency_report(self) -> dict:
         return {
             "compression_type": "semantic_information_bottleneck",
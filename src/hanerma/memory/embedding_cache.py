@@ -0,0 +1,101 @@
+"""
+Content-addressed LRU cache for sentence-transformer embeddings.
+
+Keys are (model name, BLAKE2 hash of the text), so identical text is encoded
+once per model no matter which component asks: XervCrayonAdapter windows and
+queries and MemoryTieringManager archives share DEFAULT_EMBEDDING_CACHE unless
+they are given their own. Misses are deduplicated and sent to the model in a
+single batched encode() call.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Sequence, Tuple
+
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, bytes], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_name: str, text: str) -> Tuple[str, bytes]:
+        return model_name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, model_name: str, text: str):
+        key = self.key(model_name, text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def put(self, model_name: str, text: str, vector: np.ndarray):
+        vector = np.array(vector, copy=True)
+        vector.flags.writeable = False  # shared between callers
+        with self._lock:
+            self._put(self.key(model_name, text), vector)
+
+    def _put(self, key, vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def encode(self, model: Any, model_name: str, texts: Sequence[str], batch_size: int = 64) -> np.ndarray:
+        """
+        Embeddings for `texts` as a (len(texts), dim) matrix. Cached texts are
+        served from memory; the rest go to model.encode() in one batched call.
+        """
+        keys = [self.key(model_name, text) for text in texts]
+        found: Dict[Tuple[str, bytes], np.ndarray] = {}
+        missing: Dict[Tuple[str, bytes], str] = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+                elif key not in missing:
+                    missing[key] = text
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            encoded = np.asarray(model.encode(list(missing.values()), batch_size=batch_size, convert_to_numpy=True))
+            with self._lock:
+                for key, vector in zip(missing, encoded):
+                    vector = np.array(vector, copy=True)
+                    vector.flags.writeable = False
+                    self._put(key, vector)
+                    found[key] = vector
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+DEFAULT_EMBEDDING_CACHE = EmbeddingCache()
@@ -4,8 +4,10 @@ import requests
 import json
 import asyncio
 import time
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, MutableMapping, Optional
+from hanerma.memory.persistence import PagedMemoryMap, append_metadata, commit_manifest, read_manifest
 from hanerma.memory.compression.base_tokenizer import BaseHyperTokenizer
+from hanerma.memory.providers.ann_index import AutoUpgradingIndex, IndexPolicy
 from hanerma.state.transactional_bus import TransactionalEventBus
 
 
@@ -16,17 +18,24 @@ class HCMSManager:
       1. Token-derived deterministic embeddings (FAISS)
       2. Compressed storage with real compression metrics
       3. Token-aware retrieval via spectral hashing
+
+    The vector index starts flat and is rebuilt as IVF-Flat or HNSW in the
+    background once it passes index_policy.upgrade_threshold memories.
     """
 
-    def __init__(self, tokenizer: BaseHyperTokenizer, bus: TransactionalEventBus, embedding_dim: int = 128):
+    def __init__(self, tokenizer: BaseHyperTokenizer, bus: TransactionalEventBus, embedding_dim: int = 128,
+                 index_policy: Optional[IndexPolicy] = None):
         self.tokenizer = tokenizer
         self.bus = bus
         self.embedding_dim = embedding_dim
 
         # FAISS for semantic similarity search
-        self.vector_index = faiss.IndexFlatL2(self.embedding_dim)
-        self.memory_map: Dict[int, Dict[str, Any]] = {}
+        self.vector_index = AutoUpgradingIndex(self.embedding_dim, "L2", index_policy)
+        self.memory_map: MutableMapping[int, Dict[str, Any]] = {}
         self.current_idx = 0
+        self._store_id: Optional[str] = None  # set once saved to / loaded from disk
+        # Memory id ranges [start, stop) per session and per entity type, for filtered retrieval
+        self._partitions: Dict[str, Dict[str, List[List[int]]]] = {"session": {}, "type": {}}
 
         # Placeholder for Neo4j (GraphRAG)
         self.graph_db = None
@@ -45,7 +54,7 @@ class HCMSManager:
         self.primary_model = "llama3"  # Main model
         self.speculative_cache: Dict[str, str] = {}
         
-        print(f"[HCMS] Memory Store Online. Dimension: {self.embedding_dim}. Index: FAISS FlatL2.")
+        print(f"[HCMS] Memory Store Online. Dimension: {self.embedding_dim}. Index: FAISS FlatL2 → {self.vector_index.policy.kind} at {self.vector_index.policy.upgrade_threshold}.")
         print(f"[HCMS] User Style Extraction: Every {self.style_extraction_threshold} interactions")
         print(f"[HCMS] Speculative Decoding: {self.speculative_model} → {self.primary_model}")
 
@@ -255,57 +264,166 @@ Output ONLY JSON with these exact keys:
         Tokenizes text via xerv-crayon, generates a deterministic embedding,
         and stores it in FAISS for semantic retrieval.
         """
-        # 1. Tokenize with xerv-crayon
-        compressed_tokens = self.tokenizer.encode_and_compress(raw_text)
-        token_count = len(compressed_tokens)
-        efficiency = self.tokenizer.get_compression_ratio(raw_text, compressed_tokens)
-
-        print(f"[HCMS] Session {session_id} | Tokens: {token_count} | Compression: {efficiency}%")
-
-        # 2. Generate deterministic embedding FROM token IDs (not random)
-        vector = self.tokenizer.embed(raw_text, dim=self.embedding_dim)
-        vector = vector.reshape(1, -1)
-
-        # 3. Store in FAISS
-        self.vector_index.add(vector)
-        self.memory_map[self.current_idx] = {
-            "text": raw_text,
-            "tokens": token_count,
-            "session": session_id,
-            "type": entity_type,
-        }
-        self.current_idx += 1
+        self.store_many(session_id, [raw_text], entity_type)
+
+    def store_many(self, session_id: str, texts: List[str], entity_type: str = "context",
+                   batch_size: int = 1024) -> List[int]:
+        """
+        Bulk ingestion: tokenizes and embeds texts in batches, adds each batch
+        to FAISS with a single stacked add() and updates memory_map in bulk.
+        Returns the memory ids assigned to the texts, in order.
+        """
+        ids: List[int] = []
+        total_tokens = 0
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+
+            # 1. Tokenize with xerv-crayon
+            token_counts = [len(tokens) for tokens in self._encode_batch(batch)]
+            total_tokens += sum(token_counts)
+
+            # 2. Deterministic embeddings FROM token IDs, stacked into one matrix
+            vectors = self._embed_batch(batch)
+
+            # 3. One FAISS add per batch
+            self.vector_index.add(vectors)
+            first_id = self.current_idx
+            self.memory_map.update({
+                first_id + i: {
+                    "text": text,
+                    "tokens": count,
+                    "session": session_id,
+                    "type": entity_type,
+                }
+                for i, (text, count) in enumerate(zip(batch, token_counts))
+            })
+            self.current_idx += len(batch)
+            ids.extend(range(first_id, self.current_idx))
+            self._add_to_partition("session", session_id, first_id, self.current_idx)
+            self._add_to_partition("type", entity_type, first_id, self.current_idx)
 
         # 4. Route facts to graph store
         if entity_type == "fact":
-            self._store_in_graph(session_id, raw_text)
+            for text in texts:
+                self._store_in_graph(session_id, text)
+
+        if texts:
+            print(f"[HCMS] Session {session_id} | Stored {len(texts)} memories | Tokens: {total_tokens}")
+        return ids
+
+    def _encode_batch(self, texts: List[str]) -> List[List[int]]:
+        encode_many = getattr(self.tokenizer, "encode_many", None)
+        if encode_many is not None:
+            return encode_many(texts)
+        return [self.tokenizer.encode_and_compress(text) for text in texts]
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), embedding_dim) float32 matrix, C-contiguous for FAISS."""
+        embed_many = getattr(self.tokenizer, "embed_many", None)
+        if embed_many is not None:
+            vectors = embed_many(texts, dim=self.embedding_dim)
+        else:
+            vectors = np.stack([self.tokenizer.embed(text, dim=self.embedding_dim) for text in texts])
+        return np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(texts), self.embedding_dim)
+
+    def _add_to_partition(self, column: str, value: str, start: int, stop: int):
+        ranges = self._partitions[column].setdefault(value, [])
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = stop
+        else:
+            ranges.append([start, stop])
 
-    def retrieve_relevant_context(self, query: str, top_k: int = 3) -> List[str]:
+    def _partition_ids(self, session_id: Optional[str], entity_type: Optional[str]) -> Optional[np.ndarray]:
+        """Sorted memory ids matching the filters, or None when unfiltered."""
+        ids = None
+        for column, value in (("session", session_id), ("type", entity_type)):
+            if value is None:
+                continue
+            parts = [np.arange(start, stop, dtype=np.int64) for start, stop in self._partitions[column].get(value, [])]
+            ids_where = getattr(self.memory_map, "ids_where", None)
+            if ids_where is not None:
+                parts.insert(0, ids_where(column, value))
+            matched = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+            ids = matched if ids is None else np.intersect1d(ids, matched, assume_unique=True)
+        return ids
+
+    def retrieve_relevant_context(self, query: str, top_k: int = 3, session_id: Optional[str] = None,
+                                  entity_type: Optional[str] = None) -> List[str]:
         """
         Tokenizes the query with xerv-crayon, generates its embedding,
         and retrieves the closest stored memories via FAISS.
         """
-        if self.current_idx == 0:
-            return []
+        return self.retrieve_many([query], top_k, session_id, entity_type)[0]
 
-        # Deterministic query embedding from xerv-crayon tokens
-        query_vector = self.tokenizer.embed(query, dim=self.embedding_dim)
-        query_vector = query_vector.reshape(1, -1)
+    def retrieve_many(self, queries: List[str], top_k: int = 3, session_id: Optional[str] = None,
+                      entity_type: Optional[str] = None) -> List[List[str]]:
+        """
+        Embeds all queries at once and answers them with a single batched FAISS search.
+        With session_id / entity_type only that partition is searched, and each
+        query gets top_k results from it (fewer only if the partition is smaller).
+        """
+        ids = self._partition_ids(session_id, entity_type)
+        size = self.current_idx if ids is None else len(ids)
+        if size == 0 or not queries:
+            return [[] for _ in queries]
 
-        effective_k = min(top_k, self.current_idx)
-        distances, indices = self.vector_index.search(query_vector, effective_k)
+        # Deterministic query embeddings from xerv-crayon tokens
+        query_vectors = self._embed_batch(queries)
 
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx >= 0 and idx in self.memory_map:
-                results.append(self.memory_map[idx]["text"])
+        effective_k = min(top_k, size)
+        if ids is None:
+            distances, indices = self.vector_index.search(query_vectors, effective_k)
+        else:
+            distances, indices = self.vector_index.search(query_vectors, effective_k, ids=ids)
 
+        results = []
+        for row in indices:
+            results.append([self.memory_map[idx]["text"] for idx in row if idx >= 0 and idx in self.memory_map])
         return results
 
     def count_total_tokens(self) -> int:
         """Returns total tokens stored across all memories."""
+        total_tokens = getattr(self.memory_map, "total_tokens", None)
+        if total_tokens is not None:
+            return total_tokens()
         return sum(entry["tokens"] for entry in self.memory_map.values())
 
+    def save(self, path: str):
+        """
+        Persists the FAISS index and memory metadata under the directory `path`.
+        Saving again to the same path appends only the memories stored since.
+        """
+        manifest = append_metadata(path, self.memory_map, self.current_idx, self._store_id)
+        manifest["index"] = self.vector_index.write(path, manifest["generation"])
+        manifest["embedding_dim"] = self.embedding_dim
+        commit_manifest(path, manifest)
+        self._store_id = manifest["store_id"]
+        print(f"[HCMS] Saved {manifest['count']} memories to {path}")
+
+    def load(self, path: str, mmap: bool = True) -> "HCMSManager":
+        """
+        Restores a store written by save() without re-embedding anything. With
+        mmap=True the index and text stay on disk and are paged in on demand, so
+        resident memory does not grow with the corpus.
+        """
+        manifest = read_manifest(path)
+        if manifest is None:
+            raise FileNotFoundError(f"No HCMS store at {path}")
+        if manifest["embedding_dim"] != self.embedding_dim:
+            raise ValueError(f"Store at {path} has dimension {manifest['embedding_dim']}, expected {self.embedding_dim}")
+
+        vector_index = AutoUpgradingIndex.read(path, manifest["index"], self.vector_index.policy, mmap)
+        if vector_index.ntotal != manifest["count"]:
+            raise ValueError(f"Store at {path} is inconsistent: {vector_index.ntotal} vectors, {manifest['count']} memories")
+
+        self.vector_index = vector_index
+        self.memory_map = PagedMemoryMap(path, manifest, mmap)
+        self._partitions = {"session": {}, "type": {}}
+        self.current_idx = manifest["count"]
+        self._store_id = manifest["store_id"]
+        print(f"[HCMS] Loaded {self.current_idx} memories from {path} ({'mmap' if mmap else 'in-memory'})")
+        return self
+
     def _store_in_graph(self, session_id: str, fact: str):
         """Writes a semantic node to Neo4j for relationship tracking."""
         # graph_db.execute("CREATE (n:Fact {session: $sid, content: $fact})", ...)
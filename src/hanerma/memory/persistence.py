@@ -0,0 +1,235 @@
+"""
+On-disk layout of a saved HCMS store.
+
+    <path>/manifest.json      row count, session/type dictionaries, index descriptor
+    <path>/index-N.faiss      FAISS index (AutoUpgradingIndex.write)
+    <path>/text.bin           UTF-8 text of every memory, back to back
+    <path>/text_end.u64       end offset of each row's text in text.bin
+    <path>/tokens.i32         token count per row
+    <path>/session.u32        session, as a code into manifest["sessions"]
+    <path>/type.u32           entity type, as a code into manifest["types"]
+
+Row i is memory id i. Column files are append-only: saving again to the same
+path writes only the rows added since the last save, then atomically replaces
+manifest.json. Bytes past the manifest's row count (a save that crashed midway)
+are ignored on load and truncated before the next append.
+"""
+
+import json
+import mmap as _mmap
+import os
+import uuid
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Mapping, Optional
+
+import numpy as np
+
+MANIFEST = "manifest.json"
+TEXT_FILE = "text.bin"
+COLUMNS = {
+    "text_end": ("text_end.u64", np.uint64),
+    "tokens": ("tokens.i32", np.int32),
+    "session": ("session.u32", np.uint32),
+    "type": ("type.u32", np.uint32),
+}
+FORMAT_VERSION = 1
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def commit_manifest(path: str, manifest: Dict[str, Any]):
+    """Atomically publishes a save, then drops index files it no longer references."""
+    tmp_path = os.path.join(path, MANIFEST + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(path, MANIFEST))
+
+    referenced = {manifest["index"]["base"], manifest["index"]["delta"]}
+    for name in os.listdir(path):
+        if name.endswith(".faiss") and name not in referenced:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass  # still mapped on platforms that forbid unlinking open files
+
+
+def append_metadata(path: str, memory_map: Mapping[int, Dict[str, Any]], count: int,
+                    store_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Writes rows [0, count) of memory_map to the column files and returns the new
+    manifest (not yet committed). Only rows past the previous save are written
+    when `path` already holds an earlier save of the same store.
+    """
+    os.makedirs(path, exist_ok=True)
+    previous = read_manifest(path)
+    if previous is not None and previous["store_id"] == store_id and previous["count"] <= count:
+        manifest = dict(previous)
+        start = previous["count"]
+        _truncate_columns(path, start, previous["text_bytes"])
+    else:
+        manifest = {
+            "format": FORMAT_VERSION,
+            "store_id": store_id or uuid.uuid4().hex,
+            "count": 0,
+            "text_bytes": 0,
+            "sessions": [],
+            "types": [],
+            "generation": previous["generation"] if previous else 0,
+        }
+        start = 0
+        # Fresh files (new inodes): an older save may still be mapped by a reader
+        for file_name in [TEXT_FILE] + [name for name, _ in COLUMNS.values()]:
+            tmp_path = os.path.join(path, file_name + ".tmp")
+            open(tmp_path, "wb").close()
+            os.replace(tmp_path, os.path.join(path, file_name))
+
+    session_codes = {session: code for code, session in enumerate(manifest["sessions"])}
+    type_codes = {entity_type: code for code, entity_type in enumerate(manifest["types"])}
+    sessions = list(manifest["sessions"])
+    types = list(manifest["types"])
+
+    def encode(value: str, codes: Dict[str, int], values: list) -> int:
+        if value not in codes:
+            codes[value] = len(values)
+            values.append(value)
+        return codes[value]
+
+    rows = [memory_map[i] for i in range(start, count)]
+    texts = [row["text"].encode("utf-8") for row in rows]
+    columns = {
+        "text_end": manifest["text_bytes"] + np.cumsum([len(text) for text in texts], dtype=np.uint64),
+        "tokens": np.array([row["tokens"] for row in rows], dtype=np.int32),
+        "session": np.array([encode(row["session"], session_codes, sessions) for row in rows], dtype=np.uint32),
+        "type": np.array([encode(row["type"], type_codes, types) for row in rows], dtype=np.uint32),
+    }
+
+    _append(os.path.join(path, TEXT_FILE), b"".join(texts))
+    for name, (file_name, dtype) in COLUMNS.items():
+        _append(os.path.join(path, file_name), columns[name].astype(dtype).tobytes())
+
+    manifest.update({
+        "count": count,
+        "text_bytes": manifest["text_bytes"] + sum(len(text) for text in texts),
+        "sessions": sessions,
+        "types": types,
+        "generation": manifest["generation"] + 1,
+    })
+    return manifest
+
+
+def _append(file_path: str, data: bytes):
+    with open(file_path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _truncate_columns(path: str, count: int, text_bytes: int):
+    os.truncate(os.path.join(path, TEXT_FILE), text_bytes)
+    for file_name, dtype in COLUMNS.values():
+        os.truncate(os.path.join(path, file_name), count * np.dtype(dtype).itemsize)
+
+
+class PagedMemoryMap(MutableMapping):
+    """
+    HCMSManager.memory_map backed by a saved store. Rows are materialized into
+    dicts only when accessed, and with mmap=True the text and columns are paged
+    in by the OS instead of being read onto the heap. Rows stored after the load
+    live in an in-memory overlay until the next save.
+    """
+
+    def __init__(self, path: str, manifest: Dict[str, Any], mmap: bool = True):
+        self.count = manifest["count"]
+        self.sessions = manifest["sessions"]
+        self.types = manifest["types"]
+        self.columns: Dict[str, np.ndarray] = {}
+        for name, (file_name, dtype) in COLUMNS.items():
+            file_path = os.path.join(path, file_name)
+            if not self.count:
+                self.columns[name] = np.zeros(0, dtype=dtype)
+            elif mmap:
+                self.columns[name] = np.memmap(file_path, dtype=dtype, mode="r", shape=(self.count,))
+            else:
+                self.columns[name] = np.fromfile(file_path, dtype=dtype, count=self.count)
+
+        text_bytes = manifest["text_bytes"]
+        if mmap and text_bytes:
+            with open(os.path.join(path, TEXT_FILE), "rb") as f:
+                self._text = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        else:
+            with open(os.path.join(path, TEXT_FILE), "rb") as f:
+                self._text = f.read(text_bytes)
+
+        self._overlay: Dict[int, Dict[str, Any]] = {}
+        self._deleted = set()
+        self._partitions: Dict[tuple, np.ndarray] = {}
+
+    def text(self, idx: int) -> str:
+        start = int(self.columns["text_end"][idx - 1]) if idx else 0
+        return self._text[start:int(self.columns["text_end"][idx])].decode("utf-8")
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        if idx in self._overlay:
+            return self._overlay[idx]
+        if not isinstance(idx, (int, np.integer)) or not 0 <= idx < self.count or idx in self._deleted:
+            raise KeyError(idx)
+        return {
+            "text": self.text(idx),
+            "tokens": int(self.columns["tokens"][idx]),
+            "session": self.sessions[self.columns["session"][idx]],
+            "type": self.types[self.columns["type"][idx]],
+        }
+
+    def __setitem__(self, idx: int, value: Dict[str, Any]):
+        self._overlay[idx] = value
+        self._deleted.discard(idx)
+
+    def __delitem__(self, idx: int):
+        if idx in self._overlay:
+            del self._overlay[idx]
+            if not 0 <= idx < self.count:
+                return
+        elif not 0 <= idx < self.count or idx in self._deleted:
+            raise KeyError(idx)
+        self._deleted.add(idx)
+
+    def __contains__(self, idx) -> bool:
+        return idx in self._overlay or (
+            isinstance(idx, (int, np.integer)) and 0 <= idx < self.count and idx not in self._deleted)
+
+    def __iter__(self) -> Iterator[int]:
+        for idx in range(self.count):
+            if idx in self._overlay or idx not in self._deleted:
+                yield idx
+        for idx in self._overlay:
+            if not 0 <= idx < self.count:
+                yield idx
+
+    def __len__(self) -> int:
+        extra = sum(1 for idx in self._overlay if not 0 <= idx < self.count)
+        return self.count - len(self._deleted) + extra
+
+    def ids_where(self, column: str, value: str) -> np.ndarray:
+        """Saved row ids whose session/type column equals `value`, one vectorized scan per value."""
+        key = (column, value)
+        if key not in self._partitions:
+            values = self.sessions if column == "session" else self.types
+            if value in values:
+                self._partitions[key] = np.flatnonzero(self.columns[column] == values.index(value)).astype(np.int64)
+            else:
+                self._partitions[key] = np.zeros(0, dtype=np.int64)
+        return self._partitions[key]
+
+    def total_tokens(self) -> int:
+        """Token total from the tokens column, without materializing rows."""
+        if not self._overlay and not self._deleted:
+            return int(self.columns["tokens"].sum(dtype=np.int64))
+        return sum(row["tokens"] for row in self.values())
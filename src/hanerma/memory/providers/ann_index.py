@@ -0,0 +1,393 @@
+"""
+Auto-upgrading FAISS index.
+
+A store starts on an exact flat index. Once it passes IndexPolicy.upgrade_threshold
+vectors it is rebuilt as a trained IVF-Flat or HNSW index on a background thread.
+Searches and adds keep hitting the old index until the new one has caught up, then
+the two are swapped under a short lock. IVF indexes are retrained the same way each
+time the store grows retrain_growth times past the size they were trained on, so
+the number of inverted lists keeps up with the data.
+
+Vector ids are positional (0..ntotal-1) and survive every rebuild, because vectors
+are copied into the new index in insertion order.
+
+search(ids=...) restricts a search to a subset of ids (a tenant's partition) and
+always returns min(k, len(ids)) hits: small subsets are scanned exactly, larger
+ones go through a FAISS IDSelector and fall back to the exact scan if the ANN
+probe came back short.
+
+An index read back with mmap=True keeps the file as a read-only base and takes
+new vectors in a small in-memory delta; searches merge the two. The delta is
+folded into a fresh index by the usual rebuild once it outgrows the flat budget.
+"""
+
+import logging
+import math
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger("hanerma.memory.ann")
+
+METRICS = {"L2": faiss.METRIC_L2, "IP": faiss.METRIC_INNER_PRODUCT}
+
+# IO_FLAG_MMAP still copies flat and HNSW storage onto the heap; the in-place
+# variant (faiss >= 1.8) searches the mapped file directly
+_MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+@dataclass
+class IndexPolicy:
+    """
+    When and how a store leaves brute-force search.
+
+    kind: "flat" (never upgrade), "ivf" (IVF-Flat) or "hnsw".
+    nprobe / ef_search trade recall for latency at query time and can be changed
+    on a live index with AutoUpgradingIndex.set_search_params(). Subclass and
+    override build_index() to plug in another FAISS index type.
+    """
+    kind: str = "ivf"
+    upgrade_threshold: int = 100_000
+    nlist: Optional[int] = None        # IVF lists; None = 4 * sqrt(n)
+    nprobe: int = 16
+    train_points_per_list: int = 64
+    retrain_growth: float = 8.0        # retrain IVF once ntotal grows this many times
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    background: bool = True
+    copy_chunk: int = 65536
+    filter_exact_max: int = 32768      # id-filtered searches this small are brute-forced exactly
+
+    def build_index(self, dimension: int, metric: int, num_vectors: int) -> faiss.Index:
+        """Returns an empty (possibly untrained) index sized for num_vectors."""
+        if self.kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dimension, self.hnsw_m, metric)
+            index.hnsw.efConstruction = self.ef_construction
+            return index
+        if self.kind == "ivf":
+            quantizer = faiss.IndexFlat(dimension, metric)
+            return faiss.IndexIVFFlat(quantizer, dimension, self.ivf_lists(num_vectors), metric)
+        return faiss.IndexFlat(dimension, metric)
+
+    def ivf_lists(self, num_vectors: int) -> int:
+        nlist = self.nlist or int(4 * math.sqrt(num_vectors))
+        # FAISS wants ~39 training points per centroid
+        return max(1, min(nlist, num_vectors // 39))
+
+    def training_size(self, index: faiss.Index) -> int:
+        return getattr(index, "nlist", 1) * self.train_points_per_list
+
+    def apply_search_params(self, index: faiss.Index):
+        if hasattr(index, "nprobe"):
+            index.nprobe = min(self.nprobe, index.nlist)
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = self.ef_search
+
+    def needs_rebuild(self, kind: str, ntotal: int, trained_on: int, delta: int = 0) -> bool:
+        if self.kind == "flat":
+            return False
+        if kind == "flat" or delta:
+            return max(ntotal if kind == "flat" else 0, delta) >= self.upgrade_threshold
+        return kind == "ivf" and ntotal >= trained_on * self.retrain_growth
+
+
+class AutoUpgradingIndex:
+    """
+    Drop-in for the FAISS add()/search()/ntotal surface used by the memory stores,
+    backed by whichever index the policy currently calls for.
+
+    FAISS indexes are not safe for concurrent add() and search(), so both take a
+    lock on the live index; training and bulk copying into a replacement index run
+    outside it.
+
+    _frozen is a read-only base (an mmapped file) holding ids [0, frozen.ntotal);
+    _index then holds the ids after it.
+    """
+
+    def __init__(self, dimension: int, metric: str = "L2", policy: Optional[IndexPolicy] = None):
+        self.d = dimension
+        self.metric_type = METRICS.get(metric, faiss.METRIC_L2)
+        self.policy = policy or IndexPolicy()
+
+        self._index: faiss.Index = faiss.IndexFlat(dimension, self.metric_type)
+        self._frozen: Optional[faiss.Index] = None
+        self._frozen_file: Optional[str] = None
+        self._lock = threading.Lock()
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self.kind = "flat"
+        self.trained_on = 0
+        self.rebuilds = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def ntotal(self) -> int:
+        return self._index.ntotal + (self._frozen.ntotal if self._frozen is not None else 0)
+
+    @property
+    def index(self) -> faiss.Index:
+        """The live FAISS index."""
+        return self._index
+
+    @property
+    def rebuilding(self) -> bool:
+        return self._rebuild_thread is not None and self._rebuild_thread.is_alive()
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.d)
+        with self._lock:
+            self._index.add(vectors)
+            ntotal = self.ntotal
+            delta = self._index.ntotal if self._frozen is not None else 0
+        if (self.last_error is None and not self.rebuilding
+                and self.policy.needs_rebuild(self.kind, ntotal, self.trained_on, delta)):
+            self.rebuild()
+
+    def search(self, vectors: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest neighbours, optionally only among `ids`."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.d)
+        if ids is not None:
+            return self._search_subset(vectors, k, np.asarray(ids, dtype=np.int64))
+        with self._lock:
+            distances, indices = self._index.search(vectors, k)
+            if self._frozen is None:
+                return distances, indices
+            base_distances, base_indices = self._frozen.search(vectors, k)
+            offset = self._frozen.ntotal
+        return self._merge(base_distances, base_indices, distances, np.where(indices >= 0, indices + offset, -1), k)
+
+    def _merge(self, distances_a, indices_a, distances_b, indices_b, k):
+        distances = np.hstack([distances_a, distances_b])
+        indices = np.hstack([indices_a, indices_b])
+        # Empty slots carry +/-FLT_MAX, so they sort last for either metric
+        keys = -distances if self.metric_type == faiss.METRIC_INNER_PRODUCT else distances
+        order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def _search_subset(self, vectors: np.ndarray, k: int, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(ids))
+        if k == 0:
+            return np.zeros((len(vectors), 0), dtype=np.float32), np.zeros((len(vectors), 0), dtype=np.int64)
+        if len(ids) > self.policy.filter_exact_max:
+            with self._lock:
+                if self._frozen is None:
+                    distances, indices = self._filtered_search(self._index, vectors, k, ids)
+                else:
+                    split = self._frozen.ntotal
+                    base_distances, base_indices = self._filtered_search(self._frozen, vectors, k, ids[ids < split])
+                    distances, indices = self._filtered_search(self._index, vectors, k, ids[ids >= split] - split)
+                    distances, indices = self._merge(
+                        base_distances, base_indices, distances, np.where(indices >= 0, indices + split, -1), k)
+            if (indices >= 0).all():
+                return distances, indices
+
+        # Exact scan over just the subset's vectors
+        with self._lock:
+            subset = self._reconstruct_batch(ids)
+        distances, positions = faiss.knn(vectors, subset, k, metric=self.metric_type)
+        return distances, ids[positions]
+
+    @staticmethod
+    def _filtered_search(index: faiss.Index, vectors: np.ndarray, k: int, ids: np.ndarray):
+        # The selector must outlive the search: SearchParameters does not own it
+        selector = faiss.IDSelectorBatch(ids)
+        if hasattr(index, "nprobe"):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+        elif hasattr(index, "hnsw"):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(index.hnsw.efSearch, k))
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        return index.search(vectors, k, params=params)
+
+    def reconstruct_n(self, start: int, count: int) -> np.ndarray:
+        with self._lock:
+            return self._reconstruct(start, count)
+
+    def _reconstruct(self, start: int, count: int) -> np.ndarray:
+        """Vectors [start, start + count) across base and delta; caller holds the lock."""
+        if self._frozen is None:
+            return self._index.reconstruct_n(start, count)
+        split = self._frozen.ntotal
+        parts = []
+        if start < split:
+            parts.append(self._frozen.reconstruct_n(start, min(count, split - start)))
+        if start + count > split:
+            live_start = max(start, split) - split
+            parts.append(self._index.reconstruct_n(live_start, start + count - split - live_start))
+        return np.vstack(parts)
+
+    def _reconstruct_batch(self, ids: np.ndarray) -> np.ndarray:
+        if self._frozen is None:
+            return self._index.reconstruct_batch(ids)
+        split = self._frozen.ntotal
+        vectors = np.empty((len(ids), self.d), dtype=np.float32)
+        base = ids < split
+        if base.any():
+            vectors[base] = self._frozen.reconstruct_batch(ids[base])
+        if (~base).any():
+            vectors[~base] = self._index.reconstruct_batch(ids[~base] - split)
+        return vectors
+
+    def reset(self):
+        self.wait_for_rebuild()
+        with self._lock:
+            self._index = faiss.IndexFlat(self.d, self.metric_type)
+            self._frozen = None
+            self._frozen_file = None
+            self.kind = "flat"
+            self.trained_on = 0
+            self.last_error = None
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Retunes the recall/latency trade-off of the live (and any future) index."""
+        if nprobe is not None:
+            self.policy.nprobe = nprobe
+        if ef_search is not None:
+            self.policy.ef_search = ef_search
+        with self._lock:
+            self.policy.apply_search_params(self._index)
+
+    # ── Rebuilds ──
+
+    def rebuild(self, wait: bool = False):
+        """Rebuilds the index for the current size, in the background unless the policy says otherwise."""
+        if self.rebuilding:
+            if wait:
+                self.wait_for_rebuild()
+            return
+        self.last_error = None
+        if not self.policy.background:
+            self._rebuild()
+            return
+        self._rebuild_thread = threading.Thread(target=self._rebuild, name="hanerma-ann-rebuild", daemon=True)
+        self._rebuild_thread.start()
+        if wait:
+            self.wait_for_rebuild()
+
+    def wait_for_rebuild(self, timeout: Optional[float] = None):
+        thread = self._rebuild_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _rebuild(self):
+        try:
+            with self._lock:
+                snapshot = self.ntotal
+            target = self.policy.build_index(self.d, self.metric_type, snapshot)
+            if hasattr(target, "make_direct_map"):
+                # Keeps IVF vectors reconstructable for the next retrain
+                target.make_direct_map()
+            if not target.is_trained:
+                target.train(self._training_sample(snapshot, self.policy.training_size(target)))
+
+            copied = 0
+            while True:
+                with self._lock:
+                    remaining = self.ntotal - copied
+                    if remaining <= self.policy.copy_chunk:
+                        # Final catch-up and swap; adds are blocked only for this last chunk
+                        if remaining:
+                            target.add(self._reconstruct(copied, remaining))
+                        self.policy.apply_search_params(target)
+                        self._index = target
+                        self._frozen = None
+                        self._frozen_file = None
+                        self.kind = self.policy.kind
+                        self.trained_on = snapshot
+                        self.rebuilds += 1
+                        break
+                    block = self._reconstruct(copied, self.policy.copy_chunk)
+                target.add(block)
+                copied += len(block)
+            logger.info(f"[ANN] Rebuilt index as {self.kind} over {target.ntotal} vectors")
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"[ANN] Index rebuild failed, staying on {self.kind}: {e}")
+
+    def _training_sample(self, snapshot: int, size: int) -> np.ndarray:
+        """Evenly strided sample over the whole store, not just its oldest vectors."""
+        ids = np.unique(np.linspace(0, snapshot - 1, min(size, snapshot)).astype(np.int64))
+        with self._lock:
+            return self._reconstruct_batch(ids)
+
+    def stats(self) -> Dict[str, Any]:
+        searched = self._frozen if self._frozen is not None else self._index
+        return {
+            "kind": self.kind,
+            "ntotal": self.ntotal,
+            "trained_on": self.trained_on,
+            "rebuilds": self.rebuilds,
+            "rebuilding": self.rebuilding,
+            "mmapped_base": self._frozen.ntotal if self._frozen is not None else 0,
+            "nprobe": getattr(searched, "nprobe", None),
+            "ef_search": searched.hnsw.efSearch if hasattr(searched, "hnsw") else None,
+            "last_error": self.last_error,
+        }
+
+    # ── Persistence ──
+
+    def write(self, directory: str, generation: int) -> Dict[str, Any]:
+        """
+        Writes the index under `directory` and returns a descriptor for read().
+        A base still mapped from this directory is referenced, not rewritten;
+        only the delta since it is written.
+        """
+        with self._lock:
+            base_file = delta_file = None
+            if self._frozen is not None:
+                base_file = os.path.basename(self._frozen_file)
+                if os.path.dirname(os.path.abspath(self._frozen_file)) != os.path.abspath(directory):
+                    base_file = f"index-{generation:06d}.faiss"
+                    shutil.copyfile(self._frozen_file, os.path.join(directory, base_file))
+                if self._index.ntotal:
+                    delta_file = f"delta-{generation:06d}.faiss"
+                    _write_index(self._index, os.path.join(directory, delta_file))
+            else:
+                base_file = f"index-{generation:06d}.faiss"
+                _write_index(self._index, os.path.join(directory, base_file))
+            return {
+                "kind": self.kind,
+                "metric": "IP" if self.metric_type == faiss.METRIC_INNER_PRODUCT else "L2",
+                "dimension": self.d,
+                "trained_on": self.trained_on,
+                "ntotal": self.ntotal,
+                "base": base_file,
+                "delta": delta_file,
+            }
+
+    @classmethod
+    def read(cls, directory: str, descriptor: Dict[str, Any], policy: Optional[IndexPolicy] = None,
+             mmap: bool = True) -> "AutoUpgradingIndex":
+        """
+        Loads an index written by write(). With mmap=True the base stays on disk
+        (page cache, not heap) and is never modified.
+        """
+        index = cls(descriptor["dimension"], descriptor["metric"], policy)
+        base_path = os.path.join(directory, descriptor["base"])
+        base = faiss.read_index(base_path, _MMAP_FLAG | faiss.IO_FLAG_READ_ONLY if mmap else 0)
+        index.policy.apply_search_params(base)
+        delta = faiss.read_index(os.path.join(directory, descriptor["delta"])) if descriptor["delta"] else None
+
+        if mmap:
+            index._frozen = base
+            index._frozen_file = base_path
+            if delta is not None:
+                index._index = delta
+        else:
+            index._index = base
+            if delta is not None and delta.ntotal:
+                base.add(delta.reconstruct_n(0, delta.ntotal))
+        index.kind = descriptor["kind"]
+        index.trained_on = descriptor["trained_on"]
+        return index
+
+
+def _write_index(index: faiss.Index, path: str):
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
@@ -4,6 +4,7 @@ import numpy as np
 
 try:
     import faiss
+    from .ann_index import AutoUpgradingIndex, IndexPolicy
     FAISS_AVAILABLE = True
 except ImportError:
     FAISS_AVAILABLE = False
@@ -15,20 +16,16 @@ class FaissVectorProvider:
     """
     Actual FAISS Vector Provider.
     Manages similarity search across memory embeddings without mocking.
+    Starts as an exact flat index and upgrades itself per index_policy.
     """
-    def __init__(self, dimension: int = 128, index_type: str = "L2"):
+    def __init__(self, dimension: int = 128, index_type: str = "L2", index_policy: Optional["IndexPolicy"] = None):
         self.dimension = dimension
         self.index_type = index_type
         self.metadata: Dict[int, Dict[str, Any]] = {}
         self._current_id = 0
 
         if FAISS_AVAILABLE:
-            if index_type == "L2":
-                self.index = faiss.IndexFlatL2(dimension)
-            elif index_type == "IP":
-                self.index = faiss.IndexFlatIP(dimension)
-            else:
-                self.index = faiss.IndexFlatL2(dimension)
+            self.index = AutoUpgradingIndex(dimension, index_type, index_policy)
         else:
             self.index = None
 
@@ -94,5 +91,6 @@ class FaissVectorProvider:
         return {
             "dimension": self.dimension,
             "total_vectors": self.index.ntotal if self.index else 0,
-            "index_type": self.index_type
+            "index_type": self.index_type,
+            "ann": self.index.stats() if self.index else None
         }
@@ -1,7 +1,8 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import time
 import faiss
 from sentence_transformers import SentenceTransformer
+from hanerma.memory.embedding_cache import DEFAULT_EMBEDDING_CACHE, EmbeddingCache
 from hanerma.state.transactional_bus import TransactionalEventBus
 
 class MemoryTieringManager:
@@ -11,7 +12,9 @@ class MemoryTieringManager:
     - Warm Tier: Summarized history / Recent events (Vector/Cache)
     - Cold Tier: Archived archives / Long-term storage (Database/HCMS)
     """
-    def __init__(self, hot_threshold: int = 4000):
+    EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+    def __init__(self, hot_threshold: int = 4000, embedding_cache: Optional[EmbeddingCache] = None):
         self.hot_threshold = hot_threshold
         self.hot_memory = []
         self.warm_memory = [] # Summarized versions
@@ -19,7 +22,9 @@ class MemoryTieringManager:
         
         # Cold tier components
         self.bus = TransactionalEventBus()
-        self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
+        self.encoder = SentenceTransformer(self.EMBEDDING_MODEL)
+        # Shared with XervCrayonAdapter: text already embedded there is not re-encoded
+        self.embedding_cache = embedding_cache or DEFAULT_EMBEDDING_CACHE
         self.index = faiss.IndexFlatL2(384)  # 384-dimensional vectors
         self.vector_id = 0
         self.raw_texts = {}  # id to raw text mapping
@@ -62,7 +67,7 @@ class MemoryTieringManager:
         raw_text = "\n".join(str(item["event"]) for item in items)
         
         # Encode text to vector (byte-transfer)
-        vector = self.encoder.encode(raw_text)
+        vector = self.embedding_cache.encode(self.encoder, self.EMBEDDING_MODEL, [raw_text])[0]
         
         # Add to FAISS index
         self.index.add(vector.reshape(1, -1))
@@ -21,7 +21,7 @@ import sqlite3
 import time
 import threading
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set
 
 from hanerma.core.config import settings
 
@@ -108,6 +108,8 @@ controller = ExecutionController()
 class ExecutionRequest(BaseModel):
     prompt: str
     target_agent: str = ""
+    # Optional graph source: executed with per-node node_success events
+    source: str = ""
 
 class AgentInitRequest(BaseModel):
     name: str
@@ -144,6 +146,18 @@ designer_edges: List[Dict[str, Any]] = []
 telemetry_log: List[Dict[str, Any]] = []
 active_agents: Dict[str, Dict[str, Any]] = {}
 ws_clients: List[WebSocket] = []
+_graph_tasks: Set[asyncio.Task] = set()
+_orchestrator = None
+
+
+def get_orchestrator():
+    """Process-wide orchestrator that runs /execute graphs (created on first use)."""
+    global _orchestrator
+    if _orchestrator is None:
+        # Imported lazily: the engine pulls in the whole framework
+        from hanerma.orchestrator.engine import HANERMAOrchestrator
+        _orchestrator = HANERMAOrchestrator()
+    return _orchestrator
 
 
 # ── Dashboard HTML with React Flow-style Designer ──
@@ -709,7 +723,7 @@ async def edit_state(req: StateEditRequest):
 
 @app.post("/execute")
 async def execute_task(req: ExecutionRequest):
-    """Execute a prompt (non-blocking)."""
+    """Execute a prompt (non-blocking). A graph source streams one node_success event per node."""
     trace_id = str(uuid.uuid4())
     await _broadcast({
         "event_type": "execution_start",
@@ -719,6 +733,10 @@ async def execute_task(req: ExecutionRequest):
             "timestamp": time.time(),
         },
     })
+    if req.source:
+        task = asyncio.create_task(_run_graph(trace_id, req.source))
+        _graph_tasks.add(task)
+        task.add_done_callback(_graph_tasks.discard)
     return {"status": "initiated", "trace_id": trace_id}
 
 
@@ -782,6 +800,37 @@ async def _broadcast(event: Dict[str, Any]):
         ws_clients.remove(ws)
 
 
+async def broadcast_graph_stream(trace_id: str, stream) -> Dict[str, Any]:
+    """
+    Relay HANERMAOrchestrator.execute_graph_stream to every dashboard client,
+    one node_success event per node as soon as it completes.
+    """
+    results = {}
+    async for node_id, result, timing in stream:
+        results[node_id] = result
+        await _broadcast({
+            "event_type": "node_success",
+            "payload": {
+                "trace_id": trace_id,
+                "node_id": node_id,
+                "result": str(result)[:200],
+                **timing,
+            },
+        })
+    return results
+
+
+async def _run_graph(trace_id: str, source: str):
+    """Background half of /execute: relays the graph, then reports completion or failure."""
+    try:
+        results = await broadcast_graph_stream(trace_id, get_orchestrator().execute_graph_stream(source))
+    except Exception as e:
+        logger.error(f"Graph {trace_id} failed: {e}")
+        await _broadcast({"event_type": "execution_failed", "payload": {"trace_id": trace_id, "error": str(e)}})
+    else:
+        await _broadcast({"event_type": "execution_complete", "payload": {"trace_id": trace_id, "nodes": len(results)}})
+
+
 # ═══════════════════════════════════════════════════════════════════════════
 #  Entry point
 # ═══════════════════════════════════════════════════════════════════════════
@@ -9,6 +9,7 @@ from .state_manager import MultitenantStateManager
 from .message_bus import DistributedEventBus
 from .recursive_bound import RecursiveBound
 from .consensus import ClusterManager, ConsensusGateway, ReplicatedStateStore
+from .result_cache import NodeResultCache, InMemoryResultCache, SQLiteResultCache, CapacitorResultCache
 
 __all__ = [
     "HANERMAOrchestrator",
@@ -19,4 +20,8 @@ __all__ = [
     "ClusterManager",
     "ConsensusGateway",
     "ReplicatedStateStore",
+    "NodeResultCache",
+    "InMemoryResultCache",
+    "SQLiteResultCache",
+    "CapacitorResultCache",
 ]
@@ -23,13 +23,16 @@ Usage:
     # Gateway (wraps LSM writes in Raft consensus)
     gw = ConsensusGateway(mgr, state_capacitor)
     gw.put("user:42", {"name": "Alice"})   # replicated before ACK
+    gw.compare_and_set("counter", 1, 2)     # atomic read-modify-write
 """
 
 import json
 import time
 import logging
+import random
 import threading
-from typing import Any, Dict, List, Optional
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
 
 from pysyncobj import SyncObj, SyncObjConf, SyncObjConsumer, replicated
 
@@ -48,12 +51,26 @@ class ReplicatedStateStore(SyncObjConsumer):
     Every @replicated method is executed on ALL nodes in the cluster
     once committed to the majority.  This guarantees linearizable
     consistency for state mutations.
+
+    Values are kept as the JSON strings that were replicated.  The op log
+    is a ring buffer of the last op_log_size operations; totals are kept
+    in aggregate counters.
     """
 
-    def __init__(self):
+    def __init__(self, op_log_size: int = 1024):
         super().__init__()
-        self._store: Dict[str, bytes] = {}
-        self._op_log: List[Dict[str, Any]] = []
+        self._store: Dict[str, str] = {}
+        self._op_log: deque = deque(maxlen=op_log_size)
+        self._op_counts: Dict[str, int] = {
+            "put": 0, "delete": 0, "batch_put": 0, "cas": 0, "cas_failed": 0,
+        }
+        self._keys_written = 0
+
+    def _record(self, op: str, **fields) -> None:
+        self._op_counts[op] += 1
+        fields["op"] = op
+        fields["ts"] = time.time()
+        self._op_log.append(fields)
 
     @replicated
     def replicated_put(self, key: str, value_json: str) -> bool:
@@ -61,23 +78,16 @@ class ReplicatedStateStore(SyncObjConsumer):
         Write a key-value pair.  Executed on ALL nodes after Raft commit.
         value_json is a JSON string (we avoid pickling across the wire).
         """
-        self._store[key] = value_json.encode("utf-8")
-        self._op_log.append({
-            "op": "put",
-            "key": key,
-            "ts": time.time(),
-        })
+        self._store[key] = value_json
+        self._keys_written += 1
+        self._record("put", key=key)
         return True
 
     @replicated
     def replicated_delete(self, key: str) -> bool:
         """Delete a key.  Executed on ALL nodes after Raft commit."""
         removed = self._store.pop(key, None)
-        self._op_log.append({
-            "op": "delete",
-            "key": key,
-            "ts": time.time(),
-        })
+        self._record("delete", key=key)
         return removed is not None
 
     @replicated
@@ -87,26 +97,38 @@ class ReplicatedStateStore(SyncObjConsumer):
         entries_json is a JSON-encoded list of {"key": ..., "value": ...}
         """
         entries = json.loads(entries_json)
-        count = 0
-        ts = time.time()
         for entry in entries:
-            self._store[entry["key"]] = entry["value"].encode("utf-8")
-            count += 1
-        self._op_log.append({
-            "op": "batch_put",
-            "count": count,
-            "ts": ts,
-        })
-        return count
+            self._store[entry["key"]] = entry["value"]
+        self._keys_written += len(entries)
+        self._record("batch_put", count=len(entries))
+        return len(entries)
+
+    @replicated
+    def replicated_compare_and_set(self, key: str, expected_json: Optional[str], value_json: str) -> bool:
+        """
+        Set key to value_json only if its current value equals expected_json
+        (compared as decoded JSON; None means the key must be absent, while
+        "null" matches a key holding JSON null).
+        The check runs inside the state machine, so it is atomic cluster-wide.
+        """
+        current = self._store.get(key)
+        if expected_json is None:
+            matches = current is None
+        else:
+            matches = current is not None and json.loads(current) == json.loads(expected_json)
+        if not matches:
+            self._record("cas_failed", key=key)
+            return False
+        self._store[key] = value_json
+        self._keys_written += 1
+        self._record("cas", key=key)
+        return True
 
     # ── Local reads (no Raft round-trip needed) ──
 
     def get(self, key: str) -> Optional[str]:
         """Read from local replica.  Raft guarantees eventual consistency."""
-        raw = self._store.get(key)
-        if raw is None:
-            return None
-        return raw.decode("utf-8")
+        return self._store.get(key)
 
     def contains(self, key: str) -> bool:
         return key in self._store
@@ -115,7 +137,15 @@ class ReplicatedStateStore(SyncObjConsumer):
         return list(self._store.keys())
 
     def op_count(self) -> int:
-        return len(self._op_log)
+        """Total operations applied (not just those still in the ring buffer)."""
+        return sum(self._op_counts.values())
+
+    def op_stats(self) -> Dict[str, int]:
+        return dict(self._op_counts, keys_written=self._keys_written)
+
+    def recent_ops(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        ops = list(self._op_log)
+        return ops[-limit:] if limit else ops
 
     def store_len(self) -> int:
         return len(self._store)
@@ -284,6 +314,12 @@ class ConsensusGateway:
             → Return 'Success'
 
     Reads bypass Raft entirely (local LSM lookup).
+
+    Concurrent put() calls are coalesced: the first caller waits
+    coalesce_window seconds, then commits every put queued meanwhile as one
+    replicated_batch_put (at most max_batch_size entries per command) and
+    wakes the other callers (group commit).
+    Set coalesce_window=0 to issue one Raft command per put.
     """
 
     def __init__(
@@ -291,17 +327,26 @@ class ConsensusGateway:
         cluster: ClusterManager,
         state_capacitor: Any = None,
         commit_timeout: float = 5.0,
+        coalesce_window: float = 0.002,
+        max_batch_size: int = 512,
     ):
         self._cluster = cluster
         self._capacitor = state_capacitor
         self._commit_timeout = commit_timeout
+        self._coalesce_window = coalesce_window
+        self._max_batch_size = max_batch_size
+
+        self._pending_lock = threading.Lock()
+        self._pending: List["_PendingPut"] = []
+        self._flushing = False
 
     def put(self, key: str, value: Any) -> bool:
         """
         Write-through with Raft consensus.
 
         1. Serialize value to JSON
-        2. Propose to Raft cluster (blocks until majority commit)
+        2. Propose to Raft cluster (blocks until majority commit),
+           coalesced with concurrent puts
         3. Write to local Rust LSM StateCapacitor
         4. Return True on success
 
@@ -311,18 +356,73 @@ class ConsensusGateway:
         # 1. Serialize
         value_json = json.dumps(value)
 
-        # 2. Raft replicated write (blocks until committed to majority)
-        try:
-            result = self._cluster.store.replicated_put(
-                key, value_json,
-                timeout=self._commit_timeout,
-            )
-        except Exception as e:
+        if self._coalesce_window <= 0:
+            # 2. Raft replicated write (blocks until committed to majority)
+            try:
+                self._cluster.store.replicated_put(
+                    key, value_json,
+                    sync=True, timeout=self._commit_timeout,
+                )
+            except Exception as e:
+                raise RuntimeError(
+                    f"Raft consensus failed for key='{key}': {e}"
+                ) from e
+            self._write_capacitor(key, value)
+            return True
+
+        pending = _PendingPut(key, value, value_json)
+        with self._pending_lock:
+            self._pending.append(pending)
+            lead = not self._flushing
+            if lead:
+                self._flushing = True
+
+        if lead:
+            self._flush_pending()
+        pending.done.wait()
+        if pending.error is not None:
             raise RuntimeError(
-                f"Raft consensus failed for key='{key}': {e}"
-            ) from e
+                f"Raft consensus failed for key='{key}': {pending.error}"
+            ) from pending.error
+        return True
 
-        # 3. Also persist to local Rust LSM for fast reads
+    def _flush_pending(self) -> None:
+        """
+        Commit everything queued during the coalescing window as one batch.
+        The next put opens a new window right away, so batches are pipelined
+        rather than waiting for each other's commit.
+        """
+        time.sleep(self._coalesce_window)
+        with self._pending_lock:
+            batch = self._pending
+            self._pending = []
+            self._flushing = False
+
+        for start in range(0, len(batch), self._max_batch_size):
+            chunk = batch[start:start + self._max_batch_size]
+            # Last write per key wins, as it would with sequential puts
+            latest: Dict[str, _PendingPut] = {}
+            for pending in chunk:
+                latest.pop(pending.key, None)
+                latest[pending.key] = pending
+
+            error: Optional[Exception] = None
+            try:
+                self._cluster.store.replicated_batch_put(
+                    json.dumps([{"key": p.key, "value": p.value_json} for p in latest.values()]),
+                    sync=True, timeout=self._commit_timeout,
+                )
+            except Exception as e:
+                error = e
+            else:
+                for pending in latest.values():
+                    self._write_capacitor(pending.key, pending.value)
+
+            for pending in chunk:
+                pending.error = error
+                pending.done.set()
+
+    def _write_capacitor(self, key: str, value: Any) -> None:
         if self._capacitor is not None:
             try:
                 self._capacitor.put_state(key, value)
@@ -334,7 +434,53 @@ class ConsensusGateway:
                 # Raft already committed — LSM will catch up on restart
                 # via Raft log replay.  Don't fail the caller.
 
-        return True
+    def compare_and_set(self, key: str, expected: Any, value: Any,
+                        expect_absent: Optional[bool] = None) -> bool:
+        """
+        Atomically replace key's value if it currently equals `expected`.
+        One Raft round trip.
+
+        expect_absent=True requires the key not to exist. By default
+        expected=None means the same; pass expect_absent=False to match a
+        key that holds None (JSON null) instead.
+
+        Returns:
+            True if the value was written, False if `expected` did not match.
+        """
+        if expect_absent is None:
+            expect_absent = expected is None
+        try:
+            swapped = self._cluster.store.replicated_compare_and_set(
+                key,
+                None if expect_absent else json.dumps(expected),
+                json.dumps(value),
+                sync=True, timeout=self._commit_timeout,
+            )
+        except Exception as e:
+            raise RuntimeError(
+                f"Raft compare-and-set failed for key='{key}': {e}"
+            ) from e
+        if swapped:
+            self._write_capacitor(key, value)
+        return bool(swapped)
+
+    def update(self, key: str, fn: Callable[[Any], Any], retries: int = 16) -> Any:
+        """
+        Read-modify-write: apply fn to the current value and compare-and-set the
+        result, retrying if another writer got there first.
+
+        Raises:
+            RuntimeError: If every attempt lost a race.
+        """
+        for attempt in range(retries):
+            raw = self._cluster.store.get(key)
+            current = json.loads(raw) if raw is not None else None
+            new_value = fn(current)
+            if self.compare_and_set(key, current, new_value, expect_absent=raw is None):
+                return new_value
+            # Jittered backoff so racing writers stop colliding in lockstep
+            time.sleep(random.uniform(0, 0.002 * (attempt + 1)))
+        raise RuntimeError(f"Compare-and-set on key='{key}' lost {retries} races")
 
     def get(self, key: str) -> Any:
         """
@@ -360,7 +506,7 @@ class ConsensusGateway:
         """Delete with Raft consensus."""
         try:
             self._cluster.store.replicated_delete(
-                key, timeout=self._commit_timeout,
+                key, sync=True, timeout=self._commit_timeout,
             )
         except Exception as e:
             raise RuntimeError(
@@ -389,7 +535,7 @@ class ConsensusGateway:
         try:
             self._cluster.store.replicated_batch_put(
                 json.dumps(serialized),
-                timeout=self._commit_timeout,
+                sync=True, timeout=self._commit_timeout,
             )
         except Exception as e:
             raise RuntimeError(f"Raft batch commit failed: {e}") from e
@@ -411,3 +557,14 @@ class ConsensusGateway:
     @property
     def cluster_status(self) -> Dict[str, Any]:
         return self._cluster.status()
+
+
+class _PendingPut:
+    __slots__ = ("key", "value", "value_json", "done", "error")
+
+    def __init__(self, key: str, value: Any, value_json: str):
+        self.key = key
+        self.value = value
+        self.value_json = value_json
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
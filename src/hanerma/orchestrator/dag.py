@@ -0,0 +1,119 @@
+"""
+Compiles orchestrator source code into a dependency DAG.
+
+Each Assign/Expr statement becomes a node; an edge runs from every statement
+that writes a name to every statement that reads it. Edges are built from a
+def-use index (name -> writer/reader nodes) instead of comparing every pair
+of nodes, and the index is kept on graph.graph so AST patches can move a
+single node's edges.
+
+DAGCache memoizes compiled templates per source (LRU keyed by source hash).
+"""
+
+import ast
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Set, Tuple
+
+import networkx as nx
+
+
+def collect_reads(node: ast.AST) -> Set[str]:
+    """Collect all variable names read in the AST subtree."""
+    names = set()
+    for subnode in ast.walk(node):
+        if isinstance(subnode, ast.Name):
+            names.add(subnode.id)
+    return names
+
+
+def statement_def_use(stmt: ast.AST) -> Tuple[Set[str], Set[str]]:
+    """Returns the (writes, reads) name sets of an Assign or Expr statement."""
+    writes: Set[str] = set()
+    reads: Set[str] = set()
+    if isinstance(stmt, ast.Assign):
+        for target in stmt.targets:
+            if isinstance(target, ast.Name):
+                writes.add(target.id)
+        reads = collect_reads(stmt.value)
+    elif isinstance(stmt, ast.Expr):
+        reads = collect_reads(stmt.value)
+    return writes, reads
+
+
+def compile_dag(source_code: str) -> nx.DiGraph:
+    """Parses source code into a DAG in roughly linear time."""
+    tree = ast.parse(source_code)
+    graph = nx.DiGraph()
+    writers: Dict[str, Set[str]] = {}
+    readers: Dict[str, Set[str]] = {}
+    node_id = 0
+
+    for stmt in ast.walk(tree):
+        if isinstance(stmt, (ast.Assign, ast.Expr)):
+            writes, reads = statement_def_use(stmt)
+            nid = f'node_{node_id}'
+            graph.add_node(nid, data={
+                'id': nid,
+                'writes': writes,
+                'reads': reads,
+                'ast_node': stmt
+            })
+            for name in writes:
+                writers.setdefault(name, set()).add(nid)
+            for name in reads:
+                readers.setdefault(name, set()).add(nid)
+            node_id += 1
+
+    # Add dependencies: every writer of a name precedes every reader of it
+    for name, name_readers in readers.items():
+        for writer in writers.get(name, ()):
+            for reader in name_readers:
+                if writer != reader:
+                    graph.add_edge(writer, reader)
+
+    graph.graph['writers'] = writers
+    graph.graph['readers'] = readers
+    return graph
+
+
+def clone_dag(template: nx.DiGraph) -> nx.DiGraph:
+    """Copies a compiled DAG template without re-parsing (AST nodes are shared, never mutated)."""
+    graph = nx.DiGraph()
+    for nid, attrs in template.nodes(data=True):
+        data = attrs['data']
+        graph.add_node(nid, data={**data, 'writes': set(data['writes']), 'reads': set(data['reads'])})
+    graph.add_edges_from(template.edges)
+    graph.graph['writers'] = {name: set(nodes) for name, nodes in template.graph['writers'].items()}
+    graph.graph['readers'] = {name: set(nodes) for name, nodes in template.graph['readers'].items()}
+    return graph
+
+
+class DAGCache:
+    """
+    LRU of compiled DAG templates keyed by the SHA-256 of the source.
+    get() always returns a private copy the caller is free to mutate.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = max(1, maxsize)
+        self._templates: "OrderedDict[str, nx.DiGraph]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, source_code: str) -> nx.DiGraph:
+        key = hashlib.sha256(source_code.encode()).hexdigest()
+        template = self._templates.get(key)
+        if template is None:
+            self.misses += 1
+            template = compile_dag(source_code)
+            self._templates[key] = template
+            if len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        else:
+            self.hits += 1
+            self._templates.move_to_end(key)
+        return clone_dag(template)
+
+    def __len__(self) -> int:
+        return len(self._templates)
@@ -0,0 +1,103 @@
+"""
+Ready-queue dataflow scheduler for orchestrator DAGs.
+
+Each node starts as soon as all of its predecessors have finished, with at
+most max_concurrency nodes in flight, and results are yielded in completion
+order. Successors are released only when the consumer asks for the next
+result, so anything it records about a finished node (e.g. its result digest)
+is visible to the nodes that read it.
+
+A failure handler may rewire the graph while the run is in progress (the
+engine's AST patching moves a node's def-use edges). After every handled
+failure the unfinished-predecessor counts of nodes not yet released are
+recomputed from the current graph, so a successor the patch no longer feeds
+is released and a newly fed one waits for all of its producers.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+import networkx as nx
+
+# (recovered, result) for a node whose execution raised
+FailureHandler = Callable[[str, BaseException], Awaitable[Tuple[bool, Any]]]
+
+
+async def run_dataflow(dag: nx.DiGraph,
+                       execute: Callable[[str], Awaitable[Any]],
+                       max_concurrency: int = 8,
+                       before_start: Optional[Callable[[str], Awaitable[bool]]] = None,
+                       on_failure: Optional[FailureHandler] = None,
+                       ) -> AsyncIterator[Tuple[str, Any, float, float]]:
+    """
+    Yields (node_id, result, started_at, finished_at) for each node of `dag`.
+
+    before_start(node_id) returning False skips the node. A node that is
+    skipped, or fails without on_failure recovering it, never finishes, so its
+    descendants are never released. Without on_failure, exceptions propagate.
+    Nodes removed from `dag` during the run are dropped.
+    """
+    pending = {n: dag.in_degree(n) for n in dag.nodes}
+    ready = deque(n for n, count in pending.items() if count == 0)
+    released: Set[str] = set(ready)
+    finished: Set[str] = set()
+    running: Dict[asyncio.Task, str] = {}
+    started_at: Dict[str, float] = {}
+    limit = max(1, max_concurrency)
+
+    def recount():
+        for n in dag.nodes:
+            if n not in released:
+                pending[n] = sum(1 for p in dag.predecessors(n) if p not in finished)
+
+    def release(candidates: Iterable[str]):
+        for n in candidates:
+            if n not in released and pending.get(n) == 0:
+                released.add(n)
+                ready.append(n)
+
+    try:
+        while ready or running:
+            # Launch every ready node up to the concurrency cap
+            while ready and len(running) < limit:
+                node_id = ready.popleft()
+                if node_id not in dag:
+                    continue
+                if before_start is not None and not await before_start(node_id):
+                    continue
+                started_at[node_id] = time.time()
+                running[asyncio.create_task(execute(node_id))] = node_id
+
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(set(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                node_id = running.pop(task)
+                exc = task.exception()
+                if exc is None:
+                    recovered, result = True, task.result()
+                elif on_failure is None:
+                    raise exc
+                else:
+                    recovered, result = await on_failure(node_id, exc)
+                    # The handler may have rewired the graph
+                    recount()
+                    release(list(dag.nodes))
+                if not recovered:
+                    continue
+
+                yield node_id, result, started_at[node_id], time.time()
+
+                finished.add(node_id)
+                if node_id in dag:
+                    successors = list(dag.successors(node_id))
+                    for succ in successors:
+                        if succ not in released:
+                            pending[succ] -= 1
+                    release(successors)
+    finally:
+        for task in running:
+            task.cancel()
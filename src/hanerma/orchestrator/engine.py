@@ -3,11 +3,15 @@ import asyncio
 import ast
 import time
 import uuid
-from typing import List, Dict, Any, Optional, Set
+from typing import List, Dict, Any, AsyncIterator, Optional, Set, Tuple
 from hanerma.agents.base_agent import BaseAgent
+from hanerma.core.config import settings
 from hanerma.reasoning.deep1_atomic import AtomicGuard
 
+from hanerma.orchestrator.dag import DAGCache, statement_def_use
+from hanerma.orchestrator.dataflow import run_dataflow
 from hanerma.orchestrator.message_bus import DistributedEventBus
+from hanerma.orchestrator.result_cache import NodeResultCache, node_cache_key, result_digest
 from hanerma.state.models import HANERMAState
 from hanerma.reliability.risk_engine import FailurePredictor
 from hanerma.reliability.symbolic_reasoner import SymbolicReasoner
@@ -25,7 +29,8 @@ class HANERMAOrchestrator:
     Apex Edition: Zero-friction, self-healing, and mathematically grounded.
     """
     def __init__(self, model: str = "auto", tokenizer=None, context_window: int = 128000, 
-                 node_id: str = None, raft_peers: List[str] = None):
+                 node_id: str = None, raft_peers: List[str] = None, max_concurrency: int = None,
+                 result_cache: Optional[NodeResultCache] = None, strict_validation: bool = False):
         self.orchestrator_id = str(uuid.uuid4())
         self.router = BestModelRouter()
         self.default_model = self.router.route_request("", 0) if model == "auto" else model
@@ -49,6 +54,14 @@ class HANERMAOrchestrator:
         self.interaction_count = 0
         self.trace_id = str(uuid.uuid4())
         self.current_dag: nx.DiGraph = nx.DiGraph()
+        # Global cap on in-flight DAG nodes for the dataflow scheduler
+        self.max_concurrency = max(1, max_concurrency or settings.ORCHESTRATOR_MAX_CONCURRENCY)
+        # LRU of compiled DAG templates keyed by source hash
+        self._dag_cache = DAGCache(settings.ORCHESTRATOR_DAG_CACHE_SIZE)
+        # Optional content-addressed memoization of agent node results
+        self.result_cache = result_cache
+        # Full state revalidation on every check (otherwise only dirty entries are validated)
+        self.strict_validation = strict_validation
         
         # Background style extraction
         self.style_task = asyncio.create_task(self._style_extraction_loop())
@@ -95,110 +108,81 @@ class HANERMAOrchestrator:
     async def execute_graph(self, source_code: str) -> Dict[str, Any]:
         """
         Executes a graph of agent/tool calls parsed from source_code with strict state validation and self-healing.
-        Uses DAG analysis for parallelism and enforces typed state transitions.
+        Collects every node result from execute_graph_stream.
+        """
+        results = {}
+        async for node_id, result, _timing in self.execute_graph_stream(source_code):
+            results[node_id] = result
+        return results
+
+    async def execute_graph_stream(self, source_code: str) -> AsyncIterator[Tuple[str, Any, Dict[str, float]]]:
+        """
+        Streams (node_id, result, timing) for each node of the graph as soon as it completes.
+        Uses the ready-queue dataflow scheduler (dataflow.run_dataflow): each node starts as
+        soon as all of its predecessors have finished, bounded by max_concurrency in-flight nodes.
         Implements true MVCC rollback on failures.
+
+        timing holds "started_at" / "finished_at" (epoch seconds), "latency_ms" for the node,
+        and "elapsed_ms" since the graph started.
         """
+        graph_start = time.time()
+
         # Build the full DAG
         self.current_dag = self._build_dag_from_source(source_code)
-        
-        results = {}
-        failed_nodes = set()
-        
-        # Execute in topological generations for parallel DAG execution
-        for generation in nx.topological_generations(self.current_dag):
-            tasks = []
-            valid_nodes = []
-            
-            for node_id in generation:
-                if node_id in failed_nodes:
-                    continue
+        dag = self.current_dag
+
+        stream = run_dataflow(
+            dag,
+            lambda node_id: self._execute_node_with_validation(dag.nodes[node_id]['data']),
+            self.max_concurrency,
+            before_start=self._before_node_start,
+            # Failure detected - implement MVCC rollback and AST patching
+            on_failure=self._handle_node_failure,
+        )
+        async for node_id, res, started_at, finished_at in stream:
+            # Validate state after execution
+            if not self._validate_state_post_execution():
+                raise ValueError(f"State validation failed after executing node {node_id}")
+
+            # Record successful step
+            self.bus.record_step(self.trace_id, self.step_index + 1, "node_success", {"node_id": node_id, "result": str(res)}, self.state_manager)
+            self.step_index += 1
+            # Successors are released once this loop asks for the next node, so they see the digest
+            if node_id in dag:
+                dag.nodes[node_id]['data']['result_digest'] = result_digest(res)
+
+            timing = {
+                "started_at": started_at,
+                "finished_at": finished_at,
+                "latency_ms": round((finished_at - started_at) * 1000, 2),
+                "elapsed_ms": round((finished_at - graph_start) * 1000, 2),
+            }
+            yield node_id, res, timing
 
-                node = self.current_dag.nodes[node_id]['data']
-                
-                # Validate state before execution
-                if not self._validate_state_pre_execution():
-                    # State is invalid, attempt rollback
-                    await self._rollback_to_last_valid_state(self.step_index)
-                    break
-                
-                # Record step start
-                self.bus.record_step(self.trace_id, self.step_index, "node_start", {"node_id": node_id}, self.state_manager)
-                
-                tasks.append(self._execute_node_with_validation(node))
-                valid_nodes.append(node_id)
-
-            if tasks:
-                results_list = await asyncio.gather(*tasks, return_exceptions=True)
-                for idx, res in enumerate(results_list):
-                    node_id = valid_nodes[idx]
-                    if isinstance(res, Exception):
-                        # Failure detected - implement MVCC rollback and AST patching
-                        await self._handle_node_failure(node_id, res, failed_nodes)
-                    else:
-                        results[node_id] = res
-
-                        # Validate state after execution
-                        if not self._validate_state_post_execution():
-                            raise ValueError(f"State validation failed after executing node {node_id}")
-
-                        # Record successful step
-                        self.bus.record_step(self.trace_id, self.step_index + 1, "node_success", {"node_id": node_id, "result": str(res)}, self.state_manager)
-
-                self.step_index += 1
-                
-        return results
+    async def _before_node_start(self, node_id: str) -> bool:
+        """Validates state before a node is launched; False skips the node and its descendants."""
+        if not self._validate_state_pre_execution():
+            # State is invalid, attempt rollback and skip this branch
+            await self._rollback_to_last_valid_state(self.step_index)
+            return False
 
-    def _build_dag_from_source(self, source_code: str) -> nx.DiGraph:
-        """Builds the full DAG from source code using the AST analyzer."""
-        tree = ast.parse(source_code)
-        graph = nx.DiGraph()
-        node_id = 0
-        
-        for stmt in ast.walk(tree):
-            if isinstance(stmt, (ast.Assign, ast.Expr)):
-                writes = set()
-                reads = set()
-                
-                if isinstance(stmt, ast.Assign):
-                    for target in stmt.targets:
-                        if isinstance(target, ast.Name):
-                            writes.add(target.id)
-                    reads = self._collect_reads(stmt.value)
-                else:
-                    reads = self._collect_reads(stmt.value)
-                
-                graph.add_node(f'node_{node_id}', data={
-                    'id': f'node_{node_id}',
-                    'writes': writes,
-                    'reads': reads,
-                    'ast_node': stmt
-                })
-                node_id += 1
-        
-        # Add dependencies
-        for node_a_id in graph.nodes:
-            for node_b_id in graph.nodes:
-                if node_a_id != node_b_id:
-                    writes_a = graph.nodes[node_a_id]['data']['writes']
-                    reads_b = graph.nodes[node_b_id]['data']['reads']
-                    if writes_a & reads_b:
-                        graph.add_edge(node_a_id, node_b_id)
-        
-        return graph
+        # Record step start
+        self.bus.record_step(self.trace_id, self.step_index, "node_start", {"node_id": node_id}, self.state_manager)
+        return True
 
-    def _collect_reads(self, node: ast.AST) -> set:
-        """Collect all variable names read in the AST subtree."""
-        names = set()
-        for subnode in ast.walk(node):
-            if isinstance(subnode, ast.Name):
-                names.add(subnode.id)
-        return names
+    def _build_dag_from_source(self, source_code: str) -> nx.DiGraph:
+        """
+        Builds the full DAG from source code.
+        Repeated scripts reuse a cached compiled template (LRU keyed by source hash);
+        callers always receive a private copy they are free to mutate.
+        """
+        return self._dag_cache.get(source_code)
 
     def _validate_state_pre_execution(self) -> bool:
         """Validates the current state before executing a node."""
         try:
-            # Pydantic validation
-            HANERMAState(**self.state_manager.dict())
+            # Pydantic validation of entries mutated since the last check
+            self.state_manager.revalidate(strict=self.strict_validation)
             return True
         except Exception:
             return False
@@ -209,7 +193,8 @@ class HANERMAOrchestrator:
 
     async def _rollback_to_last_valid_state(self, current_step: int):
         """Performs MVCC rollback to the last valid state and prunes descendants using NetworkX."""
-        last_valid_state = self.bus.get_last_valid_state(self.trace_id, current_step)
+        # Flushes pending steps and reads SQLite: keep it off the event loop
+        last_valid_state = await asyncio.to_thread(self.bus.get_last_valid_state, self.trace_id, current_step)
         if last_valid_state:
             self.state_manager = last_valid_state
 
@@ -227,10 +212,8 @@ class HANERMAOrchestrator:
         else:
             self.state_manager = HANERMAState()
 
-    async def _handle_node_failure(self, node_id: str, exception: Exception, failed_nodes: set):
-        """Handles node failure with MVCC rollback and AST patching."""
-        failed_nodes.add(node_id)
-        
+    async def _handle_node_failure(self, node_id: str, exception: Exception) -> Tuple[bool, Any]:
+        """Handles node failure with MVCC rollback and AST patching. Returns (recovered, result)."""
         # Get AST patch from EmpathyHandler
         patch = await self.empathy.generate_ast_patch(str(exception), self.current_dag.nodes[node_id]['data'])
         
@@ -240,14 +223,13 @@ class HANERMAOrchestrator:
             # Retry execution
             try:
                 node = self.current_dag.nodes[node_id]['data']
-                result = await self._execute_node_with_validation(node)
-                failed_nodes.remove(node_id)  # Success, remove from failed
-                return result
+                return True, await self._execute_node_with_validation(node)
             except Exception:
                 pass  # Patch failed
         
         # If patching fails, rollback
         await self._rollback_to_last_valid_state(self.step_index)
+        return False, None
 
     async def _execute_node_with_validation(self, node: Dict[str, Any]) -> Any:
         """Executes a node with state validation."""
@@ -266,36 +248,39 @@ class HANERMAOrchestrator:
     def _inject_ast_patch(self, node_id: str, patched_ast: ast.AST):
         """Injects a patched AST node into the live DAG."""
         if node_id in self.current_dag.nodes:
+            data = self.current_dag.nodes[node_id]['data']
             # Update the node's AST
-            self.current_dag.nodes[node_id]['data']['ast_node'] = patched_ast
+            data['ast_node'] = patched_ast
             
             # Recompute reads/writes if necessary
-            writes = set()
-            reads = set()
-            
-            if isinstance(patched_ast, ast.Assign):
-                for target in patched_ast.targets:
-                    if isinstance(target, ast.Name):
-                        writes.add(target.id)
-                reads = self._collect_reads(patched_ast.value)
-            elif isinstance(patched_ast, ast.Expr):
-                reads = self._collect_reads(patched_ast.value)
-            
-            self.current_dag.nodes[node_id]['data']['writes'] = writes
-            self.current_dag.nodes[node_id]['data']['reads'] = reads
+            writes, reads = statement_def_use(patched_ast)
+
+            # Move the node to its new entries in the def-use index
+            writers = self.current_dag.graph.setdefault('writers', {})
+            readers = self.current_dag.graph.setdefault('readers', {})
+            for name in data.get('writes', ()):
+                writers.get(name, set()).discard(node_id)
+            for name in data.get('reads', ()):
+                readers.get(name, set()).discard(node_id)
+            for name in writes:
+                writers.setdefault(name, set()).add(node_id)
+            for name in reads:
+                readers.setdefault(name, set()).add(node_id)
+
+            data['writes'] = writes
+            data['reads'] = reads
             
             # Recompute graph dependencies for the injected node
             edges_to_remove = list(self.current_dag.out_edges(node_id))
             self.current_dag.remove_edges_from(edges_to_remove)
 
-            for other_node in self.current_dag.nodes():
-                if other_node == node_id:
-                    continue
-                other_data = self.current_dag.nodes[other_node]['data']
-                if 'reads' in other_data and 'writes' in other_data:
-                    if writes.intersection(other_data['reads']):
+            for name in writes:
+                for other_node in readers.get(name, ()):
+                    if other_node != node_id and other_node in self.current_dag:
                         self.current_dag.add_edge(node_id, other_node)
-                    if reads.intersection(other_data['writes']):
+            for name in reads:
+                for other_node in writers.get(name, ()):
+                    if other_node != node_id and other_node in self.current_dag:
                         self.current_dag.add_edge(other_node, node_id)
 
     async def _execute_node(self, node: Dict[str, Any]) -> Any:
@@ -313,13 +298,39 @@ class HANERMAOrchestrator:
                         prompt = ""
                         if value.args and isinstance(value.args[0], ast.Str):
                             prompt = value.args[0].s
+                        cache_key = None
+                        if self.result_cache is not None:
+                            cache_key = self._node_cache_key(node, agent)
+                            cached = self.result_cache.get(cache_key)
+                            if cached is not None:
+                                return cached
                         result = await agent.execute(prompt, self.state_manager)
+                        if cache_key is not None and result is not None:
+                            self.result_cache.put(cache_key, result)
                         return result
             # For other node types or unmatched calls, return None
             return None
         except Exception as e:
             return f"Error executing node {node['id']}: {str(e)}"
 
+    def _node_cache_key(self, node: Dict[str, Any], agent: BaseAgent) -> str:
+        """
+        Content address of a node: normalized AST, agent/model, digests of the upstream
+        results it reads and, since agent.execute() receives state_manager, the state hash
+        (omitted for agents marked state_independent).
+        """
+        input_digests = []
+        if node['id'] in self.current_dag:
+            writers = self.current_dag.graph.get('writers', {})
+            preds = set(self.current_dag.predecessors(node['id']))
+            for name in sorted(node['reads']):
+                for writer in sorted(writers.get(name, set()) & preds):
+                    digest = self.current_dag.nodes[writer]['data'].get('result_digest', "")
+                    input_digests.append(f"{name}={digest}")
+        if not getattr(agent, "state_independent", False):
+            input_digests.append(f"state={self.state_manager.compute_hash()}")
+        return node_cache_key(node['ast_node'], agent.name, agent.model, input_digests)
+
     def get_raft_status(self) -> Dict[str, Any]:
         """Get current Raft consensus status."""
         return self.bus.get_raft_status()
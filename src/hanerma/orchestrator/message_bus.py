@@ -1,28 +1,189 @@
 import asyncio
 import json
+import struct
 import uuid
 import socket
 import logging
-from typing import Dict, Any, List, Set, Callable, Optional
+from typing import Dict, Any, List, Set, Callable, Optional, Tuple
 
 from hanerma.core.config import settings
+from hanerma.core.exceptions import BackpressureError
 
 logger = logging.getLogger(__name__)
 
+# Overflow policies for publish() when a topic queue is full
+OVERFLOW_BLOCK = "block"              # wait for space (backpressure on the publisher)
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # evict the oldest queued message
+OVERFLOW_REJECT = "reject"            # raise BackpressureError
+
+# Wire protocol: 4-byte big-endian length prefix followed by a UTF-8 JSON document
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+
+def write_frame(writer: asyncio.StreamWriter, message: Any) -> None:
+    """Queue one length-prefixed JSON frame on the stream (caller drains)."""
+    data = json.dumps(message, default=str).encode()
+    if len(data) > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {len(data)} bytes exceeds MAX_FRAME_SIZE")
+    writer.write(FRAME_HEADER.pack(len(data)) + data)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Any]:
+    """Read one length-prefixed JSON frame. Returns None on a clean EOF."""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds MAX_FRAME_SIZE")
+    return json.loads((await reader.readexactly(length)).decode())
+
+
+class PeerConnection:
+    """
+    Long-lived, multiplexed connection to one peer.
+    Every request carries a request_id; a reader task routes response frames
+    back to the awaiting caller, so many dispatches can be in flight at once.
+    A heartbeat task pings the peer and drops the connection when it stops
+    answering; the next request reconnects with exponential backoff.
+    """
+
+    def __init__(self, host: str, port: int, heartbeat_interval: float = 5.0,
+                 request_timeout: float = 30.0, connect_timeout: float = 5.0,
+                 max_retries: int = 5, base_backoff: float = 0.1, max_backoff: float = 5.0):
+        self.host = host
+        self.port = port
+        self.heartbeat_interval = heartbeat_interval
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    async def _ensure_connected(self):
+        if self.connected:
+            return
+        async with self._connect_lock:
+            if self.connected:
+                return
+            delay = self.base_backoff
+            for attempt in range(self.max_retries):
+                try:
+                    self._reader, self._writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), timeout=self.connect_timeout
+                    )
+                    break
+                except (OSError, asyncio.TimeoutError) as e:
+                    if attempt + 1 == self.max_retries:
+                        raise ConnectionError(f"Cannot reach peer {self.host}:{self.port}: {e}") from e
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_backoff)
+            self._reader_task = asyncio.create_task(self._read_loop())
+            if self.heartbeat_interval > 0:
+                self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def request(self, message: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """Send a request frame and wait for the matching response body."""
+        await self._ensure_connected()
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            async with self._write_lock:
+                if not self.connected:
+                    raise ConnectionError(f"Connection to {self.host}:{self.port} lost")
+                write_frame(self._writer, {**message, "request_id": request_id})
+                await self._writer.drain()
+            return await asyncio.wait_for(future, timeout or self.request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                frame = await read_frame(self._reader)
+                if frame is None:
+                    break
+                future = self._pending.get(frame.get("request_id"))
+                if future is not None and not future.done():
+                    future.set_result(frame.get("body"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Connection to {self.host}:{self.port} failed: {e}")
+        finally:
+            self._drop(ConnectionError(f"Connection to {self.host}:{self.port} lost"))
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.request({"type": "ping"}, timeout=self.heartbeat_interval)
+            except Exception:
+                logger.warning(f"Heartbeat to {self.host}:{self.port} timed out, dropping connection")
+                self._drop(ConnectionError(f"Heartbeat to {self.host}:{self.port} timed out"))
+                return
+
+    def _drop(self, exc: Exception):
+        """Close the socket and fail every in-flight request."""
+        writer, self._writer, self._reader = self._writer, None, None
+        if writer is not None:
+            writer.close()
+        current = asyncio.current_task()
+        for task in (self._reader_task, self._heartbeat_task):
+            if task is not None and task is not current:
+                task.cancel()
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    async def close(self):
+        self._drop(ConnectionError("Connection closed"))
+
 class DistributedEventBus:
     """
     High-performance async Pub/Sub message bus with exactly-once execution.
     Utilizes asyncio streams for robust networked message passing instead of UDP broadcasts.
     """
 
-    def __init__(self, node_id: str = None, host: str = None, port: int = None, peers: List[str] = None):
+    def __init__(self, node_id: str = None, host: str = None, port: int = None, peers: List[str] = None,
+                 pool_size: int = 2, heartbeat_interval: float = 5.0,
+                 queue_maxsize: int = 1000, workers_per_topic: int = 4, overflow_policy: str = OVERFLOW_BLOCK):
+        if overflow_policy not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_REJECT):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
         self.node_id = node_id or str(uuid.uuid4())
         self.host = host or settings.EVENT_BUS_HOST
         self.port = port or settings.EVENT_BUS_PORT
 
-        # Local Pub/Sub
+        # Local Pub/Sub: one bounded queue and a fixed pool of consumer workers per topic
         self._subscribers: Dict[str, Set[Callable]] = {}
         self._message_queues: Dict[str, asyncio.Queue] = {}
+        self._topic_workers: Dict[str, List[asyncio.Task]] = {}
+        self._topic_config: Dict[str, Dict[str, Any]] = {}
+        self._topic_stats: Dict[str, Dict[str, int]] = {}
+        self.queue_maxsize = queue_maxsize
+        self.workers_per_topic = max(1, workers_per_topic)
+        self.overflow_policy = overflow_policy
 
         # Networked Peers (TCP)
         self.peers: Dict[str, tuple] = {}
@@ -32,6 +193,12 @@ class DistributedEventBus:
                     h, p = peer.split(":")
                     self.peers[peer] = (h, int(p))
 
+        # Long-lived multiplexed connections per peer address
+        self.pool_size = max(1, pool_size)
+        self.heartbeat_interval = heartbeat_interval
+        self._pools: Dict[Tuple[str, int], List[PeerConnection]] = {}
+        self._client_handlers: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
         self.server = None
         self._server_task = None
 
@@ -43,89 +210,204 @@ class DistributedEventBus:
     async def stop(self):
         if self.server:
             self.server.close()
+            # Server.close() leaves accepted connections open; close them too
+            handlers = list(self._client_handlers.values())
+            for writer in list(self._client_handlers):
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
             await self.server.wait_closed()
         if self._server_task:
             self._server_task.cancel()
+        for workers in self._topic_workers.values():
+            for worker in workers:
+                worker.cancel()
+        self._topic_workers.clear()
+        for pool in self._pools.values():
+            for conn in pool:
+                await conn.close()
+        self._pools.clear()
+
+    def _get_connection(self, host: str, port: int) -> PeerConnection:
+        """Least-loaded connection from the peer's pool, creating the pool on first use."""
+        pool = self._pools.get((host, port))
+        if pool is None:
+            pool = [PeerConnection(host, port, heartbeat_interval=self.heartbeat_interval) for _ in range(self.pool_size)]
+            self._pools[(host, port)] = pool
+        return min(pool, key=lambda conn: (not conn.connected, conn.in_flight))
 
     async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-        """Handle incoming TCP streams from peers."""
+        """Serve framed requests from a peer until it disconnects; requests run concurrently."""
         peer_addr = writer.get_extra_info('peername')
+        write_lock = asyncio.Lock()
+        in_flight: Set[asyncio.Task] = set()
+        self._client_handlers[writer] = asyncio.current_task()
         try:
-            data = await reader.read(4096)
-            if not data:
-                return
-            message = json.loads(data.decode())
-
-            msg_type = message.get("type")
-            if msg_type == "discovery":
-                peer_id = message.get("node_id")
-                peer_port = message.get("port")
-                if peer_id and peer_id != self.node_id:
-                    self.peers[peer_id] = (peer_addr[0], peer_port)
-                    logger.info(f"Discovered peer {peer_id} at {peer_addr[0]}:{peer_port}")
-                writer.write(json.dumps({"status": "ack"}).encode())
-                await writer.drain()
-            elif msg_type == "tool_dispatch":
-                result = await self._execute_tool(message.get("tool"), message.get("args", {}))
-                writer.write(json.dumps(result).encode())
-                await writer.drain()
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+                task = asyncio.create_task(self._serve_request(message, peer_addr, writer, write_lock))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
         except Exception as e:
             logger.error(f"Error handling peer connection: {e}")
         finally:
+            for task in in_flight:
+                task.cancel()
+            self._client_handlers.pop(writer, None)
             writer.close()
-            await writer.wait_closed()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _serve_request(self, message: Dict[str, Any], peer_addr: tuple,
+                             writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        msg_type = message.get("type")
+        if msg_type == "ping":
+            body = {"type": "pong", "node_id": self.node_id}
+        elif msg_type == "discovery":
+            peer_id = message.get("node_id")
+            peer_port = message.get("port")
+            if peer_id and peer_id != self.node_id:
+                self.peers[peer_id] = (peer_addr[0], peer_port)
+                logger.info(f"Discovered peer {peer_id} at {peer_addr[0]}:{peer_port}")
+            body = {"status": "ack", "node_id": self.node_id}
+        elif msg_type == "tool_dispatch":
+            body = await self._execute_tool(message.get("tool"), message.get("args", {}))
+        else:
+            body = {"error": f"Unknown message type: {msg_type}"}
+
+        try:
+            async with write_lock:
+                write_frame(writer, {"request_id": message.get("request_id"), "body": body})
+                await writer.drain()
+        except Exception as e:
+            logger.error(f"Failed to send response to {peer_addr}: {e}")
 
     async def discover_peer(self, host: str, port: int):
         """Actively connect to a peer to introduce ourselves."""
         try:
-            reader, writer = await asyncio.open_connection(host, port)
             msg = {"type": "discovery", "node_id": self.node_id, "port": self.port}
-            writer.write(json.dumps(msg).encode())
-            await writer.drain()
-
-            # Wait for ack
-            data = await asyncio.wait_for(reader.read(1024), timeout=5.0)
-            ack = json.loads(data.decode())
-            if ack.get("status") == "ack":
+            ack = await self._get_connection(host, port).request(msg, timeout=5.0)
+            if isinstance(ack, dict) and ack.get("status") == "ack":
                 # Assuming the peer id is not known initially, we just store connection info
                 self.peers[f"{host}:{port}"] = (host, port)
-
-            writer.close()
-            await writer.wait_closed()
         except Exception as e:
             logger.error(f"Failed to discover peer at {host}:{port} - {e}")
 
-    def subscribe(self, topic: str, listener: Callable):
-        """Allows an agent to listen for specific tasks."""
+    def subscribe(self, topic: str, listener: Callable, workers: Optional[int] = None,
+                  maxsize: Optional[int] = None, overflow_policy: Optional[str] = None):
+        """
+        Allows an agent to listen for specific tasks.
+        The first subscription of a topic fixes its queue size, worker count and overflow policy.
+        """
         if topic not in self._subscribers:
             self._subscribers[topic] = set()
-            self._message_queues[topic] = asyncio.Queue(maxsize=1000)
+            self._message_queues[topic] = asyncio.Queue(maxsize=maxsize or self.queue_maxsize)
+            self._topic_config[topic] = {
+                "workers": max(1, workers or self.workers_per_topic),
+                "overflow_policy": overflow_policy or self.overflow_policy,
+            }
+            self._topic_stats[topic] = {"published": 0, "delivered": 0, "failed": 0,
+                                        "dropped": 0, "rejected": 0, "high_watermark": 0}
 
         self._subscribers[topic].add(listener)
         logger.info(f"New listener subscribed to topic: '{topic}'")
 
+    def _ensure_workers(self, topic: str):
+        """Start the topic's consumer pool (lazily, since subscribe() may run outside an event loop)."""
+        workers = self._topic_workers.get(topic)
+        if workers and all(not w.done() for w in workers):
+            return
+        count = self._topic_config[topic]["workers"]
+        alive = [w for w in (workers or []) if not w.done()]
+        alive.extend(
+            asyncio.create_task(self._topic_worker(topic), name=f"bus-worker:{topic}")
+            for _ in range(count - len(alive))
+        )
+        self._topic_workers[topic] = alive
+
+    async def _topic_worker(self, topic: str):
+        queue = self._message_queues[topic]
+        stats = self._topic_stats[topic]
+        while True:
+            payload = await queue.get()
+            try:
+                for listener in list(self._subscribers.get(topic, ())):
+                    if await self._safe_execute(listener, payload):
+                        stats["delivered"] += 1
+                    else:
+                        stats["failed"] += 1
+            finally:
+                queue.task_done()
+
     async def publish(self, topic: str, payload: Dict[str, Any]):
-        """Publish message to local subscribers."""
+        """
+        Publish message to local subscribers.
+        The message is enqueued on the topic's bounded queue and delivered by its
+        worker pool; a full queue applies the topic's overflow policy.
+        """
         payload['trace_id'] = str(uuid.uuid4())
 
         if topic not in self._subscribers or not self._subscribers[topic]:
             logger.warning(f"Message dropped. No active agents for topic: '{topic}'")
             return
 
-        tasks = []
-        for listener in self._subscribers[topic]:
-            tasks.append(asyncio.create_task(self._safe_execute(listener, payload)))
+        self._ensure_workers(topic)
+        queue = self._message_queues[topic]
+        stats = self._topic_stats[topic]
+        policy = self._topic_config[topic]["overflow_policy"]
+
+        if queue.full():
+            if policy == OVERFLOW_REJECT:
+                stats["rejected"] += 1
+                raise BackpressureError(f"Queue for topic '{topic}' is full ({queue.maxsize} messages)")
+            if policy == OVERFLOW_DROP_OLDEST:
+                try:
+                    queue.get_nowait()
+                    queue.task_done()
+                    stats["dropped"] += 1
+                except asyncio.QueueEmpty:
+                    pass
 
-        await asyncio.gather(*tasks, return_exceptions=True)
+        if policy == OVERFLOW_BLOCK:
+            await queue.put(payload)
+        else:
+            queue.put_nowait(payload)
+        stats["published"] += 1
+        stats["high_watermark"] = max(stats["high_watermark"], queue.qsize())
 
-    async def _safe_execute(self, listener: Callable, payload: Dict[str, Any]):
+    async def drain(self, topic: Optional[str] = None):
+        """Wait until every queued message (of one topic, or all topics) has been delivered."""
+        topics = [topic] if topic is not None else list(self._message_queues)
+        for name in topics:
+            if name in self._message_queues and self._topic_workers.get(name):
+                await self._message_queues[name].join()
+
+    def get_queue_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Per-topic queue depth, capacity, worker count and delivery counters."""
+        return {
+            topic: {
+                "depth": queue.qsize(),
+                "maxsize": queue.maxsize,
+                "workers": len([w for w in self._topic_workers.get(topic, []) if not w.done()]),
+                "overflow_policy": self._topic_config[topic]["overflow_policy"],
+                **self._topic_stats[topic],
+            }
+            for topic, queue in self._message_queues.items()
+        }
+
+    async def _safe_execute(self, listener: Callable, payload: Dict[str, Any]) -> bool:
         try:
             if asyncio.iscoroutinefunction(listener):
                 await listener(payload)
             else:
                 await asyncio.to_thread(listener, payload)
+            return True
         except Exception as e:
             logger.error(f"Trace {payload.get('trace_id')} failed at {listener.__name__}: {str(e)}")
+            return False
 
     async def _execute_tool(self, tool_name: str, args: Dict[str, Any]) -> Any:
         try:
@@ -144,25 +426,16 @@ class DistributedEventBus:
     async def dispatch_tool(self, peer_id: str, tool_name: str, args: Dict[str, Any]) -> Any:
         """
         Dispatch tool execution to a networked peer for load sharing.
-        Waits for actual execution response.
+        Waits for actual execution response over the peer's pooled connection.
         """
         if peer_id in self.peers:
             host, port = self.peers[peer_id]
             try:
-                reader, writer = await asyncio.open_connection(host, port)
-                message = json.dumps({
+                return await self._get_connection(host, port).request({
                     "type": "tool_dispatch",
                     "tool": tool_name,
                     "args": args
                 })
-                writer.write(message.encode())
-                await writer.drain()
-
-                response_data = await reader.read(4096)
-                writer.close()
-                await writer.wait_closed()
-
-                return json.loads(response_data.decode())
             except Exception as e:
                 return {"error": f"Dispatch failed: {str(e)}"}
         return {"error": "Peer not found"}
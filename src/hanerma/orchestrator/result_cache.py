@@ -0,0 +1,169 @@
+"""
+Content-addressed node result memoization for the orchestrator.
+
+A node's cache key is derived from:
+  - its normalized AST (ast.dump without line/column attributes)
+  - the agent name and model that execute it
+  - digests of the upstream results it reads
+  - the hash of the orchestrator state the agent is given, unless the agent
+    sets state_independent = True
+
+Re-running a DAG after a partial failure (or with a small prompt change)
+therefore returns unchanged upstream agent nodes instantly instead of
+calling the LLM again. Agents that read state_manager only hit the cache when
+the state is identical too, so mark agents state_independent to reuse their
+results across runs.
+
+Backends are pluggable:
+    cache = InMemoryResultCache(max_entries=4096)
+    cache = SQLiteResultCache("hanerma_results.db")
+    cache = CapacitorResultCache(StateCapacitor("./node_results"))
+
+    orch = HANERMAOrchestrator(result_cache=cache)
+"""
+
+import ast
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+
+def result_digest(result: Any) -> str:
+    """Stable digest of a node result, used as an input hash by downstream nodes."""
+    return hashlib.sha256(str(result).encode()).hexdigest()
+
+
+def node_cache_key(ast_node: ast.AST, agent_name: str, model: Optional[str], input_digests: Iterable[str]) -> str:
+    """Builds the content address of a node execution."""
+    hasher = hashlib.sha256()
+    hasher.update(ast.dump(ast_node, include_attributes=False).encode())
+    hasher.update(b"\x00")
+    hasher.update(agent_name.encode())
+    hasher.update(b"\x00")
+    hasher.update(str(model).encode())
+    for digest in input_digests:
+        hasher.update(b"\x00")
+        hasher.update(digest.encode())
+    return hasher.hexdigest()
+
+
+class NodeResultCache:
+    """
+    Interface for node result backends.
+    get() returns None on a miss, so None results are never cached.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def put(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class InMemoryResultCache(NodeResultCache):
+    """Process-local LRU cache."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteResultCache(NodeResultCache):
+    """
+    Durable cache shared by every orchestrator pointing at the same file.
+    Values are stored as JSON; results that are not JSON-serializable are skipped.
+    """
+
+    def __init__(self, db_path: str = "hanerma_results.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS node_results (
+                cache_key TEXT PRIMARY KEY,
+                result TEXT,
+                created_at REAL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM node_results WHERE cache_key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value: Any) -> None:
+        try:
+            encoded = json.dumps(value)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO node_results (cache_key, result, created_at) VALUES (?, ?, ?)",
+                (key, encoded, time.time()),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM node_results")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CapacitorResultCache(NodeResultCache):
+    """
+    Stores results in a Rust LSM StateCapacitor (hanerma_core) under a key prefix.
+    clear() deletes only keys under that prefix, so the capacitor can be shared.
+    """
+
+    def __init__(self, capacitor: Any, prefix: str = "node_result:"):
+        self._capacitor = capacitor
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._capacitor.get_state(self.prefix + key)
+
+    def put(self, key: str, value: Any) -> None:
+        self._capacitor.put_state(self.prefix + key, value)
+
+    def clear(self) -> None:
+        for key in self._capacitor.keys():
+            if key.startswith(self.prefix):
+                self._capacitor.delete(key)
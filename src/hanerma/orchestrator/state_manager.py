@@ -1,4 +1,5 @@
 from typing import Dict, Any, Optional
+import asyncio
 from hanerma.memory.manager import HCMSManager
 from hanerma.state.raft_consensus import RaftConsensus
 import hashlib
@@ -11,15 +12,22 @@ class MultitenantStateManager:
     """
     Maintains strict boundaries between active user sessions with persistent KV cache.
     Critical for deploying HANERMA as a backend for builder platforms.
+
+    Cached responses live in the Raft replicated key-value map. Lookups are served
+    locally without a consensus round: read_mode="leader" answers on the leader
+    while it holds a read lease, read_mode="follower" answers from any replica
+    and may be slightly stale.
     """
-    def __init__(self, memory_store: HCMSManager, bus=None):
+    def __init__(self, memory_store: HCMSManager, bus=None, read_mode: str = "leader"):
         self.memory_store = memory_store
         self.bus = bus
+        self.read_mode = read_mode
         self.active_sessions: Dict[str, Dict[str, Any]] = {}
         if self.bus and hasattr(self.bus, 'raft'):
             self.raft_consensus = self.bus.raft
         else:
-            self.raft_consensus = RaftConsensus("local", {"local": "localhost"})
+            # Single-node cluster: no peers, every proposal commits locally
+            self.raft_consensus = RaftConsensus("local", {})
     
     def initialize_session(self, session_id: str, user_id: str):
         if session_id not in self.active_sessions:
@@ -59,15 +67,26 @@ class MultitenantStateManager:
             "cache_key": cache_key
         }
         
-        consensus_result = self.raft_consensus.query_distributed(query)
+        consistency = "stale" if self.read_mode == "follower" else "linearizable"
+        consensus_result = self.raft_consensus.query_distributed(query, consistency=consistency)
         
         if consensus_result.success:
-            cached_data = consensus_result.data
-            logger.info(f"[Distributed] Retrieved cached response with consensus: {consensus_result.term}")
-            return cached_data
+            if not consensus_result.data["found"]:
+                return None
+            logger.debug(f"[Distributed] Cache hit at read index {consensus_result.data['read_index']} (term {consensus_result.term})")
+            return consensus_result.data["value"]
         else:
-            logger.error(f"[Distributed] Failed to query cache: {consensus_result.error}")
+            logger.warning(f"[Distributed] Failed to query cache: {consensus_result.error}")
             return None
+
+    async def aget_cached_response(self, prompt: str, agent_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Like get_cached_response, but falls back to a ReadIndex round when the leader has no lease."""
+        cache_key = self.get_cache_key(prompt, agent_config)
+        consistency = "stale" if self.read_mode == "follower" else "linearizable"
+        consensus_result = await self.raft_consensus.read(cache_key, consistency=consistency)
+        if consensus_result.success and consensus_result.data["found"]:
+            return consensus_result.data["value"]
+        return None
     
     def set_cached_response(self, prompt: str, agent_config: Dict[str, Any], response: Dict[str, Any]):
         """Set cached response with distributed consistency."""
@@ -84,7 +103,13 @@ class MultitenantStateManager:
             "agent_config": agent_config
         }
         
-        self.raft_consensus.propose_operation(operation)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.raft_consensus.propose_operation(operation))
+        else:
+            # Inside the event loop: the entry commits in the background
+            self.raft_consensus.submit_operation(operation)
         if self.bus:
             self.bus.record_step("kv_cache", 0, "store", cache_data)
     
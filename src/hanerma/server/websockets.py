@@ -1,9 +1,19 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 import json
 import asyncio
 
 ws_router = APIRouter()
+_orchestrator = None
+
+def get_orchestrator():
+    """Process-wide orchestrator shared by every session (created on the first execute_graph)."""
+    global _orchestrator
+    if _orchestrator is None:
+        # Imported lazily: the engine pulls in the whole framework
+        from hanerma.orchestrator.engine import HANERMAOrchestrator
+        _orchestrator = HANERMAOrchestrator()
+    return _orchestrator
 
 class ConnectionManager:
     """Manages active WebSockets for live agent thought-streaming."""
@@ -26,6 +36,39 @@ class ConnectionManager:
                 "content": message
             }))
 
+    async def stream_node_result(self, session_id: str, node_id: str, result: Any, timing: Dict[str, float]):
+        await self._send(session_id, {
+            "type": "node_result",
+            "node_id": node_id,
+            "content": str(result),
+            "timing": timing
+        })
+
+    async def forward_graph_stream(self, session_id: str, stream: AsyncIterator[Tuple[str, Any, Dict[str, float]]]) -> Dict[str, Any]:
+        """Forwards each node of HANERMAOrchestrator.execute_graph_stream the moment it completes."""
+        results = {}
+        async for node_id, result, timing in stream:
+            results[node_id] = result
+            await self.stream_node_result(session_id, node_id, result, timing)
+        return results
+
+    async def run_graph(self, session_id: str, source_code: str):
+        """Executes a graph, streaming node_result messages, then graph_complete or graph_error."""
+        try:
+            # Construction failures are reported like any other graph error
+            orchestrator = get_orchestrator()
+            results = await self.forward_graph_stream(session_id, orchestrator.execute_graph_stream(source_code))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._send(session_id, {"type": "graph_error", "error": str(e)})
+        else:
+            await self._send(session_id, {"type": "graph_complete", "nodes": len(results)})
+
+    async def _send(self, session_id: str, message: Dict[str, Any]):
+        if session_id in self.active_connections:
+            await self.active_connections[session_id].send_text(json.dumps(message))
+
 manager = ConnectionManager()
 
 @ws_router.websocket("/ws/stream/{session_id}")
@@ -33,14 +76,34 @@ async def agent_stream_endpoint(websocket: WebSocket, session_id: str):
     """
     Allows a frontend UI to connect and watch the agent's internal monologue 
     as it executes the Atomic -> Nested -> External pipeline.
+
+    Sending {"type": "execute_graph", "source": "<graph source>"} runs the graph and
+    pushes one node_result message per node the moment it completes.
     """
     await manager.connect(websocket, session_id)
+    graph_task: Optional[asyncio.Task] = None
     try:
         while True:
             # Keep connection alive and listen for client interruptions
             data = await websocket.receive_text()
             # If the user types "STOP", it halts the agent
             if data == "STOP":
+                if graph_task is not None:
+                    graph_task.cancel()
                 await manager.stream_thought(session_id, "[System: Execution Halted by User]")
+                continue
+            try:
+                request = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(request, dict) and request.get("type") == "execute_graph":
+                if graph_task is not None and not graph_task.done():
+                    await manager.stream_thought(session_id, "[System: A graph is already running]")
+                    continue
+                # Run alongside the receive loop so STOP can still interrupt it
+                graph_task = asyncio.create_task(manager.run_graph(session_id, request.get("source", "")))
     except WebSocketDisconnect:
         manager.disconnect(session_id)
+    finally:
+        if graph_task is not None:
+            graph_task.cancel()
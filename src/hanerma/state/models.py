@@ -1,8 +1,61 @@
-from pydantic import BaseModel, Field, RootModel
+from pydantic import BaseModel, Field, PrivateAttr, RootModel, field_validator
 from typing import Dict, List, Any, Optional
 import hashlib
 import json
 
+# Values whose JSON fragment can be cached by identity
+_IMMUTABLE_SCALARS = (str, int, float, bool, type(None))
+
+
+class HistoryList(list):
+    """
+    list that bumps `generation` on every mutation that can change an existing
+    position. append/extend only add to the end and leave it unchanged, so a
+    hashed prefix stays valid for as long as generation and identity hold.
+    """
+
+    generation = 0
+
+    def _bump(self) -> None:
+        self.generation += 1
+
+    def __setitem__(self, index, value):
+        self._bump()
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self._bump()
+        super().__delitem__(index)
+
+    def __imul__(self, count):
+        self._bump()
+        return super().__imul__(count)
+
+    def insert(self, index, value):
+        self._bump()
+        super().insert(index, value)
+
+    def pop(self, index=-1):
+        self._bump()
+        return super().pop(index)
+
+    def remove(self, value):
+        self._bump()
+        super().remove(value)
+
+    def clear(self):
+        self._bump()
+        super().clear()
+
+    def sort(self, *args, **kwargs):
+        self._bump()
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self._bump()
+        super().reverse()
+
+
 class HistoryEntry(BaseModel):
     role: str
     content: str
@@ -14,11 +67,139 @@ class HANERMAState(BaseModel):
     history: List[HistoryEntry] = Field(default_factory=list)
     shared_memory: SharedMemory = Field(default_factory=SharedMemory)
 
-    def compute_hash(self) -> str:
-        """Compute a SHA256 hash of the current state for MVCC versioning."""
-        state_dict = self.dict()
-        state_json = json.dumps(state_dict, sort_keys=True)
-        return hashlib.sha256(state_json.encode()).hexdigest()
+    # Dirty-tracking watermarks: objects already validated, compared by identity
+    _validated_history: List[Any] = PrivateAttr(default_factory=list)
+    _validated_memory: Dict[Any, Any] = PrivateAttr(default_factory=dict)
+
+    # Incremental hashing: SHA-256 midstate after the canonical history prefix
+    _hash_prefix: Any = PrivateAttr(default=None)
+    _hashed_list: Any = PrivateAttr(default=None)
+    _hashed_generation: int = PrivateAttr(default=0)
+    _hashed_length: int = PrivateAttr(default=0)
+    _memory_fragments: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    @field_validator("history", mode="after")
+    @classmethod
+    def _track_history(cls, history: List[HistoryEntry]) -> HistoryList:
+        return HistoryList(history)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Reassigned history is not validated, but still has to be tracked
+        if name == "history" and isinstance(value, list) and not isinstance(value, HistoryList):
+            value = HistoryList(value)
+        super().__setattr__(name, value)
+
+    def revalidate(self, strict: bool = False) -> None:
+        """
+        Validate the state, raising pydantic.ValidationError if it is invalid.
+
+        By default only history entries appended or replaced and shared-memory keys
+        added or reassigned since the last successful check are validated.
+        In-place field mutation of an already-validated entry is not detected;
+        strict=True performs a full serialize-and-revalidate of the whole state.
+        """
+        if strict:
+            type(self)(**self.dict())
+            self._mark_validated()
+            return
+
+        history = self.history
+        if not isinstance(history, list):
+            type(self).model_validate({"history": history})
+        validated = self._validated_history
+        for i, entry in enumerate(history):
+            if i < len(validated) and validated[i] is entry:
+                continue
+            if isinstance(entry, HistoryEntry):
+                HistoryEntry.model_validate(entry.model_dump())
+            else:
+                HistoryEntry.model_validate(entry)
+
+        memory = self.shared_memory
+        if not isinstance(memory, SharedMemory):
+            SharedMemory.model_validate(memory)
+        else:
+            seen = self._validated_memory
+            changed = [k for k, v in memory.root.items() if k not in seen or seen[k] is not v]
+            if changed:
+                SharedMemory.model_validate({k: memory.root[k] for k in changed})
+
+        self._mark_validated()
+
+    def _mark_validated(self) -> None:
+        """Advance the dirty-tracking watermarks to the current contents."""
+        self._validated_history = list(self.history)
+        memory = self.shared_memory
+        self._validated_memory = dict(memory.root) if isinstance(memory, SharedMemory) else {}
+
+    def compute_hash(self, strict: bool = False) -> str:
+        """
+        Compute a SHA256 hash of the current state for MVCC versioning.
+
+        Canonical form (unchanged, so stored state_hash values stay valid):
+            sha256(json.dumps(state.dict(), sort_keys=True))
+
+        SHA-256 is computed as a stream, and the canonical JSON starts with the
+        history array, so the hasher midstate after '{"history": [e1, ..., en' is
+        kept and only newly appended entries are fed on the next call. Shared-memory
+        fragments of immutable scalar values are reused. Truncated or replaced
+        history restarts from scratch; in-place mutation of an already-hashed entry
+        is not detected, strict=True always hashes the full serialization.
+        """
+        if strict:
+            state_json = json.dumps(self.dict(), sort_keys=True)
+            return hashlib.sha256(state_json.encode()).hexdigest()
+
+        history = self.history
+        generation = getattr(history, "generation", None)
+        hashed = self._hashed_length
+        if (self._hash_prefix is None or history is not self._hashed_list or generation is None
+                or generation != self._hashed_generation or len(history) < hashed):
+            hasher = hashlib.sha256(b'{"history": [')
+            hashed = 0
+        else:
+            # Never extend a midstate that a model copy may share
+            hasher = self._hash_prefix.copy()
+
+        for i in range(hashed, len(history)):
+            if i:
+                hasher.update(b", ")
+            entry = history[i]
+            data = entry.model_dump() if isinstance(entry, BaseModel) else entry
+            hasher.update(json.dumps(data, sort_keys=True).encode())
+
+        self._hash_prefix = hasher
+        self._hashed_list = history
+        self._hashed_generation = generation
+        self._hashed_length = len(history)
+
+        final = hasher.copy()
+        final.update(b'], "shared_memory": ')
+        final.update(self._canonical_memory_json().encode())
+        final.update(b"}")
+        return final.hexdigest()
+
+    def _canonical_memory_json(self) -> str:
+        """json.dumps(shared_memory, sort_keys=True), reusing fragments of unchanged scalar values."""
+        memory = self.shared_memory.root if isinstance(self.shared_memory, SharedMemory) else self.shared_memory
+        if not all(isinstance(key, str) for key in memory):
+            return json.dumps(memory, sort_keys=True)
+
+        cache = self._memory_fragments
+        fresh = {}
+        parts = []
+        for key in sorted(memory):
+            value = memory[key]
+            cached = cache.get(key)
+            if cached is not None and cached[0] is value:
+                fragment = cached[1]
+            else:
+                fragment = f"{json.dumps(key)}: {json.dumps(value, sort_keys=True)}"
+            if isinstance(value, _IMMUTABLE_SCALARS):
+                fresh[key] = (value, fragment)
+            parts.append(fragment)
+        self._memory_fragments = fresh
+        return "{" + ", ".join(parts) + "}"
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'HANERMAState':
@@ -1,14 +1,25 @@
 import asyncio
+import hashlib
 import json
 import logging
+import struct
 import time
 import random
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Any, Set, Tuple
+from dataclasses import dataclass, asdict
 from enum import Enum
 
+from .raft_log import RaftLog, SegmentedRaftLog
+
 logger = logging.getLogger("hanerma.raft")
 
+# RPC framing: 4-byte big-endian length prefix + JSON body
+_FRAME_HEADER = struct.Struct("!I")
+
+# Election timeouts are drawn uniformly from this range (seconds)
+MIN_ELECTION_TIMEOUT = 1.5
+MAX_ELECTION_TIMEOUT = 3.0
+
 class RaftNodeState(Enum):
     FOLLOWER = "follower"
     CANDIDATE = "candidate"
@@ -32,74 +43,297 @@ class RaftConsensus:
     """
     Real Raft consensus implementation for distributed state management.
     Performs physical `asyncio` network calls to peers for Leader Election and Log Replication.
+
+    Log indices are 0-based; commit_index / last_applied / match_index are -1 until
+    the first entry is committed / applied / acknowledged. The leader tracks
+    next_index and match_index per follower from AppendEntries responses, so each
+    RPC carries only entries the follower has not acknowledged yet (batched up to
+    max_entries_per_append entries / max_append_bytes of commands).
+
+    submit_operation() returns a future that resolves once the entry is committed
+    on a majority. Proposals arriving within proposal_batch_window seconds share
+    one AppendEntries round.
+
+    With a data_dir the log, term and vote are persisted (SegmentedRaftLog) and
+    survive restarts. Every snapshot_threshold applied entries the state machine
+    is snapshotted and the covered log prefix is deleted; a follower whose
+    next_index falls inside the compacted prefix receives InstallSnapshot.
+    fsyncs, term/vote writes and snapshot writes run on worker threads, so disk
+    latency never stalls the event loop (heartbeats, elections, other RPCs). The
+    leader counts itself towards a majority only up to its durable index, the
+    last entry a completed fsync covers.
+
+    Committed put/delete/store_cache operations are applied to a replicated
+    key-value map (self.kv). Reads never append to the log:
+      - "linearizable": served by the leader once it holds a lease (a majority
+        acknowledged a heartbeat sent within lease_duration) or, without one,
+        after a ReadIndex round confirms leadership. Leases are safe because a
+        node that heard from its leader within MIN_ELECTION_TIMEOUT refuses to
+        vote for anyone else, so no new leader can be elected while a majority
+        still backs the old leader's lease.
+      - "stale": served from the local replica, on any node.
+
+    transport (an object with `async send(src, dst, payload)`), clock, rng and
+    log_store can be injected; raft_simulation uses them to run whole clusters
+    deterministically in one process.
     """
-    def __init__(self, node_id: str, cluster_nodes: Dict[str, Any]):
+    def __init__(self, node_id: str, cluster_nodes: Dict[str, Any], host: Optional[str] = None,
+                 port: Optional[int] = None, max_entries_per_append: int = 256,
+                 max_append_bytes: int = 256 * 1024, proposal_batch_window: float = 0.002,
+                 propose_timeout: float = 5.0, data_dir: Optional[str] = None,
+                 snapshot_threshold: int = 10000, lease_duration: float = 1.0,
+                 transport: Any = None, clock: Optional[Callable[[], float]] = None,
+                 rng: Optional[random.Random] = None, log_store: Optional[RaftLog] = None):
         self.node_id = node_id
         # Expecting cluster_nodes values to be dicts with "host" and "port"
         self.cluster_nodes = cluster_nodes
+        self.host = host
+        self.port = port
+        self.max_entries_per_append = max_entries_per_append
+        self.max_append_bytes = max_append_bytes
+        self.proposal_batch_window = proposal_batch_window
+        self.propose_timeout = propose_timeout
+        self.snapshot_threshold = snapshot_threshold
+        if lease_duration >= MIN_ELECTION_TIMEOUT:
+            raise ValueError(f"lease_duration must be below the minimum election timeout ({MIN_ELECTION_TIMEOUT}s)")
+        self.lease_duration = lease_duration
+        self.transport = transport
+        self._clock = clock or time.monotonic
+        self._rng = rng or random.Random()
 
         self.current_term = 0
         self.voted_for: Optional[str] = None
-        self.log: List[LogEntry] = []
-
-        self.commit_index = 0
-        self.last_applied = 0
+        self.leader_id: Optional[str] = None
+        if log_store is not None:
+            self.log: RaftLog = log_store
+        else:
+            self.log = SegmentedRaftLog(data_dir) if data_dir else RaftLog()
+
+        self.commit_index = -1
+        self.last_applied = -1
         self.state = RaftNodeState.FOLLOWER
 
         self.next_index: Dict[str, int] = {}
         self.match_index: Dict[str, int] = {}
-
-        self.election_timeout = random.uniform(1.5, 3.0)
-        self.last_heartbeat_time = time.time()
+        self._replicating: set = set()
+
+        # log index -> (term, future) for proposals awaiting commit
+        self._commit_futures: Dict[int, Tuple[int, asyncio.Future]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # Latest in-flight log fsync (each one also waits for its predecessor)
+        self._log_sync: Optional[asyncio.Future] = None
+        # Last log index known to be on disk; _log_epoch changes when the log is truncated
+        self._durable_index = -1
+        self._log_epoch = 0
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+        self.executed_commands: Set[str] = set()
+        self.kv: Dict[str, Any] = {}
+        # peer -> send time of the latest heartbeat/AppendEntries it acknowledged
+        self._peer_ack_time: Dict[str, float] = {}
+
+        self.election_timeout = self._rng.uniform(MIN_ELECTION_TIMEOUT, MAX_ELECTION_TIMEOUT)
+        self.last_heartbeat_time = self._clock()
 
         self._election_task: Optional[asyncio.Task] = None
+        self._server = None
+
+        self._restore_from_storage()
+        self._durable_index = self._last_log_index()
         
         logger.info(f"[RAFT] Node {node_id} initialized with {len(cluster_nodes)} cluster nodes")
 
     async def start(self):
+        if self.port is not None:
+            self._server = await asyncio.start_server(self._handle_connection, self.host or "127.0.0.1", self.port)
         self._election_task = asyncio.create_task(self._election_loop())
 
     async def stop(self):
-        if self._election_task:
-            self._election_task.cancel()
+        # Let an in-flight snapshot finish so its compaction is not lost
+        if self._snapshot_task is not None:
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+        tasks = [t for t in [self._election_task, self._flush_task, *self._background] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for _, future in self._commit_futures.values():
+            if not future.done():
+                future.set_result(ConsensusResult(success=False, term=self.current_term, error="Node stopped"))
+        self._commit_futures.clear()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self._sync_log()
+        self.log.close()
+
+    def _restore_from_storage(self):
+        meta = self.log.load_meta()
+        self.current_term = meta.get("current_term", 0)
+        self.voted_for = meta.get("voted_for")
+        snapshot = self.log.load_snapshot()
+        if snapshot is not None:
+            self._restore_state(snapshot["state"])
+            self.commit_index = self.last_applied = snapshot["last_included_index"]
+
+    def _persist_meta(self):
+        self.log.save_meta(self.current_term, self.voted_for)
+
+    async def _sync_log(self):
+        """Makes every entry appended so far, and the term/vote, durable on a worker thread."""
+        target, epoch = self._last_log_index(), self._log_epoch
+        job = self.log.begin_sync()
+        if job is not None:
+            self._log_sync = asyncio.ensure_future(self._run_log_sync(job, self._log_sync, target, epoch))
+        pending = self._log_sync
+        if pending is not None and not pending.done():
+            await asyncio.shield(pending)
+        self._mark_durable(target, epoch)
+
+    async def _run_log_sync(self, job: Callable[[], None], previous: Optional[asyncio.Future],
+                            target: int, epoch: int):
+        await asyncio.to_thread(job)
+        # An earlier fsync may cover a segment this one does not
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        self._mark_durable(target, epoch)
+
+    def _mark_durable(self, index: int, epoch: int):
+        # A truncation since the sync began may have replaced the entries it covered
+        if epoch != self._log_epoch or index <= self._durable_index:
+            return
+        self._durable_index = index
+        # Followers may already have acknowledged these entries
+        self._advance_commit_index()
+
+    def _truncate_log(self, index: int):
+        self.log.truncate_from(index)
+        self._durable_index = min(self._durable_index, index - 1)
+        self._log_epoch += 1
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    # ── Log helpers ──
+
+    def _last_log_index(self) -> int:
+        return self.log.last_index
+
+    def _term_at(self, index: int) -> int:
+        term = self.log.term_at(index)
+        return term if term is not None else 0
 
     async def _election_loop(self):
         while True:
             try:
                 await asyncio.sleep(0.1)
                 if self.state == RaftNodeState.LEADER:
-                    await self._send_heartbeats()
+                    # Not awaited: a peer that stops answering must not delay heartbeats to the others
+                    self._spawn(self._send_heartbeats())
                 else:
-                    if time.time() - self.last_heartbeat_time > self.election_timeout:
+                    if self._clock() - self.last_heartbeat_time > self.election_timeout:
                         await self._start_election()
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"[RAFT] Election loop error: {e}")
 
+    # ── Transport ──
+
     async def _send_rpc(self, host: str, port: int, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Perform physical TCP connection to a peer for an RPC call."""
         try:
             reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=1.0)
-            writer.write(json.dumps(payload).encode())
+            data = json.dumps(payload).encode()
+            writer.write(_FRAME_HEADER.pack(len(data)) + data)
             await writer.drain()
-            
-            data = await asyncio.wait_for(reader.read(4096), timeout=1.0)
+
+            header = await asyncio.wait_for(reader.readexactly(_FRAME_HEADER.size), timeout=1.0)
+            (length,) = _FRAME_HEADER.unpack(header)
+            body = await asyncio.wait_for(reader.readexactly(length), timeout=1.0)
             writer.close()
             await writer.wait_closed()
             
-            return json.loads(data.decode())
+            return json.loads(body.decode())
         except Exception:
             # Drop failed connections (simulating partition or crash)
             return None
 
+    async def _send_to_peer(self, peer_id: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.transport is not None:
+            return await self.transport.send(self.node_id, peer_id, payload)
+        addr = self.cluster_nodes[peer_id]
+        return await self._send_rpc(addr['host'], addr['port'], payload)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one framed RPC per connection."""
+        try:
+            header = await reader.readexactly(_FRAME_HEADER.size)
+            (length,) = _FRAME_HEADER.unpack(header)
+            payload = json.loads((await reader.readexactly(length)).decode())
+            response = await self.serve_rpc(payload)
+            data = json.dumps(response).encode()
+            writer.write(_FRAME_HEADER.pack(len(data)) + data)
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"[RAFT] RPC connection error: {e}")
+        finally:
+            writer.close()
+
+    async def serve_rpc(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Handle an RPC and reply once any entries, term or vote it changed are durable."""
+        if payload.get("type") == "InstallSnapshot" and self.log.persistent:
+            response = await self._serve_install_snapshot(payload)
+        else:
+            response = self.handle_rpc(payload)
+        await self._sync_log()
+        return response
+
+    def handle_rpc(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Dispatch an incoming RPC to its handler. Appended entries are not yet
+        durable: reply through serve_rpc, or call log.sync() first.
+        """
+        rpc_type = payload.get("type")
+        if rpc_type == "AppendEntries":
+            return self.handle_append_entries(payload)
+        if rpc_type == "RequestVote":
+            return self.handle_request_vote(payload)
+        if rpc_type == "InstallSnapshot":
+            return self.handle_install_snapshot(payload)
+        return {"term": self.current_term, "error": f"Unknown RPC type: {rpc_type}"}
+
+    # ── Elections ──
+
+    def _become_follower(self, term: int, leader_id: Optional[str] = None):
+        if term > self.current_term:
+            self.current_term = term
+            self.voted_for = None
+            # The old term's leader is not the leader of this one
+            self.leader_id = None
+            self._persist_meta()
+        self.state = RaftNodeState.FOLLOWER
+        if leader_id is not None:
+            self.leader_id = leader_id
+
     async def _start_election(self):
         logger.info(f"[RAFT] Node {self.node_id} starting election for term {self.current_term + 1}")
         self.state = RaftNodeState.CANDIDATE
         self.current_term += 1
         self.voted_for = self.node_id
-        self.last_heartbeat_time = time.time()
-        self.election_timeout = random.uniform(1.5, 3.0)
+        self.leader_id = None
+        self._persist_meta()
+        self.last_heartbeat_time = self._clock()
+        self.election_timeout = self._rng.uniform(MIN_ELECTION_TIMEOUT, MAX_ELECTION_TIMEOUT)
+        election_term = self.current_term
+
+        # The self-vote must be durable before anyone is asked for theirs
+        await self._sync_log()
+        if self.state != RaftNodeState.CANDIDATE or self.current_term != election_term:
+            return
 
         votes = 1 # Vote for self
         required_votes = (len(self.cluster_nodes) + 1) // 2 + 1
@@ -108,96 +342,350 @@ class RaftConsensus:
             self._become_leader()
             return
             
-        last_log_index = len(self.log) - 1
-        last_log_term = self.log[-1].term if self.log else 0
-            
         payload = {
             "type": "RequestVote",
             "term": self.current_term,
             "candidate_id": self.node_id,
-            "last_log_index": last_log_index,
-            "last_log_term": last_log_term
+            "last_log_index": self._last_log_index(),
+            "last_log_term": self._term_at(self._last_log_index())
         }
         
         # Gather votes asynchronously
-        tasks = []
-        for peer_id, addr in self.cluster_nodes.items():
-            tasks.append(self._send_rpc(addr['host'], addr['port'], payload))
-
+        tasks = [self._send_to_peer(peer_id, payload) for peer_id in self.cluster_nodes]
         responses = await asyncio.gather(*tasks, return_exceptions=True)
         
         for response in responses:
-            if isinstance(response, dict) and response.get("vote_granted"):
+            if not isinstance(response, dict):
+                continue
+            if response.get("term", 0) > self.current_term:
+                self._become_follower(response["term"])
+                return
+            if response.get("vote_granted"):
                 votes += 1
 
-        if votes >= required_votes:
+        if votes >= required_votes and self.state == RaftNodeState.CANDIDATE and self.current_term == election_term:
             self._become_leader()
 
+    def handle_request_vote(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        term = payload["term"]
+        if (self.leader_id not in (None, payload["candidate_id"])
+                and self._clock() - self.last_heartbeat_time < MIN_ELECTION_TIMEOUT):
+            # Leader stickiness: a live leader may be serving lease reads that this node's
+            # acknowledgement backs, so neither vote nor adopt the candidate's term yet
+            return {"term": self.current_term, "vote_granted": False}
+        if term > self.current_term:
+            self._become_follower(term)
+        if term < self.current_term:
+            return {"term": self.current_term, "vote_granted": False}
+
+        last_index = self._last_log_index()
+        last_term = self._term_at(last_index)
+        up_to_date = (payload["last_log_term"], payload["last_log_index"]) >= (last_term, last_index)
+        if self.voted_for in (None, payload["candidate_id"]) and up_to_date:
+            self.voted_for = payload["candidate_id"]
+            self._persist_meta()
+            self.last_heartbeat_time = self._clock()
+            return {"term": self.current_term, "vote_granted": True}
+        return {"term": self.current_term, "vote_granted": False}
+
     def _become_leader(self):
         logger.info(f"[RAFT] Node {self.node_id} became LEADER for term {self.current_term}")
         self.state = RaftNodeState.LEADER
+        self.leader_id = self.node_id
+        self._peer_ack_time.clear()
         for peer in self.cluster_nodes:
             self.next_index[peer] = len(self.log)
-            self.match_index[peer] = 0
+            self.match_index[peer] = -1
+
+    # ── Log replication (leader side) ──
 
     async def _send_heartbeats(self):
-        self.last_heartbeat_time = time.time()
+        self.last_heartbeat_time = self._clock()
+        # The leader counts itself towards the majority, so its entries must be durable first
+        await self._sync_log()
         if len(self.cluster_nodes) == 0:
+            self._advance_commit_index()
             return
 
-        tasks = []
-        for peer_id, addr in self.cluster_nodes.items():
-            prev_log_index = self.next_index.get(peer_id, 0) - 1
-            prev_log_term = self.log[prev_log_index].term if prev_log_index >= 0 and prev_log_index < len(self.log) else 0
-            entries = self.log[prev_log_index + 1:]
-
-            payload = {
-                "type": "AppendEntries",
-                "term": self.current_term,
-                "leader_id": self.node_id,
-                "prev_log_index": prev_log_index,
-                "prev_log_term": prev_log_term,
-                "entries": [{"term": e.term, "index": e.index, "command": e.command, "timestamp": e.timestamp} for e in entries],
-                "leader_commit": self.commit_index
-            }
-            tasks.append(self._send_rpc(addr['host'], addr['port'], payload))
-
+        tasks = [self._replicate_to(peer_id) for peer_id in self.cluster_nodes if peer_id not in self._replicating]
         await asyncio.gather(*tasks, return_exceptions=True)
 
-    def receive_append_entries(self, term: int, leader_id: str, prev_log_index: int, prev_log_term: int, entries: List[Dict], leader_commit: int) -> bool:
-        if term < self.current_term:
-            return False
+    def _build_append_entries(self, peer_id: str) -> Dict[str, Any]:
+        """AppendEntries for one follower: only entries from its next_index, capped by count and bytes."""
+        next_idx = min(self.next_index.get(peer_id, len(self.log)), len(self.log))
+        prev_log_index = next_idx - 1
 
-        self.last_heartbeat_time = time.time()
-        
-        if term > self.current_term:
-            self.current_term = term
-            self.state = RaftNodeState.FOLLOWER
-            self.voted_for = None
+        entries = []
+        batch_bytes = 0
+        for entry in self.log.entries(next_idx, next_idx + self.max_entries_per_append):
+            size = len(entry.command)
+            if entries and batch_bytes + size > self.max_append_bytes:
+                break
+            entries.append(asdict(entry))
+            batch_bytes += size
+
+        return {
+            "type": "AppendEntries",
+            "term": self.current_term,
+            "leader_id": self.node_id,
+            "prev_log_index": prev_log_index,
+            "prev_log_term": self._term_at(prev_log_index),
+            "entries": entries,
+            "leader_commit": self.commit_index
+        }
 
-        if prev_log_index >= 0:
-            if prev_log_index >= len(self.log) or self.log[prev_log_index].term != prev_log_term:
-                return False
-
-        if entries:
-            for i, ent_dict in enumerate(entries):
-                idx = prev_log_index + 1 + i
-                entry = LogEntry(**ent_dict)
-                if idx < len(self.log):
-                    if self.log[idx].term != entry.term:
-                        self.log = self.log[:idx]
-                        self.log.append(entry)
+    def _build_install_snapshot(self) -> Dict[str, Any]:
+        snapshot = self.log.load_snapshot()
+        return {
+            "type": "InstallSnapshot",
+            "term": self.current_term,
+            "leader_id": self.node_id,
+            "last_included_index": snapshot["last_included_index"],
+            "last_included_term": snapshot["last_included_term"],
+            "data": snapshot["state"]
+        }
+
+    async def _replicate_to(self, peer_id: str):
+        """Send AppendEntries to one follower until it has caught up or stops answering."""
+        self._replicating.add(peer_id)
+        try:
+            while self.state == RaftNodeState.LEADER:
+                term = self.current_term
+                if self.next_index.get(peer_id, len(self.log)) <= self.log.snapshot_index:
+                    payload = self._build_install_snapshot()
                 else:
-                    self.log.append(entry)
+                    payload = self._build_append_entries(peer_id)
+                sent_at = self._clock()
+                response = await self._send_to_peer(peer_id, payload)
+                if not isinstance(response, dict):
+                    return
+                if response.get("term", 0) > self.current_term:
+                    self._become_follower(response["term"])
+                    return
+                if self.state != RaftNodeState.LEADER or self.current_term != term:
+                    return
+                # Any same-term answer means the follower still accepts this leader
+                self._peer_ack_time[peer_id] = max(self._peer_ack_time.get(peer_id, 0.0), sent_at)
+
+                if response.get("success"):
+                    if payload["type"] == "InstallSnapshot":
+                        match = payload["last_included_index"]
+                    else:
+                        match = payload["prev_log_index"] + len(payload["entries"])
+                    self.match_index[peer_id] = max(self.match_index.get(peer_id, -1), match)
+                    self.next_index[peer_id] = max(self.next_index.get(peer_id, 0), match + 1)
+                    self._advance_commit_index()
+                    # Keep streaming while the follower is behind, including entries
+                    # proposed while this RPC was in flight
+                    if self.next_index[peer_id] > self._last_log_index():
+                        return
+                elif payload["type"] == "AppendEntries":
+                    # Log mismatch: back up to the follower's hint and retry
+                    conflict = response.get("conflict_index", payload["prev_log_index"])
+                    self.next_index[peer_id] = max(0, min(conflict, self.next_index.get(peer_id, 0) - 1))
+        finally:
+            self._replicating.discard(peer_id)
+
+    def _advance_commit_index(self):
+        """Commit the highest current-term index stored on a majority (leader counts itself)."""
+        if self.state != RaftNodeState.LEADER:
+            return
+        own = self._last_log_index()
+        if self.log.persistent:
+            own = min(own, self._durable_index)
+        indices = sorted([own] + [self.match_index.get(p, -1) for p in self.cluster_nodes], reverse=True)
+        majority_index = indices[(len(self.cluster_nodes) + 1) // 2]
+        if majority_index > self.commit_index and self._term_at(majority_index) == self.current_term:
+            self.commit_index = majority_index
+            self._apply_committed()
+
+    def _apply_committed(self):
+        """Advance last_applied up to commit_index and resolve proposals waiting on those entries."""
+        while self.last_applied < self.commit_index:
+            self.last_applied += 1
+            entry = self.log[self.last_applied]
+            self._apply_entry(entry)
+
+            waiter = self._commit_futures.pop(self.last_applied, None)
+            if waiter is not None and not waiter[1].done():
+                term, future = waiter
+                if term == entry.term:
+                    future.set_result(ConsensusResult(success=True, term=entry.term, data={"log_index": entry.index, "committed": True}))
+                else:
+                    future.set_result(ConsensusResult(success=False, term=self.current_term, error="Entry superseded by a new leader"))
+
+        if self.last_applied - self.log.snapshot_index >= self.snapshot_threshold:
+            self._schedule_snapshot()
+
+    def _schedule_snapshot(self):
+        """Snapshot in the background when the log is on disk and a loop is running."""
+        if self._snapshot_task is not None and not self._snapshot_task.done():
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.take_snapshot()
+            return
+        if not self.log.persistent:
+            self.take_snapshot()
+            return
+        index, term = self.last_applied, self._term_at(self.last_applied)
+        self._snapshot_task = asyncio.create_task(self._write_snapshot(index, term, self._snapshot_state()))
 
-        if leader_commit > self.commit_index:
-            self.commit_index = min(leader_commit, len(self.log) - 1)
+    async def _write_snapshot(self, index: int, term: int, state: Dict[str, Any]):
+        await asyncio.to_thread(self.log.save_snapshot, index, term, state)
+        self._compact_to(index, term)
 
-        return True
+    def take_snapshot(self):
+        """Snapshot the state machine at last_applied and drop the log prefix it covers (blocking)."""
+        if self.last_applied <= self.log.snapshot_index:
+            return
+        index, term = self.last_applied, self._term_at(self.last_applied)
+        self.log.save_snapshot(index, term, self._snapshot_state())
+        self._compact_to(index, term)
 
-    async def propose_operation(self, operation: Dict[str, Any]) -> ConsensusResult:
+    def _compact_to(self, index: int, term: int):
+        # An InstallSnapshot may have moved the log past this snapshot meanwhile
+        if index <= self.log.snapshot_index:
+            return
+        self.log.compact(index, term)
+        logger.info(f"[RAFT] Node {self.node_id} snapshotted at index {index}")
+
+    def _snapshot_state(self) -> Dict[str, Any]:
+        return {"executed_commands": sorted(self.executed_commands), "kv": dict(self.kv)}
+
+    def _restore_state(self, state: Dict[str, Any]):
+        self.executed_commands = set(state.get("executed_commands", []))
+        self.kv = dict(state.get("kv", {}))
+
+    def _apply_entry(self, entry: LogEntry):
+        """Apply one committed entry to the local state machine."""
+        operation = json.loads(entry.command)
+        if not isinstance(operation, dict):
+            return
+        if operation.get("idempotency_key"):
+            self.executed_commands.add(operation["idempotency_key"])
+
+        op_type = operation.get("type")
+        if op_type == "put":
+            self.kv[operation["key"]] = operation["value"]
+        elif op_type == "delete":
+            self.kv.pop(operation["key"], None)
+        elif op_type == "store_cache":
+            self.kv[operation["cache_key"]] = operation["response"]
+
+    # ── Log replication (follower side) ──
+
+    def handle_append_entries(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        term = payload["term"]
+        if term < self.current_term:
+            return {"term": self.current_term, "success": False}
+
+        self.last_heartbeat_time = self._clock()
+        self._become_follower(term, payload["leader_id"])
+
+        prev_log_index = payload["prev_log_index"]
+        entries = payload["entries"]
+        if prev_log_index < self.log.snapshot_index:
+            # The snapshot covers a committed prefix of these entries; skip it
+            skip = self.log.snapshot_index - prev_log_index
+            entries = entries[skip:]
+            prev_log_index = self.log.snapshot_index
+            payload = dict(payload, prev_log_term=self.log.snapshot_term)
+        if prev_log_index > self._last_log_index():
+            return {"term": self.current_term, "success": False, "conflict_index": len(self.log)}
+        if prev_log_index >= 0 and self._term_at(prev_log_index) != payload["prev_log_term"]:
+            # Hint: first index of the conflicting term, so the leader skips it in one step
+            conflict_term = self._term_at(prev_log_index)
+            conflict_index = prev_log_index
+            while conflict_index > self.log.first_index and self._term_at(conflict_index - 1) == conflict_term:
+                conflict_index -= 1
+            return {"term": self.current_term, "success": False, "conflict_index": conflict_index}
+
+        for i, ent_dict in enumerate(entries):
+            idx = prev_log_index + 1 + i
+            if idx <= self._last_log_index():
+                if self._term_at(idx) == ent_dict["term"]:
+                    continue
+                self._truncate_log(idx)
+            self.log.append(LogEntry(**ent_dict))
+
+        match_index = prev_log_index + len(entries)
+        if payload["leader_commit"] > self.commit_index:
+            self.commit_index = min(payload["leader_commit"], match_index)
+            self._apply_committed()
+
+        return {"term": self.current_term, "success": True, "match_index": match_index}
+
+    def handle_install_snapshot(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        response = self._check_install_snapshot(payload)
+        if response is not None:
+            return response
+        self.log.save_snapshot(payload["last_included_index"], payload["last_included_term"], payload["data"])
+        return self._install_snapshot(payload)
+
+    async def _serve_install_snapshot(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """handle_install_snapshot with the snapshot file written on a worker thread."""
+        response = self._check_install_snapshot(payload)
+        if response is not None:
+            return response
+        index = payload["last_included_index"]
+        await asyncio.to_thread(self.log.save_snapshot, index, payload["last_included_term"], payload["data"])
+        if index <= self.commit_index:
+            # Caught up through AppendEntries while the file was written
+            return {"term": self.current_term, "success": True, "match_index": index}
+        return self._install_snapshot(payload)
+
+    def _check_install_snapshot(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The response for a snapshot that must not be installed, else None."""
+        term = payload["term"]
+        if term < self.current_term:
+            return {"term": self.current_term, "success": False}
+
+        self.last_heartbeat_time = self._clock()
+        self._become_follower(term, payload["leader_id"])
+
+        index = payload["last_included_index"]
+        if index <= self.commit_index:
+            return {"term": self.current_term, "success": True, "match_index": index}
+        return None
+
+    def _install_snapshot(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        index, snap_term = payload["last_included_index"], payload["last_included_term"]
+        if self.log.term_at(index) == snap_term:
+            # Keep the entries that follow the snapshot
+            self.log.compact(index, snap_term)
+        else:
+            self.log.reset(index, snap_term)
+            self._durable_index = min(self._durable_index, index)
+            self._log_epoch += 1
+        self._restore_state(payload["data"])
+        self.commit_index = self.last_applied = index
+        return {"term": self.current_term, "success": True, "match_index": index}
+
+    def receive_append_entries(self, term: int, leader_id: str, prev_log_index: int, prev_log_term: int, entries: List[Dict], leader_commit: int) -> bool:
+        response = self.handle_append_entries({
+            "term": term,
+            "leader_id": leader_id,
+            "prev_log_index": prev_log_index,
+            "prev_log_term": prev_log_term,
+            "entries": entries,
+            "leader_commit": leader_commit,
+        })
+        self.log.sync()
+        return response["success"]
+
+    def submit_operation(self, operation: Dict[str, Any]) -> asyncio.Future:
+        """
+        Append an operation to the leader's log and return a future resolving to a
+        ConsensusResult once it is committed. Replication is deferred by
+        proposal_batch_window so concurrent proposals share an AppendEntries round.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
         if self.state != RaftNodeState.LEADER and len(self.cluster_nodes) > 0:
-            return ConsensusResult(success=False, term=self.current_term, error="Not leader")
+            future.set_result(ConsensusResult(success=False, term=self.current_term, error="Not leader"))
+            return future
 
         log_entry = LogEntry(
             term=self.current_term,
@@ -206,19 +694,138 @@ class RaftConsensus:
             timestamp=time.time()
         )
         self.log.append(log_entry)
-        
-        if len(self.cluster_nodes) == 0:
-            self.commit_index = len(self.log) - 1
-            return ConsensusResult(success=True, term=self.current_term, data={"log_index": log_entry.index, "committed": True})
+        self._commit_futures[log_entry.index] = (log_entry.term, future)
 
-        # Send to peers immediately
-        await self._send_heartbeats()
-        
-        return ConsensusResult(success=True, term=self.current_term, data={"log_index": log_entry.index, "committed": False, "pending": True})
+        if len(self.cluster_nodes) == 0:
+            self._spawn(self._commit_local(log_entry.index))
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_proposals())
+        return future
+
+    async def _commit_local(self, index: int):
+        """Single-node cluster: an entry is committed once it is durable locally."""
+        await self._sync_log()
+        if index > self.commit_index:
+            self.commit_index = index
+            self._apply_committed()
+
+    async def _flush_proposals(self):
+        """One replication round for every proposal accumulated during the batch window."""
+        await asyncio.sleep(self.proposal_batch_window)
+        if self.state == RaftNodeState.LEADER:
+            # Spawned so the next batch window can open while this round is in flight
+            self._spawn(self._send_heartbeats())
+
+    async def propose_operation(self, operation: Dict[str, Any], wait_for_commit: bool = True,
+                                timeout: Optional[float] = None) -> ConsensusResult:
+        future = self.submit_operation(operation)
+        if future.done():
+            return future.result()
+        log_index = self._last_log_index()
+        if not wait_for_commit:
+            return ConsensusResult(success=True, term=self.current_term, data={"log_index": log_index, "committed": False, "pending": True})
 
-    def query_distributed(self, query: Dict[str, Any]) -> ConsensusResult:
-        return ConsensusResult(
-            success=True,
-            term=self.current_term,
-            data={"state": self.state.value, "commit_index": self.commit_index}
-        )
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.propose_timeout)
+        except asyncio.TimeoutError:
+            return ConsensusResult(success=False, term=self.current_term, data={"log_index": log_index, "committed": False, "pending": True},
+                                   error="Timed out waiting for commit")
+
+    @staticmethod
+    def generate_idempotency_key(command: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(command, sort_keys=True).encode()).hexdigest()
+
+    async def propose_command(self, command: Dict[str, Any]) -> bool:
+        """
+        Replicate a command exactly once. Returns True once the command is committed
+        on a majority (or was already committed earlier).
+        """
+        idempotency_key = self.generate_idempotency_key(command)
+        if idempotency_key in self.executed_commands:
+            return True
+        result = await self.propose_operation({"type": "command", "idempotency_key": idempotency_key, "command": command})
+        return result.success
+
+    # ── Reads ──
+
+    def _has_lease(self) -> bool:
+        """True while a majority (leader included) acknowledged a heartbeat sent within lease_duration."""
+        if not self.cluster_nodes:
+            return True
+        if self.state != RaftNodeState.LEADER:
+            return False
+        needed = (len(self.cluster_nodes) + 1) // 2  # peer acks on top of the leader's own
+        acks = sorted(self._peer_ack_time.values(), reverse=True)
+        return len(acks) >= needed and acks[needed - 1] > self._clock() - self.lease_duration
+
+    def _read_index_ready(self) -> bool:
+        """The leader's commit index is only a valid read index once it has committed an entry of its term."""
+        if not self.cluster_nodes:
+            return self.last_applied >= self.commit_index
+        return self._term_at(self.commit_index) == self.current_term and self.last_applied >= self.commit_index
+
+    def _read_local(self, key: str, read_index: int) -> ConsensusResult:
+        return ConsensusResult(success=True, term=self.current_term, data={
+            "key": key,
+            "found": key in self.kv,
+            "value": self.kv.get(key),
+            "read_index": read_index,
+        })
+
+    async def read(self, key: str, consistency: str = "linearizable") -> ConsensusResult:
+        """Read a replicated key without appending to the log."""
+        if consistency == "stale":
+            return self._read_local(key, self.last_applied)
+
+        if not self.cluster_nodes:
+            return self._read_local(key, self.commit_index)
+        if self.state != RaftNodeState.LEADER:
+            return ConsensusResult(success=False, term=self.current_term, data={"leader_id": self.leader_id}, error="Not leader")
+
+        if self._term_at(self.commit_index) != self.current_term:
+            # A fresh leader learns the commit index by committing an entry of its own term
+            result = await self.propose_operation({"type": "noop"})
+            if not result.success:
+                return result
+
+        read_index = self.commit_index
+        if not self._has_lease():
+            # ReadIndex: confirm leadership with a heartbeat round sent after the read arrived
+            started = self._clock()
+            deadline = started + self.propose_timeout
+            needed = (len(self.cluster_nodes) + 1) // 2
+            while True:
+                await self._send_heartbeats()
+                if self.state != RaftNodeState.LEADER:
+                    return ConsensusResult(success=False, term=self.current_term, data={"leader_id": self.leader_id}, error="Not leader")
+                if sum(1 for t in self._peer_ack_time.values() if t >= started) >= needed:
+                    break
+                if self._clock() > deadline:
+                    return ConsensusResult(success=False, term=self.current_term, error="Could not confirm leadership")
+                await asyncio.sleep(0.01)
+
+        while self.last_applied < read_index:
+            await asyncio.sleep(0.001)
+        return self._read_local(key, read_index)
+
+    def query_distributed(self, query: Dict[str, Any], consistency: str = "linearizable") -> ConsensusResult:
+        """
+        Synchronous read. Key queries ("key" or "cache_key") are answered from the
+        replicated map: on the leader only while it holds a lease, on any node with
+        consistency="stale". Other queries return the node's Raft status.
+        """
+        key = query.get("key", query.get("cache_key"))
+        if key is None:
+            return ConsensusResult(
+                success=True,
+                term=self.current_term,
+                data={"state": self.state.value, "commit_index": self.commit_index}
+            )
+
+        if consistency == "stale":
+            return self._read_local(key, self.last_applied)
+        if self.state != RaftNodeState.LEADER and self.cluster_nodes:
+            return ConsensusResult(success=False, term=self.current_term, data={"leader_id": self.leader_id}, error="Not leader")
+        if not self._has_lease() or not self._read_index_ready():
+            return ConsensusResult(success=False, term=self.current_term, error="No read lease; use read()")
+        return self._read_local(key, self.commit_index)
@@ -0,0 +1,482 @@
+"""
+Raft log storage.
+
+RaftLog keeps entries in memory; SegmentedRaftLog persists them in append-only
+segment files under a data directory:
+
+    segment-<first_index>.log   records: [length:u32][crc32:u32][JSON LogEntry]
+    segment-<first_index>.idx   one (offset:u64, term:u64) pair per record
+    snapshot.json               last_included_index/term + state machine snapshot
+    meta.json                   current_term / voted_for
+
+Both expose absolute (0-based) log indices. Entries up to snapshot_index are
+covered by the snapshot and dropped by compact(); whole segments are deleted
+once every entry in them is covered.
+
+sync() blocks on fsync. Callers on an event loop use begin_sync() instead: it
+flushes appended entries to the OS and returns the fsync itself (and the
+meta.json write for a changed term/vote) as a job to run on a worker thread.
+save_snapshot() may also run on a worker thread.
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("hanerma.raft")
+
+_RECORD_HEADER = struct.Struct("!II")
+_INDEX_RECORD = struct.Struct("!QQ")
+
+
+class RaftLog:
+    """In-memory Raft log with snapshot-based compaction."""
+
+    # Whether sync()/save_snapshot() touch disk (worth moving off the event loop)
+    persistent = False
+
+    def __init__(self):
+        self.snapshot_index = -1
+        self.snapshot_term = 0
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._meta: Dict[str, Any] = {}
+        self._entries: List[Any] = []
+
+    @property
+    def first_index(self) -> int:
+        return self.snapshot_index + 1
+
+    @property
+    def last_index(self) -> int:
+        return self.snapshot_index + len(self._entries)
+
+    def __len__(self) -> int:
+        return self.last_index + 1
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._entries)
+
+    def __getitem__(self, index: int) -> Any:
+        if not self.first_index <= index <= self.last_index:
+            raise IndexError(f"Log index {index} outside [{self.first_index}, {self.last_index}]")
+        return self._entries[index - self.first_index]
+
+    def term_at(self, index: int) -> Optional[int]:
+        """Term of an entry; None if it is compacted (and not the snapshot boundary) or absent."""
+        if index == self.snapshot_index:
+            return self.snapshot_term
+        if self.first_index <= index <= self.last_index:
+            return self[index].term
+        return None
+
+    def entries(self, start: int, stop: int) -> List[Any]:
+        start = max(start, self.first_index)
+        stop = min(stop, self.last_index + 1)
+        return [self[i] for i in range(start, stop)]
+
+    def append(self, entry: Any):
+        if entry.index != self.last_index + 1:
+            raise ValueError(f"Non-contiguous append: {entry.index} after {self.last_index}")
+        self._entries.append(entry)
+
+    def truncate_from(self, index: int):
+        """Deletes entries from index onwards."""
+        del self._entries[max(0, index - self.first_index):]
+
+    def compact(self, index: int, term: int):
+        """Drops entries up to index, which a snapshot now covers."""
+        if index <= self.snapshot_index:
+            return
+        del self._entries[:min(len(self._entries), index - self.snapshot_index)]
+        self.snapshot_index = index
+        self.snapshot_term = term
+
+    def reset(self, index: int, term: int):
+        """Drops every entry; the log restarts after an installed snapshot."""
+        self._entries.clear()
+        self.snapshot_index = index
+        self.snapshot_term = term
+
+    def begin_sync(self) -> Optional[Callable[[], None]]:
+        """Returns the job that makes every appended entry durable, or None if there is none."""
+        return None
+
+    def sync(self):
+        job = self.begin_sync()
+        if job is not None:
+            job()
+
+    def close(self):
+        pass
+
+    # ── Snapshot / metadata ──
+
+    def save_snapshot(self, index: int, term: int, state: Dict[str, Any]):
+        if self._snapshot is not None and index < self._snapshot["last_included_index"]:
+            return  # a newer snapshot (e.g. an installed one) was stored meanwhile
+        self._snapshot = {"last_included_index": index, "last_included_term": term, "state": state}
+
+    def load_snapshot(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot
+
+    def save_meta(self, current_term: int, voted_for: Optional[str]):
+        self._meta = {"current_term": current_term, "voted_for": voted_for}
+
+    def load_meta(self) -> Dict[str, Any]:
+        return dict(self._meta)
+
+
+class _Segment:
+    __slots__ = ("first_index", "log_path", "idx_path", "offsets", "terms", "end")
+
+    def __init__(self, data_dir: str, first_index: int):
+        self.first_index = first_index
+        self.log_path = os.path.join(data_dir, f"segment-{first_index:020d}.log")
+        self.idx_path = os.path.join(data_dir, f"segment-{first_index:020d}.idx")
+        self.offsets = array("Q")
+        self.terms = array("Q")
+        self.end = 0  # byte length of the valid records
+
+    @property
+    def last_index(self) -> int:
+        return self.first_index + len(self.offsets) - 1
+
+
+class SegmentedRaftLog(RaftLog):
+    """
+    Durable Raft log. Only the per-entry (offset, term) index lives in memory;
+    entries are read back from segment files, with the most recent
+    cache_entries kept in an LRU so the leader rarely touches disk.
+    """
+
+    persistent = True
+
+    def __init__(self, data_dir: str, segment_max_entries: int = 4096,
+                 segment_max_bytes: int = 16 * 1024 * 1024, cache_entries: int = 1024, fsync: bool = True):
+        super().__init__()
+        from .raft_consensus import LogEntry
+        self._entry_type = LogEntry
+        self.data_dir = data_dir
+        self.segment_max_entries = segment_max_entries
+        self.segment_max_bytes = segment_max_bytes
+        self.cache_entries = cache_entries
+        self.fsync = fsync
+        os.makedirs(data_dir, exist_ok=True)
+
+        self._segments: List[_Segment] = []
+        self._cache: "OrderedDict[int, Any]" = OrderedDict()
+        self._log_file = None
+        self._idx_file = None
+        self._dirty = False
+        # Duplicated descriptors of closed segment files still awaiting fsync
+        self._unsynced_fds: List[int] = []
+        # JSON files may be written from worker threads; versions keep meta writes in order
+        self._json_lock = threading.Lock()
+        self._meta_version = 0
+        self._meta_queued = 0
+        self._meta_written = 0
+
+        self._snapshot = self._read_json("snapshot.json")
+        if self._snapshot is not None:
+            self.snapshot_index = self._snapshot["last_included_index"]
+            self.snapshot_term = self._snapshot["last_included_term"]
+        self._meta = self._read_json("meta.json") or {}
+        self._open_segments()
+
+    # ── Recovery ──
+
+    def _open_segments(self):
+        names = sorted(n for n in os.listdir(self.data_dir) if n.startswith("segment-") and n.endswith(".log"))
+        for name in names:
+            segment = _Segment(self.data_dir, int(name[len("segment-"):-len(".log")]))
+            expected = self.last_index + 1 if self._segments else None
+            if expected is not None and segment.first_index != expected:
+                # A gap means a later segment is orphaned by an earlier truncation
+                self._delete_segment(segment)
+                continue
+            self._recover_segment(segment)
+            if not segment.offsets or segment.last_index <= self.snapshot_index:
+                self._delete_segment(segment)
+                continue
+            if not self._segments and segment.first_index > self.first_index:
+                logger.error(f"[RAFT] Log segments start at {segment.first_index}, after snapshot {self.snapshot_index}")
+                self._delete_segment(segment)
+                continue
+            self._segments.append(segment)
+        if self._segments:
+            self._open_files(self._segments[-1])
+
+    def _recover_segment(self, segment: _Segment):
+        """Loads a segment's index, drops torn records and re-indexes records missing from it."""
+        if os.path.exists(segment.idx_path):
+            with open(segment.idx_path, "rb") as f:
+                raw = f.read()
+            for pos in range(0, len(raw) - len(raw) % _INDEX_RECORD.size, _INDEX_RECORD.size):
+                offset, term = _INDEX_RECORD.unpack_from(raw, pos)
+                segment.offsets.append(offset)
+                segment.terms.append(term)
+
+        with open(segment.log_path, "rb") as f:
+            data = f.read()
+
+        # Verify indexed records from the tail back; keep the longest valid prefix
+        while segment.offsets:
+            record = self._decode_record(data, segment.offsets[-1])
+            if record is not None:
+                segment.end = record[1]
+                break
+            segment.offsets.pop()
+            segment.terms.pop()
+
+        # Records written after the last index flush
+        position = segment.end
+        while True:
+            record = self._decode_record(data, position)
+            if record is None:
+                break
+            entry, next_position = record
+            segment.offsets.append(position)
+            segment.terms.append(entry["term"])
+            position = segment.end = next_position
+
+        with open(segment.log_path, "r+b") as f:
+            f.truncate(segment.end)
+        with open(segment.idx_path, "wb") as f:
+            for offset, term in zip(segment.offsets, segment.terms):
+                f.write(_INDEX_RECORD.pack(offset, term))
+
+    @staticmethod
+    def _decode_record(data: bytes, offset: int):
+        if offset + _RECORD_HEADER.size > len(data):
+            return None
+        length, crc = _RECORD_HEADER.unpack_from(data, offset)
+        start = offset + _RECORD_HEADER.size
+        body = data[start:start + length]
+        if len(body) != length or zlib.crc32(body) != crc:
+            return None
+        return json.loads(body), start + length
+
+    # ── Reads ──
+
+    def _locate(self, index: int) -> _Segment:
+        for segment in reversed(self._segments):
+            if segment.first_index <= index:
+                return segment
+        raise IndexError(index)
+
+    @property
+    def last_index(self) -> int:
+        if self._segments:
+            return self._segments[-1].last_index
+        return self.snapshot_index
+
+    def __iter__(self) -> Iterator[Any]:
+        for index in range(self.first_index, self.last_index + 1):
+            yield self[index]
+
+    def __getitem__(self, index: int) -> Any:
+        if not self.first_index <= index <= self.last_index:
+            raise IndexError(f"Log index {index} outside [{self.first_index}, {self.last_index}]")
+        entry = self._cache.get(index)
+        if entry is not None:
+            self._cache.move_to_end(index)
+            return entry
+
+        segment = self._locate(index)
+        self._flush_buffers()
+        with open(segment.log_path, "rb") as f:
+            f.seek(segment.offsets[index - segment.first_index])
+            length, _ = _RECORD_HEADER.unpack(f.read(_RECORD_HEADER.size))
+            entry = self._entry_type(**json.loads(f.read(length)))
+        self._cache_put(entry)
+        return entry
+
+    def term_at(self, index: int) -> Optional[int]:
+        if index == self.snapshot_index:
+            return self.snapshot_term
+        if self.first_index <= index <= self.last_index:
+            segment = self._locate(index)
+            return segment.terms[index - segment.first_index]
+        return None
+
+    def _cache_put(self, entry: Any):
+        self._cache[entry.index] = entry
+        self._cache.move_to_end(entry.index)
+        if len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+
+    # ── Writes ──
+
+    def append(self, entry: Any):
+        if entry.index != self.last_index + 1:
+            raise ValueError(f"Non-contiguous append: {entry.index} after {self.last_index}")
+
+        segment = self._segments[-1] if self._segments else None
+        if segment is None or len(segment.offsets) >= self.segment_max_entries or segment.end >= self.segment_max_bytes:
+            segment = self._roll_segment(entry.index)
+
+        body = json.dumps(asdict(entry)).encode()
+        self._log_file.write(_RECORD_HEADER.pack(len(body), zlib.crc32(body)))
+        self._log_file.write(body)
+        self._idx_file.write(_INDEX_RECORD.pack(segment.end, entry.term))
+        segment.offsets.append(segment.end)
+        segment.terms.append(entry.term)
+        segment.end += _RECORD_HEADER.size + len(body)
+        self._dirty = True
+        self._cache_put(entry)
+
+    def _roll_segment(self, first_index: int) -> _Segment:
+        self._close_files()
+        segment = _Segment(self.data_dir, first_index)
+        self._segments.append(segment)
+        self._open_files(segment)
+        return segment
+
+    def _open_files(self, segment: _Segment):
+        self._log_file = open(segment.log_path, "ab")
+        self._idx_file = open(segment.idx_path, "ab")
+
+    def _flush_buffers(self):
+        if self._log_file is not None:
+            self._log_file.flush()
+            self._idx_file.flush()
+
+    def _detach_unsynced(self):
+        """Flushes the open segment and queues its files for the next fsync job."""
+        if not self._dirty or self._log_file is None:
+            return
+        self._flush_buffers()
+        if self.fsync:
+            # Duplicates stay valid if the segment is rolled or closed before the job runs
+            self._unsynced_fds += [os.dup(self._log_file.fileno()), os.dup(self._idx_file.fileno())]
+        self._dirty = False
+
+    def begin_sync(self) -> Optional[Callable[[], None]]:
+        """
+        Flushes appended entries to the OS and returns the fsync (one per file,
+        not per entry), plus any pending term/vote write, as a job that may run
+        on another thread.
+        """
+        self._detach_unsynced()
+        fds, self._unsynced_fds = self._unsynced_fds, []
+        meta = None
+        if self._meta_version > self._meta_queued:
+            self._meta_queued = self._meta_version
+            meta = (self._meta_version, dict(self._meta))
+        if not fds and meta is None:
+            return None
+
+        def sync_files():
+            try:
+                if meta is not None:
+                    self._write_meta(*meta)
+                for fd in fds:
+                    os.fsync(fd)
+            finally:
+                for fd in fds:
+                    os.close(fd)
+        return sync_files
+
+    def truncate_from(self, index: int):
+        self._close_files()
+        while self._segments and self._segments[-1].first_index >= index:
+            self._delete_segment(self._segments.pop())
+        if self._segments and index <= self._segments[-1].last_index:
+            segment = self._segments[-1]
+            keep = index - segment.first_index
+            segment.end = segment.offsets[keep]
+            del segment.offsets[keep:]
+            del segment.terms[keep:]
+            with open(segment.log_path, "r+b") as f:
+                f.truncate(segment.end)
+            with open(segment.idx_path, "r+b") as f:
+                f.truncate(keep * _INDEX_RECORD.size)
+        for cached in [i for i in self._cache if i >= index]:
+            del self._cache[cached]
+        if self._segments:
+            self._open_files(self._segments[-1])
+
+    def compact(self, index: int, term: int):
+        if index <= self.snapshot_index:
+            return
+        self.snapshot_index = index
+        self.snapshot_term = term
+        while self._segments and self._segments[0].last_index <= index:
+            segment = self._segments.pop(0)
+            if not self._segments:
+                self._close_files()
+            self._delete_segment(segment)
+        for cached in [i for i in self._cache if i <= index]:
+            del self._cache[cached]
+
+    def reset(self, index: int, term: int):
+        self._close_files()
+        while self._segments:
+            self._delete_segment(self._segments.pop())
+        self._cache.clear()
+        self.snapshot_index = index
+        self.snapshot_term = term
+
+    def _delete_segment(self, segment: _Segment):
+        for path in (segment.log_path, segment.idx_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _close_files(self):
+        if self._log_file is not None:
+            self._detach_unsynced()
+            self._log_file.close()
+            self._idx_file.close()
+            self._log_file = None
+            self._idx_file = None
+
+    def close(self):
+        self._close_files()
+        self.sync()
+
+    # ── Snapshot / metadata ──
+
+    def _read_json(self, name: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.data_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _write_json(self, name: str, data: Dict[str, Any]):
+        """Atomic replace: write a temp file, fsync, rename."""
+        path = os.path.join(self.data_dir, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def save_snapshot(self, index: int, term: int, state: Dict[str, Any]):
+        # May run on a worker thread while the event loop installs a snapshot
+        with self._json_lock:
+            previous = self._snapshot
+            super().save_snapshot(index, term, state)
+            if self._snapshot is not previous:
+                self._write_json("snapshot.json", self._snapshot)
+
+    def save_meta(self, current_term: int, voted_for: Optional[str]):
+        # Written to disk by the next begin_sync()/sync()
+        super().save_meta(current_term, voted_for)
+        self._meta_version += 1
+
+    def _write_meta(self, version: int, meta: Dict[str, Any]):
+        with self._json_lock:
+            # A later job may already have written a newer term/vote
+            if version > self._meta_written:
+                self._write_json("meta.json", meta)
+                self._meta_written = version
@@ -0,0 +1,292 @@
+"""
+Deterministic in-process Raft cluster simulation.
+
+Runs 3-7 RaftConsensus nodes in one process on an event loop with a virtual
+clock: asyncio.sleep() and timers advance simulated time instantly instead of
+waiting, so a run with a given seed is reproducible and seconds of cluster time
+take milliseconds. Messages go through SimulatedNetwork, which injects delay,
+loss, partitions and crashed nodes.
+
+    sim = RaftSimulation(num_nodes=5, seed=7, loss_rate=0.01)
+
+    async def scenario():
+        await sim.start()
+        await sim.wait_for_leader()
+        await sim.run_workload(2000, concurrency=64)
+        await sim.crash_leader()
+        await sim.run_workload(2000, concurrency=64)
+        await sim.stop()
+
+    sim.run(scenario())
+    print(sim.report())
+
+Only RaftConsensus is simulated; consensus.ClusterNode (pysyncobj) owns its
+own TCP transport and threads and cannot be driven by a virtual clock.
+"""
+
+import asyncio
+import json
+import logging
+import random
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from .raft_consensus import ConsensusResult, RaftConsensus, RaftNodeState
+from .raft_log import RaftLog
+
+logger = logging.getLogger("hanerma.raft")
+
+
+class _VirtualSelector:
+    """Selector wrapper: instead of blocking for `timeout`, jump the virtual clock forward."""
+
+    def __init__(self, selector, loop: "VirtualTimeEventLoop"):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("Simulation deadlock: nothing is scheduled")
+        if timeout > 0:
+            self._loop._virtual_time += timeout
+        return self._selector.select(0)
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time() is simulated and advances only when every task is waiting."""
+
+    def __init__(self):
+        super().__init__()
+        self._virtual_time = 0.0
+        self._selector = _VirtualSelector(self._selector, self)
+
+    def time(self) -> float:
+        return self._virtual_time
+
+
+class SimulatedNetwork:
+    """
+    RaftConsensus transport. Each RPC takes a random one-way delay in
+    [min_delay, max_delay] per direction; a lost, partitioned or crashed
+    RPC returns None after rpc_timeout, like a TCP timeout.
+    """
+
+    def __init__(self, rng: random.Random, min_delay: float = 0.001, max_delay: float = 0.005,
+                 loss_rate: float = 0.0, rpc_timeout: float = 0.5):
+        self.rng = rng
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.loss_rate = loss_rate
+        self.rpc_timeout = rpc_timeout
+
+        self.nodes: Dict[str, RaftConsensus] = {}
+        self.crashed: Set[str] = set()
+        self._groups: Optional[List[Set[str]]] = None
+
+        self.messages_sent = 0
+        self.messages_dropped = 0
+
+    def partition(self, *groups: Iterable[str]):
+        """Only nodes in the same group can talk to each other."""
+        self._groups = [set(group) for group in groups]
+
+    def heal(self):
+        self._groups = None
+
+    def _reachable(self, src: str, dst: str) -> bool:
+        if src in self.crashed or dst in self.crashed:
+            return False
+        if self._groups is None:
+            return True
+        return any(src in group and dst in group for group in self._groups)
+
+    def _delivered(self, src: str, dst: str) -> bool:
+        return self._reachable(src, dst) and self.rng.random() >= self.loss_rate
+
+    async def _drop(self) -> None:
+        self.messages_dropped += 1
+        await asyncio.sleep(self.rpc_timeout)
+        return None
+
+    async def send(self, src: str, dst: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        self.messages_sent += 1
+        if not self._delivered(src, dst):
+            return await self._drop()
+        await asyncio.sleep(self.rng.uniform(self.min_delay, self.max_delay))
+        if not self._reachable(src, dst):
+            return await self._drop()
+
+        # JSON round trips: nodes never share mutable objects
+        response = await self.nodes[dst].serve_rpc(json.loads(json.dumps(payload)))
+
+        await asyncio.sleep(self.rng.uniform(self.min_delay, self.max_delay))
+        if not self._delivered(dst, src):
+            return await self._drop()
+        return json.loads(json.dumps(response))
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class RaftSimulation:
+    """
+    A simulated cluster plus the metrics needed to compare consensus changes:
+    commit throughput, commit latency percentiles and leader election time,
+    all in simulated seconds.
+    """
+
+    def __init__(self, num_nodes: int = 3, seed: int = 0, min_delay: float = 0.001, max_delay: float = 0.005,
+                 loss_rate: float = 0.0, rpc_timeout: float = 0.5, **node_options):
+        if not 1 <= num_nodes <= 7:
+            raise ValueError("RaftSimulation supports 1 to 7 nodes")
+        self.rng = random.Random(seed)
+        self.loop = VirtualTimeEventLoop()
+        self.network = SimulatedNetwork(self.rng, min_delay, max_delay, loss_rate, rpc_timeout)
+        self.node_options = node_options
+
+        self.node_ids = [f"node{i}" for i in range(num_nodes)]
+        # Stand-in for each node's disk: survives crash/restart
+        self._storage: Dict[str, RaftLog] = {node_id: RaftLog() for node_id in self.node_ids}
+        self.nodes: Dict[str, RaftConsensus] = {node_id: self._make_node(node_id) for node_id in self.node_ids}
+
+        self.commit_latencies: List[float] = []
+        self.election_times: List[float] = []
+        self.failed_proposals = 0
+        self._workload_time = 0.0
+
+    def _make_node(self, node_id: str) -> RaftConsensus:
+        node = RaftConsensus(
+            node_id,
+            {peer: {} for peer in self.node_ids if peer != node_id},
+            transport=self.network,
+            clock=self.loop.time,
+            rng=random.Random(self.rng.random()),
+            log_store=self._storage[node_id],
+            **self.node_options
+        )
+        self.network.nodes[node_id] = node
+        return node
+
+    def now(self) -> float:
+        return self.loop.time()
+
+    def run(self, coro) -> Any:
+        """Runs a scenario coroutine to completion in simulated time."""
+        return self.loop.run_until_complete(coro)
+
+    def close(self):
+        self.loop.close()
+
+    async def start(self):
+        for node in self.nodes.values():
+            await node.start()
+
+    async def stop(self):
+        for node_id, node in self.nodes.items():
+            if node_id not in self.network.crashed:
+                await node.stop()
+
+    # ── Fault injection ──
+
+    def leader(self) -> Optional[RaftConsensus]:
+        """The live leader with the highest term (a deposed leader may not know it yet)."""
+        leaders = [node for node_id, node in self.nodes.items()
+                   if node.state == RaftNodeState.LEADER and node_id not in self.network.crashed]
+        return max(leaders, key=lambda node: node.current_term) if leaders else None
+
+    async def wait_for_leader(self, timeout: float = 30.0) -> str:
+        deadline = self.now() + timeout
+        while self.now() < deadline:
+            leader = self.leader()
+            if leader is not None:
+                return leader.node_id
+            await asyncio.sleep(0.01)
+        raise TimeoutError(f"No leader elected within {timeout}s of simulated time")
+
+    async def crash(self, node_id: str):
+        self.network.crashed.add(node_id)
+        await self.nodes[node_id].stop()
+
+    async def restart(self, node_id: str):
+        """Restarts a crashed node from its persisted log, term and vote."""
+        self.network.crashed.discard(node_id)
+        self.nodes[node_id] = self._make_node(node_id)
+        await self.nodes[node_id].start()
+
+    async def crash_leader(self) -> float:
+        """Crashes the current leader and returns how long the cluster took to elect a new one."""
+        old_leader = await self.wait_for_leader()
+        crashed_at = self.now()
+        await self.crash(old_leader)
+        while True:
+            new_leader = await self.wait_for_leader()
+            if new_leader != old_leader:
+                break
+            await asyncio.sleep(0.01)
+        election_time = self.now() - crashed_at
+        self.election_times.append(election_time)
+        return election_time
+
+    def partition(self, *groups: Iterable[str]):
+        self.network.partition(*groups)
+
+    def heal(self):
+        self.network.heal()
+
+    # ── Workload ──
+
+    async def propose(self, operation: Dict[str, Any]) -> ConsensusResult:
+        """Proposes through the current leader and records commit latency."""
+        leader = self.leader()
+        if leader is None:
+            self.failed_proposals += 1
+            return ConsensusResult(success=False, term=0, error="No leader")
+        started = self.now()
+        result = await leader.propose_operation(operation)
+        if result.success:
+            self.commit_latencies.append(self.now() - started)
+        else:
+            self.failed_proposals += 1
+        return result
+
+    async def run_workload(self, num_operations: int, concurrency: int = 32, retries: int = 3) -> Dict[str, Any]:
+        """Commits num_operations puts with `concurrency` clients, retrying failed proposals."""
+        started = self.now()
+        next_op = iter(range(num_operations))
+
+        async def client():
+            for op in next_op:
+                for _ in range(retries + 1):
+                    result = await self.propose({"type": "put", "key": f"k{op}", "value": op})
+                    if result.success:
+                        break
+                    await self.wait_for_leader()
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        self._workload_time += self.now() - started
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        latencies_ms = [latency * 1000 for latency in self.commit_latencies]
+        return {
+            "nodes": len(self.nodes),
+            "simulated_time_s": self.now(),
+            "committed": len(self.commit_latencies),
+            "failed_proposals": self.failed_proposals,
+            "throughput_ops_per_s": len(self.commit_latencies) / self._workload_time if self._workload_time else 0.0,
+            "commit_latency_ms": {
+                "p50": _percentile(latencies_ms, 0.50),
+                "p95": _percentile(latencies_ms, 0.95),
+                "p99": _percentile(latencies_ms, 0.99),
+                "max": max(latencies_ms, default=0.0),
+            },
+            "election_time_s": list(self.election_times),
+            "messages_sent": self.network.messages_sent,
+            "messages_dropped": self.network.messages_dropped,
+        }
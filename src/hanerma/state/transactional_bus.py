@@ -1,22 +1,166 @@
+import asyncio
+import logging
+import queue
 import sqlite3
 import json
+import threading
 import time
 import uuid
-from typing import Any, Dict, List, Optional
-from .models import HANERMAState
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from pydantic import BaseModel
+from hanerma.core.exceptions import EventWriteError
+from .models import HANERMAState, SharedMemory
+
+logger = logging.getLogger("hanerma.state")
+
+# Durability levels for record_step
+DURABILITY_FSYNC = "fsync"      # commit + fsync inside every record_step call
+DURABILITY_BATCHED = "batched"  # background group commit, fsync once per batch
+DURABILITY_ASYNC = "async"      # background group commit, fsync left to the OS
+
+_INSERT_EVENT = (
+    "INSERT INTO events (trace_id, step_index, event_type, payload, state_hash, full_state, state_delta, is_checkpoint, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _insert_rows(conn: sqlite3.Connection, lock: threading.Lock, rows: List[tuple]):
+    """Commits rows in a single transaction."""
+    with lock, conn:
+        conn.executemany(_INSERT_EVENT, rows)
+
+
+def _writer_loop(bus_ref: "weakref.ref", rows: "queue.Queue[Optional[tuple]]", conn: sqlite3.Connection,
+                 lock: threading.Lock, max_batch_size: int):
+    """
+    Group-commit loop: everything queued while a batch was being written goes into the next one.
+    Holds the bus only weakly, so an unclosed bus can still be garbage collected.
+    """
+    # Traces whose earlier rows failed: their queued deltas have no base until the next checkpoint
+    broken: Set[str] = set()
+    while True:
+        row = rows.get()
+        batch = [row]
+        while len(batch) < max_batch_size:
+            try:
+                batch.append(rows.get_nowait())
+            except queue.Empty:
+                break
+
+        pending = []
+        skipped = 0
+        for r in batch:
+            if r is None:
+                continue
+            if r[7]:
+                broken.discard(r[0])
+            elif r[0] in broken:
+                skipped += 1
+                continue
+            pending.append(r)
+
+        error: Optional[Exception] = None
+        if pending:
+            try:
+                _insert_rows(conn, lock, pending)
+            except Exception as e:
+                error = e
+                skipped += len(pending)
+                broken.update(r[0] for r in pending)
+        if error is not None or skipped:
+            bus = bus_ref()
+            if bus is not None:
+                bus._writes_failed({r[0] for r in batch if r is not None}, skipped, error)
+            else:
+                logger.error(f"Failed to commit {skipped} event(s): {error}")
+            del bus
+        for _ in batch:
+            rows.task_done()
+        if None in batch:
+            return
+
+
+def _shutdown(rows: "queue.Queue[Optional[tuple]]", writer: Optional[threading.Thread],
+              conn: sqlite3.Connection, lock: threading.Lock):
+    """Drains the writer and closes the connection; runs on close(), garbage collection or exit."""
+    if writer is not None and writer.is_alive():
+        rows.put(None)
+        if writer is threading.current_thread():
+            return
+        writer.join()
+    with lock:
+        conn.close()
+
+
+class _TraceCursor:
+    """What was last recorded for a trace; the base the next delta is computed against."""
+    __slots__ = ("history", "memory", "since_checkpoint")
+
+    def __init__(self, history: List[Any], memory: Dict[str, str]):
+        self.history = history
+        self.memory = memory
+        self.since_checkpoint = 0
+
 
 class TransactionalEventBus:
     """
     Ensures every atomic step of the HANERMA execution is persisted.
     Allows for sub-2s recovery from crashes/OOM by rebuilding state from the bus.
     Enhanced with MVCC rollback capabilities.
+
+    A single persistent WAL-mode connection is shared by all operations. With
+    "batched" or "async" durability, record_step only enqueues the row; a writer
+    thread drains the queue and commits everything pending in one transaction
+    (group commit). Reads flush first, so they always see recorded steps. If a
+    batch fails to commit, the next flush() or record_step() raises
+    EventWriteError and the affected traces restart with a full checkpoint.
+
+    State snapshots are delta-encoded per trace: a row stores either a full
+    checkpoint (every checkpoint_interval steps, or whenever history was not
+    simply appended to) or the history entries appended and shared-memory keys
+    changed since the previous row of the same trace. Rebuilding a state reads
+    the nearest checkpoint plus at most checkpoint_interval deltas.
     """
-    def __init__(self, db_path: str = "hanerma_state.db"):
+    def __init__(self, db_path: str = "hanerma_state.db", durability: str = DURABILITY_BATCHED,
+                 max_batch_size: int = 512, checkpoint_interval: int = 32, max_tracked_traces: int = 1024):
+        if durability not in (DURABILITY_FSYNC, DURABILITY_BATCHED, DURABILITY_ASYNC):
+            raise ValueError(f"Unknown durability level: {durability}")
         self.db_path = db_path
+        self.durability = durability
+        self.max_batch_size = max_batch_size
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        self.max_tracked_traces = max_tracked_traces
+
+        # Delta bases per trace (LRU); an untracked trace starts with a checkpoint
+        self._cursors: "OrderedDict[str, _TraceCursor]" = OrderedDict()
+        self._record_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "PRAGMA synchronous=OFF" if durability == DURABILITY_ASYNC else "PRAGMA synchronous=FULL"
+        )
         self._init_db()
 
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self._write_error: Optional[EventWriteError] = None
+        if durability != DURABILITY_FSYNC:
+            self._writer = threading.Thread(
+                target=_writer_loop,
+                args=(weakref.ref(self), self._queue, self._conn, self._lock, max_batch_size),
+                name="hanerma-event-writer", daemon=True,
+            )
+            self._writer.start()
+        # Flushes on close(), garbage collection or interpreter exit without keeping the bus alive
+        self._finalizer = weakref.finalize(self, _shutdown, self._queue, self._writer, self._conn, self._lock)
+
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock, self._conn as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS events (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -29,53 +173,188 @@ class TransactionalEventBus:
                     timestamp REAL
                 )
             """)
+            # Databases created before delta encoding: every old row is a full checkpoint
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+            if "state_delta" not in columns:
+                conn.execute("ALTER TABLE events ADD COLUMN state_delta TEXT")
+            if "is_checkpoint" not in columns:
+                conn.execute("ALTER TABLE events ADD COLUMN is_checkpoint INTEGER DEFAULT 1")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_trace ON events(trace_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_state_hash ON events(state_hash)")
 
     def record_step(self, trace_id: str, step_index: int, event_type: str, payload: Dict[str, Any], state: HANERMAState):
-        """Records a single atomic step to the database with state snapshot."""
+        """
+        Records a single atomic step to the database with a (delta-encoded) state snapshot.
+        Raises EventWriteError, without recording this step, if earlier steps failed to commit.
+        """
+        self._raise_write_error()
         state_hash = state.compute_hash()
-        full_state = json.dumps(state.to_dict())
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT INTO events (trace_id, step_index, event_type, payload, state_hash, full_state, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (trace_id, step_index, event_type, json.dumps(payload), state_hash, full_state, time.time())
-            )
+        with self._record_lock:
+            full_state, state_delta = self._encode_state(trace_id, state)
+            row = (trace_id, step_index, event_type, json.dumps(payload), state_hash,
+                   full_state, state_delta, 1 if full_state is not None else 0, time.time())
+            # Enqueue under the lock so rows of a trace are committed in delta order
+            if self._writer is None or self._closed:
+                try:
+                    self._write_batch([row])
+                except Exception:
+                    # The cursor already advanced past this row: restart the trace with a checkpoint
+                    self._cursors.pop(trace_id, None)
+                    raise
+            else:
+                self._queue.put(row)
+
+    def _writes_failed(self, trace_ids: Set[str], count: int, error: Optional[Exception]):
+        """Called by the writer thread when queued rows could not be committed."""
+        reason = error if error is not None else "an earlier batch of the same trace was lost"
+        logger.error(f"Failed to commit {count} event(s): {reason}")
+        with self._record_lock:
+            for trace_id in trace_ids:
+                self._cursors.pop(trace_id, None)
+            if self._write_error is None:
+                self._write_error = EventWriteError(f"{count} recorded step(s) could not be committed: {reason}")
+                self._write_error.__cause__ = error
+            else:
+                self._write_error = EventWriteError(f"{self._write_error} (and {count} more)")
+
+    def _raise_write_error(self):
+        with self._record_lock:
+            error, self._write_error = self._write_error, None
+        if error is not None:
+            raise error
+
+    def _encode_state(self, trace_id: str, state: HANERMAState) -> Tuple[Optional[str], Optional[str]]:
+        """Returns (full_state, None) for a checkpoint or (None, state_delta) against the trace's previous row."""
+        history = list(state.history)
+        memory = state.shared_memory.root if isinstance(state.shared_memory, SharedMemory) else dict(state.shared_memory)
+        memory_snapshot = {key: json.dumps(value, sort_keys=True) for key, value in memory.items()}
+
+        cursor = self._cursors.get(trace_id)
+        base_len = len(cursor.history) if cursor is not None else 0
+        is_checkpoint = (
+            cursor is None
+            or cursor.since_checkpoint + 1 >= self.checkpoint_interval
+            or len(history) < base_len
+            or history[:base_len] != cursor.history
+        )
+
+        if is_checkpoint:
+            cursor = _TraceCursor(history, memory_snapshot)
+            encoded = (json.dumps(state.to_dict()), None)
+        else:
+            delta = {
+                "h": [e.model_dump() if isinstance(e, BaseModel) else e for e in history[base_len:]],
+                "ms": {k: memory[k] for k, v in memory_snapshot.items() if cursor.memory.get(k) != v},
+                "md": [k for k in cursor.memory if k not in memory_snapshot],
+            }
+            cursor.history = history
+            cursor.memory = memory_snapshot
+            cursor.since_checkpoint += 1
+            encoded = (None, json.dumps(delta))
+
+        self._cursors[trace_id] = cursor
+        self._cursors.move_to_end(trace_id)
+        if len(self._cursors) > self.max_tracked_traces:
+            self._cursors.popitem(last=False)
+        return encoded
+
+    @staticmethod
+    def _apply_delta(state_dict: Dict[str, Any], delta_json: str) -> Dict[str, Any]:
+        """Applies a stored delta to a state dict in place."""
+        delta = json.loads(delta_json)
+        state_dict.setdefault("history", []).extend(delta["h"])
+        memory = state_dict.setdefault("shared_memory", {})
+        for key in delta["md"]:
+            memory.pop(key, None)
+        memory.update(delta["ms"])
+        return state_dict
+
+    def _rebuild_state(self, trace_id: str, event_id: int) -> Optional[Dict[str, Any]]:
+        """Rebuilds the state dict of one event from its nearest checkpoint plus deltas."""
+        checkpoint = self._conn.execute(
+            "SELECT id, full_state FROM events WHERE trace_id = ? AND id <= ? AND is_checkpoint = 1 ORDER BY id DESC LIMIT 1",
+            (trace_id, event_id)
+        ).fetchone()
+        if checkpoint is None:
+            return None
+        state_dict = json.loads(checkpoint[1])
+        for (delta_json,) in self._conn.execute(
+            "SELECT state_delta FROM events WHERE trace_id = ? AND id > ? AND id <= ? ORDER BY id ASC",
+            (trace_id, checkpoint[0], event_id)
+        ):
+            state_dict = self._apply_delta(state_dict, delta_json)
+        return state_dict
+
+    def _write_batch(self, rows: List[tuple]):
+        """Commits rows in a single transaction."""
+        _insert_rows(self._conn, self._lock, rows)
+
+    def flush(self):
+        """Blocks until every recorded step is committed; raises EventWriteError if some could not be."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.join()
+        self._raise_write_error()
+
+    async def aflush(self):
+        """flush() without blocking the event loop."""
+        await asyncio.to_thread(self.flush)
+
+    def close(self):
+        """Flushes pending steps, stops the writer and closes the connection."""
+        if self._closed:
+            return
+        self._closed = True
+        self._finalizer()
 
     def recover_trace(self, trace_id: str) -> List[Dict[str, Any]]:
         """Retrieves all steps for a given trace to reconstruct state."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "SELECT step_index, event_type, payload, state_hash, full_state FROM events WHERE trace_id = ? ORDER BY step_index ASC",
+        self.flush()
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, step_index, event_type, payload, state_hash, full_state, state_delta, is_checkpoint "
+                "FROM events WHERE trace_id = ? ORDER BY id ASC",
                 (trace_id,)
             )
-            return [
-                {
-                    "step_index": row[0],
-                    "event_type": row[1],
-                    "payload": json.loads(row[2]),
-                    "state_hash": row[3],
-                    "full_state": json.loads(row[4])
-                }
-                for row in cursor.fetchall()
-            ]
+            steps = []
+            state_dict: Optional[Dict[str, Any]] = None
+            for row in cursor.fetchall():
+                if row[7] or state_dict is None:
+                    state_dict = json.loads(row[5]) if row[5] is not None else {"history": [], "shared_memory": {}}
+                else:
+                    # Each step gets its own snapshot; earlier ones stay untouched
+                    state_dict = self._apply_delta({
+                        "history": list(state_dict["history"]),
+                        "shared_memory": dict(state_dict["shared_memory"]),
+                    }, row[6])
+                steps.append({
+                    "step_index": row[1],
+                    "event_type": row[2],
+                    "payload": json.loads(row[3]),
+                    "state_hash": row[4],
+                    "full_state": state_dict
+                })
+        steps.sort(key=lambda step: step["step_index"])
+        return steps
 
     def get_last_valid_state(self, trace_id: str, failed_step: int) -> Optional[HANERMAState]:
         """Finds the last valid state before a failed step for MVCC rollback."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "SELECT full_state FROM events WHERE trace_id = ? AND step_index < ? ORDER BY step_index DESC LIMIT 1",
+        self.flush()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM events WHERE trace_id = ? AND step_index < ? ORDER BY step_index DESC, id DESC LIMIT 1",
                 (trace_id, failed_step)
-            )
-            row = cursor.fetchone()
-            if row:
-                state_dict = json.loads(row[0])
-                return HANERMAState.from_dict(state_dict)
+            ).fetchone()
+            if not row:
+                return None
+            state_dict = self._rebuild_state(trace_id, row[0])
+        if state_dict is None:
             return None
+        return HANERMAState.from_dict(state_dict)
 
     def get_latest_trace_id(self) -> Optional[str]:
         """Finds the most recent trace ID for auto-recovery."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("SELECT trace_id FROM events ORDER BY timestamp DESC LIMIT 1")
+        self.flush()
+        with self._lock:
+            cursor = self._conn.execute("SELECT trace_id FROM events ORDER BY timestamp DESC LIMIT 1")
             row = cursor.fetchone()
             return row[0] if row else None
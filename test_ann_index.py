@@ -0,0 +1,169 @@
+"""Test: Auto-upgrading ANN index (flat → IVF-Flat / HNSW)"""
+import importlib.util
+import os
+import gc
+import sys
+import tempfile
+import threading
+
+import faiss
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__ / hanerma.memory.__init__
+ann = load_module("hanerma.memory.providers.ann_index", "hanerma/memory/providers/ann_index.py")
+faiss_vector = load_module("hanerma.memory.providers.faiss_vector", "hanerma/memory/providers/faiss_vector.py")
+
+DIM = 32
+
+
+def clustered_vectors(n, seed=0, centers=64):
+    rng = np.random.default_rng(seed)
+    means = rng.normal(size=(centers, DIM)).astype(np.float32) * 4
+    return (means[rng.integers(0, centers, n)] + rng.normal(size=(n, DIM))).astype(np.float32)
+
+
+def recall_at_k(index, data, queries, k=10):
+    exact = faiss.IndexFlatL2(DIM)
+    exact.add(data)
+    _, truth = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    return np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+
+
+def test_upgrade_to_ivf():
+    print("\n=== Test 1: Flat → IVF-Flat at threshold ===")
+    policy = ann.IndexPolicy(kind="ivf", upgrade_threshold=5000, nprobe=8, background=False)
+    index = ann.AutoUpgradingIndex(DIM, "L2", policy)
+    data = clustered_vectors(8000)
+
+    index.add(data[:4000])
+    assert index.kind == "flat"
+    index.add(data[4000:])
+    assert index.kind == "ivf" and index.ntotal == 8000 and index.trained_on == 8000
+    assert index.index.nprobe == 8
+    print(f"  ✓ Upgraded to IVF with {index.index.nlist} lists")
+
+    # Ids survive the rebuild
+    assert np.allclose(index.reconstruct_n(0, 8000), data)
+    recall = recall_at_k(index, data, data[:200])
+    assert recall >= 0.9, recall
+    print(f"  ✓ recall@10 = {recall:.3f} at nprobe=8")
+
+    index.set_search_params(nprobe=index.index.nlist)
+    assert recall_at_k(index, data, data[:200]) == 1.0
+    print("  ✓ nprobe=nlist is exact")
+
+    # Retrain once the store grows retrain_growth times
+    index.add(clustered_vectors(8000 * 7, seed=1))
+    assert index.rebuilds == 2 and index.trained_on == 64000
+    print(f"  ✓ Retrained at {index.trained_on} vectors ({index.index.nlist} lists)")
+
+
+def test_upgrade_to_hnsw():
+    print("\n=== Test 2: Flat → HNSW ===")
+    policy = ann.IndexPolicy(kind="hnsw", upgrade_threshold=2000, ef_search=128, background=False)
+    index = ann.AutoUpgradingIndex(DIM, "L2", policy)
+    data = clustered_vectors(3000, seed=2)
+    index.add(data)
+    assert index.kind == "hnsw" and index.index.hnsw.efSearch == 128
+    recall = recall_at_k(index, data, data[:200])
+    assert recall >= 0.95, recall
+    index.add(clustered_vectors(30000, seed=3))
+    assert index.rebuilds == 1
+    print(f"  ✓ HNSW recall@10 = {recall:.3f}, no retraining on growth")
+
+
+def test_background_rebuild_keeps_serving():
+    print("\n=== Test 3: Background rebuild with concurrent adds/searches ===")
+    policy = ann.IndexPolicy(kind="ivf", upgrade_threshold=20000, copy_chunk=4096)
+    index = ann.AutoUpgradingIndex(DIM, "L2", policy)
+    data = clustered_vectors(30000, seed=4)
+    index.add(data[:20000])
+
+    errors = []
+
+    def reader():
+        try:
+            for i in range(50):
+                _, ids = index.search(data[i:i + 1], 5)
+                assert ids[0][0] >= 0
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for t in readers:
+        t.start()
+    for start in range(20000, 30000, 1000):
+        index.add(data[start:start + 1000])
+    for t in readers:
+        t.join()
+    index.wait_for_rebuild()
+
+    assert not errors, errors
+    assert index.kind == "ivf" and index.ntotal == 30000
+    assert np.allclose(index.reconstruct_n(0, 30000), data)
+    print("  ✓ Reads never blocked on training; vectors added mid-rebuild kept their ids")
+
+
+def test_provider_inner_product():
+    print("\n=== Test 4: FaissVectorProvider with policy ===")
+    policy = ann.IndexPolicy(kind="ivf", upgrade_threshold=3000, nprobe=64, background=False)
+    provider = faiss_vector.FaissVectorProvider(dimension=DIM, index_type="IP", index_policy=policy)
+    data = clustered_vectors(3000, seed=5)
+    faiss.normalize_L2(data)
+    for i, vector in enumerate(data):
+        provider.add_vector(vector, {"i": i})
+    stats = provider.get_stats()
+    assert stats["ann"]["kind"] == "ivf" and stats["total_vectors"] == 3000
+    hits = provider.search(data[42], k=3)
+    assert hits[0]["i"] == 42 and abs(hits[0]["score"] - 1.0) < 1e-4
+    print("  ✓ Provider upgraded to IVF (inner product) and finds exact match")
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def test_mmap_read_keeps_flat_base_off_the_heap():
+    print("\n=== Test: mmap=True read of a flat store stays out of RSS ===")
+    dim, n = 256, 90_000  # ~88 MB of vectors: below the default upgrade threshold, so still flat
+    with tempfile.TemporaryDirectory() as path:
+        index = ann.AutoUpgradingIndex(dim)
+        rng = np.random.default_rng(0)
+        for start in range(0, n, 10_000):
+            index.add(rng.random((10_000, dim), dtype=np.float32))
+        assert index.kind == "flat"
+        descriptor = index.write(path, 1)
+        query = index.reconstruct_n(123, 1)
+        del index
+        gc.collect()
+        size = os.path.getsize(os.path.join(path, descriptor["base"]))
+
+        before = resident_bytes()
+        restored = ann.AutoUpgradingIndex.read(path, descriptor, mmap=True)
+        grown = resident_bytes() - before
+        assert grown < size // 10, f"RSS grew {grown >> 20} MB for a {size >> 20} MB index"
+        _, ids = restored.search(query, 1)
+        assert ids[0][0] == 123 and restored.stats()["mmapped_base"] == n
+    print(f"  ✓ {size >> 20} MB index mapped, RSS +{grown >> 20} MB, searches hit the file")
+
+
+if __name__ == "__main__":
+    test_upgrade_to_ivf()
+    test_upgrade_to_hnsw()
+    test_background_rebuild_keeps_serving()
+    test_provider_inner_product()
+    test_mmap_read_keeps_flat_base_off_the_heap()
+    print("\nAll ANN index tests passed.")
@@ -0,0 +1,79 @@
+"""
+Test: ConsensusGateway write coalescing and compare-and-set
+
+Runs a single-node pysyncobj cluster (it elects itself immediately) and verifies:
+  1. Concurrent puts are committed as a few replicated_batch_put commands
+  2. compare_and_set / update give atomic read-modify-write
+  3. The op log is a bounded ring buffer with aggregate counters
+"""
+
+import importlib.util
+import os
+import threading
+
+# Direct-load consensus module (bypass broken hanerma.__init__)
+spec = importlib.util.spec_from_file_location(
+    "consensus",
+    os.path.join(os.path.dirname(__file__), "src", "hanerma", "orchestrator", "consensus.py"),
+)
+consensus = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(consensus)
+
+ADDR = "localhost:14361"
+
+
+def run_threads(target, args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_gateway_batching_and_cas():
+    print("\n=== Test: Coalesced Puts & Compare-and-Set ===")
+
+    mgr = consensus.ClusterManager(ADDR, [])
+    try:
+        mgr.wait_for_leader(timeout=10.0)
+        gw = consensus.ConsensusGateway(mgr, state_capacitor=None, coalesce_window=0.01)
+
+        run_threads(gw.put, [(f"step:{i}", {"i": i}) for i in range(64)])
+        stats = mgr.store.op_stats()
+        assert stats["keys_written"] == 64 and stats["put"] == 0
+        assert stats["batch_put"] < 64
+        assert gw.get("step:63") == {"i": 63}
+        print(f"  ✓ 64 concurrent puts committed as {stats['batch_put']} batch command(s)")
+
+        assert gw.compare_and_set("lock", None, {"owner": "a"})
+        assert not gw.compare_and_set("lock", None, {"owner": "b"})
+        assert not gw.compare_and_set("lock", {"owner": "b"}, {"owner": "c"})
+        assert gw.compare_and_set("lock", {"owner": "a"}, {"owner": "c"})
+        assert gw.get("lock") == {"owner": "c"}
+        print("  ✓ compare_and_set only swaps on a matching value")
+
+        run_threads(gw.update, [("counter", lambda v: (v or 0) + 1)] * 10)
+        assert gw.get("counter") == 10
+        print("  ✓ Concurrent update() calls never lose an increment")
+
+        gw.put("nullable", None)
+        assert not gw.compare_and_set("nullable", None, 1)  # default None means absent
+        assert gw.compare_and_set("nullable", None, None, expect_absent=False)
+        assert not gw.compare_and_set("missing", None, 1, expect_absent=False)
+        assert gw.update("nullable", lambda v: "set" if v is None else "unexpected", retries=1) == "set"
+        assert gw.get("nullable") == "set"
+        assert gw.update("missing", lambda v: "created" if v is None else "unexpected", retries=1) == "created"
+        print("  ✓ A stored null and a missing key are distinct CAS expectations")
+
+        store = consensus.ReplicatedStateStore(op_log_size=4)
+        for i in range(10):
+            store._record("put", key=str(i))
+        assert len(store.recent_ops()) == 4 and store.op_count() == 10
+        print("  ✓ Op log keeps the last N ops, counters keep totals")
+    finally:
+        mgr.destroy()
+
+
+if __name__ == "__main__":
+    test_gateway_batching_and_cas()
+    print("\nAll ConsensusGateway tests passed.")
@@ -0,0 +1,105 @@
+"""Test: Def-use DAG compiler and compiled-DAG LRU cache"""
+import ast
+import importlib.util
+import os
+import random
+import sys
+
+import networkx as nx
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__ / hanerma.orchestrator.__init__
+dag_mod = load_module("hanerma.orchestrator.dag", "hanerma/orchestrator/dag.py")
+
+SAMPLES = [
+    "x = 1\ny = x + 1\nz = x * y\nprint(z)",
+    "a = b = fetch()\nc = a + b\na = c\nlog(a, c)",
+    # Nested statements, self-reads, calls and names only read
+    "total = 0\nfor i in items:\n    total = total + i\n    emit(total)\nresult = summarize(total, items)",
+    "def f(x):\n    y = x\n    return y\nv = f(1)\nw = [v for v in range(3)]\nf(w)",
+    "",
+]
+
+
+def random_program(rng, statements=60, names=12):
+    lines = []
+    for _ in range(statements):
+        reads = " + ".join(f"v{rng.randrange(names)}" for _ in range(rng.randrange(1, 4)))
+        if rng.random() < 0.3:
+            lines.append(f"call({reads})")
+        else:
+            targets = " = ".join(f"v{rng.randrange(names)}" for _ in range(rng.randrange(1, 3)))
+            lines.append(f"{targets} = {reads}")
+    return "\n".join(lines)
+
+
+def pairwise_edges(graph):
+    """The original O(n^2) builder: an edge wherever one node writes what another reads."""
+    edges = set()
+    for a in graph.nodes:
+        for b in graph.nodes:
+            if a != b and graph.nodes[a]["data"]["writes"] & graph.nodes[b]["data"]["reads"]:
+                edges.add((a, b))
+    return edges
+
+
+def test_def_use_edges_match_pairwise():
+    print("\n=== Test 1: Def-use index builds the pairwise edge set ===")
+    rng = random.Random(7)
+    programs = SAMPLES + [random_program(rng) for _ in range(20)]
+    for source in programs:
+        graph = dag_mod.compile_dag(source)
+        assert set(graph.edges) == pairwise_edges(graph), source
+        expected = [ast.dump(s) for s in ast.walk(ast.parse(source)) if isinstance(s, (ast.Assign, ast.Expr))]
+        assert [ast.dump(graph.nodes[n]["data"]["ast_node"]) for n in graph.nodes] == expected
+    print(f"  ✓ Identical edges on {len(programs)} programs")
+
+
+def test_cache_hit_and_miss():
+    print("\n=== Test 2: Compiled DAG cache ===")
+    cache = dag_mod.DAGCache(maxsize=2)
+    source = SAMPLES[0]
+    first = cache.get(source)
+    second = cache.get(source)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Same DAG: nodes, edges, def-use index and the parsed statements themselves
+    assert list(first.nodes) == list(second.nodes) and set(first.edges) == set(second.edges)
+    assert first.graph == second.graph
+    assert all(first.nodes[n]["data"]["ast_node"] is second.nodes[n]["data"]["ast_node"] for n in first.nodes)
+
+    # Each caller gets a private copy
+    first.remove_edges_from(list(first.edges))
+    first.nodes["node_0"]["data"]["writes"].add("mutated")
+    first.graph["writers"]["x"].clear()
+    third = cache.get(source)
+    assert set(third.edges) == set(second.edges) and "mutated" not in third.nodes["node_0"]["data"]["writes"]
+    assert third.graph["writers"]["x"] == {"node_0"}
+
+    changed = cache.get(source + "\nprint(x)")
+    assert cache.misses == 2 and changed.number_of_nodes() == second.number_of_nodes() + 1
+    print("  ✓ Hit returns the same DAG as a fresh copy; changed source misses")
+
+    cache.get(SAMPLES[1])  # evicts the least recently used entry (the original source)
+    assert len(cache) == 2 and cache.misses == 3
+    cache.get(source + "\nprint(x)")
+    assert cache.misses == 3
+    cache.get(source)
+    assert cache.misses == 4
+    print("  ✓ Least recently used template is evicted")
+
+
+if __name__ == "__main__":
+    test_def_use_edges_match_pairwise()
+    test_cache_hit_and_miss()
+    print("\nAll DAG compiler tests passed.")
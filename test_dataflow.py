@@ -0,0 +1,132 @@
+"""Test: Ready-queue dataflow scheduler"""
+import asyncio
+import importlib.util
+import os
+import sys
+
+import networkx as nx
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__ / hanerma.orchestrator.__init__
+dataflow = load_module("hanerma.orchestrator.dataflow", "hanerma/orchestrator/dataflow.py")
+
+
+class MockAgents:
+    """Per-node async 'agents' that sleep, optionally fail, and log start/finish events."""
+
+    def __init__(self, delays, failing=()):
+        self.delays = delays
+        self.failing = set(failing)
+        self.events = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def execute(self, node_id):
+        self.events.append(("start", node_id))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(node_id, 0.01))
+            if node_id in self.failing:
+                raise RuntimeError(f"{node_id} failed")
+            return f"result:{node_id}"
+        finally:
+            self.in_flight -= 1
+            self.events.append(("finish", node_id))
+
+    def index(self, kind, node_id):
+        return self.events.index((kind, node_id))
+
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+def test_diamond_ordering():
+    print("\n=== Test 1: Diamond a -> (b, c) -> d ===")
+    dag = nx.DiGraph([("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")])
+    agents = MockAgents({"a": 0.01, "b": 0.05, "c": 0.02, "d": 0.01})
+    out = asyncio.run(collect(dataflow.run_dataflow(dag, agents.execute, max_concurrency=4)))
+
+    assert [node_id for node_id, *_ in out] == ["a", "c", "b", "d"]
+    assert all(result == f"result:{node_id}" for node_id, result, *_ in out)
+    assert agents.index("start", "b") > agents.index("finish", "a")
+    assert agents.index("start", "d") > max(agents.index("finish", "b"), agents.index("finish", "c"))
+    # b and c overlap
+    assert agents.index("start", "c") < agents.index("finish", "b")
+    print("  ✓ Yielded in completion order; d waits for both branches, b and c overlap")
+
+
+def test_concurrency_cap():
+    print("\n=== Test 2: max_concurrency bounds in-flight nodes ===")
+    dag = nx.DiGraph()
+    dag.add_nodes_from(f"n{i}" for i in range(10))
+    agents = MockAgents({})
+    out = asyncio.run(collect(dataflow.run_dataflow(dag, agents.execute, max_concurrency=3)))
+    assert sorted(node_id for node_id, *_ in out) == sorted(dag.nodes)
+    assert agents.max_in_flight == 3
+    assert all(started <= finished for _, _, started, finished in out)
+    print("  ✓ 10 independent nodes, never more than 3 in flight")
+
+
+def test_failure_patch_rewires_edges():
+    print("\n=== Test 3: Failure handler rewires the graph mid-run ===")
+    # a feeds b and c; x feeds e. The patch makes a feed b and e instead of c.
+    dag = nx.DiGraph([("a", "b"), ("a", "c"), ("x", "e")])
+    agents = MockAgents({"a": 0.01, "x": 0.1}, failing={"a"})
+
+    async def patch(node_id, exc):
+        assert node_id == "a" and str(exc) == "a failed"
+        dag.remove_edges_from(list(dag.out_edges("a")))
+        dag.add_edges_from([("a", "b"), ("a", "e")])
+        return True, "patched:a"
+
+    out = asyncio.run(collect(dataflow.run_dataflow(dag, agents.execute, on_failure=patch)))
+    results = {node_id: result for node_id, result, *_ in out}
+    assert set(results) == {"a", "b", "c", "e", "x"} and results["a"] == "patched:a"
+    # e gained a as a producer but still waits for x
+    assert agents.index("start", "e") > agents.index("finish", "x")
+    print("  ✓ Orphaned successor c released; newly fed e still waits for x")
+
+
+def test_unrecovered_failure_blocks_descendants():
+    print("\n=== Test 4: Unrecovered failure and skipped nodes ===")
+    dag = nx.DiGraph([("a", "b"), ("b", "c"), ("x", "y")])
+    agents = MockAgents({}, failing={"a"})
+
+    async def give_up(node_id, exc):
+        return False, None
+
+    out = asyncio.run(collect(dataflow.run_dataflow(dag, agents.execute, on_failure=give_up)))
+    assert sorted(node_id for node_id, *_ in out) == ["x", "y"]
+
+    async def skip_x(node_id):
+        return node_id != "x"
+
+    out = asyncio.run(collect(dataflow.run_dataflow(dag, MockAgents({}).execute, before_start=skip_x)))
+    assert sorted(node_id for node_id, *_ in out) == ["a", "b", "c"]
+
+    try:
+        asyncio.run(collect(dataflow.run_dataflow(dag, agents.execute)))
+        raise AssertionError("expected RuntimeError")
+    except RuntimeError as exc:
+        assert str(exc) == "a failed"
+    print("  ✓ Descendants of failed/skipped nodes never run; unhandled errors propagate")
+
+
+if __name__ == "__main__":
+    test_diamond_ordering()
+    test_concurrency_cap()
+    test_failure_patch_rewires_edges()
+    test_unrecovered_failure_blocks_descendants()
+    print("\nAll dataflow scheduler tests passed.")
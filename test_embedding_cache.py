@@ -0,0 +1,73 @@
+"""Test: Shared content-hash embedding cache"""
+import importlib.util
+import os
+import sys
+
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__ / hanerma.memory.__init__
+embedding_cache = load_module("hanerma.memory.embedding_cache", "hanerma/memory/embedding_cache.py")
+
+
+class CountingModel:
+    """Stands in for SentenceTransformer.encode: deterministic vectors, records every call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True):
+        self.calls.append((list(sentences), batch_size))
+        return np.array([[len(s), sum(map(ord, s)) % 97, 1.0] for s in sentences], dtype=np.float32)
+
+
+def test_batched_misses_and_hits():
+    print("\n=== Test 1: One batched encode for misses, hits from cache ===")
+    cache = embedding_cache.EmbeddingCache(max_entries=100)
+    model = CountingModel()
+    texts = ["alpha", "beta", "alpha", "gamma"]
+
+    first = cache.encode(model, "mini", texts, batch_size=16)
+    assert first.shape == (4, 3) and np.array_equal(first[0], first[2])
+    assert model.calls == [(["alpha", "beta", "gamma"], 16)]
+    print("  ✓ Duplicates deduplicated, misses encoded in one call")
+
+    second = cache.encode(model, "mini", ["gamma", "delta", "beta"])
+    assert len(model.calls) == 2 and model.calls[1][0] == ["delta"]
+    assert np.array_equal(second[0], first[3]) and np.array_equal(second[2], first[1])
+    assert cache.stats()["misses"] == 4 and cache.stats()["hits"] == 3
+    print("  ✓ Only the new text reaches the model")
+
+    # Callers may mutate what they get back without corrupting the cache
+    second[0][:] = -1
+    assert np.array_equal(cache.get("mini", "gamma"), first[3])
+    assert cache.get("other-model", "gamma") is None
+    print("  ✓ Results are copies; keys are per model")
+
+
+def test_lru_bound():
+    print("\n=== Test 2: LRU bound ===")
+    cache = embedding_cache.EmbeddingCache(max_entries=2)
+    model = CountingModel()
+    cache.encode(model, "mini", ["a", "b"])
+    cache.encode(model, "mini", ["a"])        # a becomes most recent
+    cache.encode(model, "mini", ["c"])        # evicts b
+    assert len(cache) == 2 and cache.get("mini", "b") is None and cache.get("mini", "a") is not None
+    assert cache.encode(model, "mini", []).shape[0] == 0
+    print("  ✓ Least recently used entry evicted")
+
+
+if __name__ == "__main__":
+    test_batched_misses_and_hits()
+    test_lru_bound()
+    print("\nAll embedding cache tests passed.")
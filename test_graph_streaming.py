@@ -0,0 +1,167 @@
+"""Test: Per-node graph results pushed to websocket and dashboard clients"""
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+import types
+
+import networkx as nx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__ (the real engine is not importable here)
+dataflow = load_module("hanerma.orchestrator.dataflow", "hanerma/orchestrator/dataflow.py")
+load_module("hanerma.core.config", "hanerma/core/config.py")
+websockets = load_module("hanerma.server.websockets", "hanerma/server/websockets.py")
+viz_server = load_module("hanerma.observability.viz_server", "hanerma/observability/viz_server.py")
+
+# a -> (slow, fast) -> join: fast finishes before slow although it was declared second
+SOURCE = "a; slow, fast; join"
+DELAYS = {"a": 0.01, "slow": 0.15, "fast": 0.01, "join": 0.01}
+COMPLETION_ORDER = ["a", "fast", "slow", "join"]
+
+
+class StreamingOrchestrator:
+    """Stands in for HANERMAOrchestrator.execute_graph_stream on top of the real scheduler."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.sources = []
+
+    async def execute(self, node_id):
+        await asyncio.sleep(DELAYS[node_id])
+        if node_id == self.fail_on:
+            raise RuntimeError(f"{node_id} failed")
+        return f"result:{node_id}"
+
+    async def execute_graph_stream(self, source_code):
+        self.sources.append(source_code)
+        dag = nx.DiGraph([("a", "slow"), ("a", "fast"), ("slow", "join"), ("fast", "join")])
+        async for node_id, result, started, finished in dataflow.run_dataflow(dag, self.execute):
+            yield node_id, result, {"start_time": started, "end_time": finished, "duration": finished - started}
+
+
+def session_client():
+    app = FastAPI()
+    app.include_router(websockets.ws_router)
+    return TestClient(app)
+
+
+def test_session_receives_node_results_in_completion_order(monkeypatch):
+    print("\n=== Test 1: /ws/stream pushes node_result per completed node ===")
+    orchestrator = StreamingOrchestrator()
+    monkeypatch.setattr(websockets, "get_orchestrator", lambda: orchestrator)
+    with session_client().websocket_connect("/ws/stream/s1") as ws:
+        ws.send_json({"type": "execute_graph", "source": SOURCE})
+        messages = [ws.receive_json() for _ in range(len(COMPLETION_ORDER) + 1)]
+
+    results = messages[:-1]
+    assert [m["type"] for m in results] == ["node_result"] * len(COMPLETION_ORDER)
+    assert [m["node_id"] for m in results] == COMPLETION_ORDER
+    assert all(m["content"] == f"result:{m['node_id']}" for m in results)
+    assert all(m["timing"]["end_time"] >= m["timing"]["start_time"] for m in results)
+    assert messages[-1] == {"type": "graph_complete", "nodes": len(COMPLETION_ORDER)}
+    assert orchestrator.sources == [SOURCE]
+    print("  ✓ fast arrives before slow; graph_complete follows the last node")
+
+
+def test_session_reports_graph_errors_and_keeps_listening(monkeypatch):
+    print("\n=== Test 2: A failed graph is reported, STOP still answers ===")
+    orchestrator = StreamingOrchestrator(fail_on="slow")
+    monkeypatch.setattr(websockets, "get_orchestrator", lambda: orchestrator)
+    with session_client().websocket_connect("/ws/stream/s2") as ws:
+        ws.send_json({"type": "execute_graph", "source": SOURCE})
+        messages = [ws.receive_json() for _ in range(3)]
+        ws.send_text("STOP")
+        halted = ws.receive_json()
+
+    assert [m.get("node_id") for m in messages[:2]] == ["a", "fast"]
+    assert messages[2] == {"type": "graph_error", "error": "slow failed"}
+    assert halted["type"] == "agent_thought" and "Halted" in halted["content"]
+    print("  ✓ graph_error after the nodes that did finish")
+
+
+def test_orchestrator_is_built_lazily_once_and_errors_are_reported(monkeypatch):
+    print("\n=== Test 3: Orchestrator built on the first execute_graph, shared, failures reported ===")
+    built = []
+
+    class BrokenOrchestrator:
+        def __init__(self):
+            built.append(self)
+            raise ImportError("cannot import name 'AtomicGuard'")
+
+    engine = types.ModuleType("hanerma.orchestrator.engine")
+    engine.HANERMAOrchestrator = BrokenOrchestrator
+    monkeypatch.setitem(sys.modules, "hanerma.orchestrator.engine", engine)
+    monkeypatch.setattr(websockets, "_orchestrator", None)
+
+    client = session_client()
+    with client.websocket_connect("/ws/stream/s3") as ws:
+        ws.send_text("STOP")
+        assert "Halted" in ws.receive_json()["content"]
+        assert not built
+        print("  ✓ Thought streaming works without constructing an orchestrator")
+
+        ws.send_json({"type": "execute_graph", "source": SOURCE})
+        error = ws.receive_json()
+    assert error == {"type": "graph_error", "error": "cannot import name 'AtomicGuard'"}
+    print("  ✓ Construction failure arrives as a graph_error frame")
+
+    class WorkingOrchestrator(StreamingOrchestrator):
+        def __init__(self):
+            super().__init__()
+            built.append(self)
+
+    engine.HANERMAOrchestrator = WorkingOrchestrator
+    built.clear()
+    for session_id in ("s4", "s5"):
+        with client.websocket_connect(f"/ws/stream/{session_id}") as ws:
+            ws.send_json({"type": "execute_graph", "source": SOURCE})
+            assert [ws.receive_json()["type"] for _ in range(len(COMPLETION_ORDER) + 1)][-1] == "graph_complete"
+    assert len(built) == 1 and built[0].sources == [SOURCE, SOURCE]
+    print("  ✓ Sessions share one orchestrator")
+
+
+def test_dashboard_execute_broadcasts_node_success(monkeypatch):
+    print("\n=== Test 4: POST /execute with a source streams to /ws clients ===")
+    orchestrator = StreamingOrchestrator()
+    monkeypatch.setattr(viz_server, "get_orchestrator", lambda: orchestrator)
+    with TestClient(viz_server.app) as client, client.websocket_connect("/ws") as ws:
+        # Let the endpoint register the socket before broadcasting
+        deadline = time.time() + 2
+        while not viz_server.ws_clients and time.time() < deadline:
+            time.sleep(0.01)
+        trace_id = client.post("/execute", json={"prompt": "run", "source": SOURCE}).json()["trace_id"]
+        events = [ws.receive_json() for _ in range(len(COMPLETION_ORDER) + 2)]
+
+    assert events[0]["event_type"] == "execution_start"
+    nodes = events[1:-1]
+    assert [e["event_type"] for e in nodes] == ["node_success"] * len(COMPLETION_ORDER)
+    assert [e["payload"]["node_id"] for e in nodes] == COMPLETION_ORDER
+    assert all(e["payload"]["trace_id"] == trace_id for e in events)
+    assert events[-1]["event_type"] == "execution_complete"
+    assert events[-1]["payload"]["nodes"] == len(COMPLETION_ORDER)
+    print("  ✓ node_success events in completion order, then execution_complete")
+
+
+if __name__ == "__main__":
+    import pytest
+    for test in (test_session_receives_node_results_in_completion_order,
+                 test_session_reports_graph_errors_and_keeps_listening,
+                 test_orchestrator_is_built_lazily_once_and_errors_are_reported,
+                 test_dashboard_execute_broadcasts_node_success):
+        with pytest.MonkeyPatch.context() as mp:
+            test(mp)
+    print("\nAll graph streaming tests passed.")
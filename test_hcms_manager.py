@@ -0,0 +1,200 @@
+"""Test: HCMSManager batched ingestion and retrieval"""
+import importlib.util
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__ / hanerma.memory.__init__
+base_tokenizer = load_module("hanerma.memory.compression.base_tokenizer", "hanerma/memory/compression/base_tokenizer.py")
+load_module("hanerma.state.models", "hanerma/state/models.py")
+load_module("hanerma.core.exceptions", "hanerma/core/exceptions.py")
+load_module("hanerma.state.transactional_bus", "hanerma/state/transactional_bus.py")
+ann = load_module("hanerma.memory.providers.ann_index", "hanerma/memory/providers/ann_index.py")
+load_module("hanerma.memory.persistence", "hanerma/memory/persistence.py")
+manager = load_module("hanerma.memory.manager", "hanerma/memory/manager.py")
+
+
+class BPETokenizer(base_tokenizer.BaseHyperTokenizer):
+    def encode_and_compress(self, text):
+        return super().encode_and_compress(text)
+
+    def decode(self, tokens):
+        return super().decode(tokens)
+
+    def get_compression_ratio(self, original_text, compressed_tokens):
+        return super().get_compression_ratio(original_text, compressed_tokens)
+
+
+class CountingIndex:
+    """Wraps a FAISS index and counts add/search calls."""
+
+    def __init__(self, index):
+        self.index = index
+        self.adds = 0
+        self.searches = 0
+
+    def add(self, vectors):
+        self.adds += 1
+        self.index.add(vectors)
+
+    def search(self, vectors, k):
+        self.searches += 1
+        return self.index.search(vectors, k)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+
+TOPICS = ["invoice", "deploy", "kubernetes", "refund", "latency", "password", "schema", "billing"]
+TEXTS = [f"turn {i} about {TOPICS[i % len(TOPICS)]} for customer {i % 17}" for i in range(300)]
+
+
+def test_store_many_matches_sequential():
+    print("\n=== Test: store_many / retrieve_many ===")
+
+    sequential = manager.HCMSManager(BPETokenizer(), bus=None)
+    for text in TEXTS:
+        sequential.store_atomic_memory("s1", text)
+
+    batched = manager.HCMSManager(BPETokenizer(), bus=None)
+    batched.vector_index = CountingIndex(batched.vector_index)
+    ids = batched.store_many("s1", TEXTS, batch_size=128)
+
+    assert ids == list(range(300))
+    assert batched.vector_index.ntotal == 300 and batched.vector_index.adds == 3
+    assert batched.memory_map == sequential.memory_map
+    print(f"  ✓ 300 memories stored with {batched.vector_index.adds} FAISS adds")
+
+    queries = ["refund for customer 3", "kubernetes deploy", "password reset"]
+    results = batched.retrieve_many(queries, top_k=5)
+    assert batched.vector_index.searches == 1
+    assert results == [sequential.retrieve_relevant_context(q, top_k=5) for q in queries]
+    assert all(len(r) == 5 for r in results)
+    print("  ✓ retrieve_many answers 3 queries with one search, same results as one-by-one")
+
+    empty = manager.HCMSManager(BPETokenizer(), bus=None)
+    assert empty.retrieve_many(queries) == [[], [], []]
+    assert empty.store_many("s1", []) == []
+    print("  ✓ Empty store / empty batch handled")
+
+
+def test_save_and_mmap_load():
+    print("\n=== Test: save / load(mmap=True) ===")
+    queries = ["refund for customer 3", "kubernetes deploy"]
+    # Token ids are assigned as the tokenizer sees symbols, so queries must go through the same instance
+    tokenizer = BPETokenizer()
+    with tempfile.TemporaryDirectory() as path:
+        original = manager.HCMSManager(tokenizer, bus=None)
+        original.store_many("s1", TEXTS[:200])
+        original.store_many("s2", TEXTS[200:], entity_type="fact")
+        original.save(path)
+
+        restored = manager.HCMSManager(tokenizer, bus=None).load(path, mmap=True)
+        assert restored.current_idx == 300 and restored.vector_index.ntotal == 300
+        assert restored.vector_index.stats()["mmapped_base"] == 300
+        assert restored.memory_map[250] == original.memory_map[250]
+        assert dict(restored.memory_map.items()) == original.memory_map
+        assert restored.count_total_tokens() == original.count_total_tokens()
+        assert restored.retrieve_many(queries, top_k=5) == original.retrieve_many(queries, top_k=5)
+        print("  ✓ Index and metadata restored without re-embedding")
+
+        # New memories land in the delta index and are appended on the next save
+        restored.store_many("s3", ["a brand new memory about refunds"])
+        assert restored.retrieve_relevant_context("a brand new memory about refunds", top_k=1) == \
+            ["a brand new memory about refunds"]
+        text_size = os.path.getsize(os.path.join(path, "text.bin"))
+        restored.save(path)
+        assert os.path.getsize(os.path.join(path, "text.bin")) == text_size + len("a brand new memory about refunds")
+        assert len([f for f in os.listdir(path) if f.endswith(".faiss")]) == 2  # untouched base + delta
+        print("  ✓ Second save appends one row and writes only the delta index")
+
+        again = manager.HCMSManager(tokenizer, bus=None).load(path, mmap=False)
+        assert again.current_idx == 301 and again.vector_index.stats()["mmapped_base"] == 0
+        assert again.memory_map[300]["session"] == "s3" and again.memory_map[299]["type"] == "fact"
+        assert again.retrieve_many(queries, top_k=5) == original.retrieve_many(queries, top_k=5)
+        print("  ✓ In-memory load sees base + delta")
+
+
+def test_load_after_upgrade():
+    print("\n=== Test: save / load an upgraded IVF index ===")
+    policy = ann.IndexPolicy(kind="ivf", upgrade_threshold=200, nprobe=64, background=False)
+    tokenizer = BPETokenizer()
+    with tempfile.TemporaryDirectory() as path:
+        original = manager.HCMSManager(tokenizer, bus=None, index_policy=policy)
+        original.store_many("s1", TEXTS)
+        assert original.vector_index.kind == "ivf"
+        original.save(path)
+
+        restored = manager.HCMSManager(tokenizer, bus=None, index_policy=policy).load(path)
+        assert restored.vector_index.kind == "ivf"
+        restored.store_many("s1", ["one more"])  # mmapped IVF lists are read-only: goes to the delta
+        assert restored.vector_index.ntotal == 301
+        assert restored.retrieve_relevant_context(TEXTS[7], top_k=1) == [TEXTS[7]]
+        print("  ✓ Read-only IVF base plus writable delta")
+
+
+def test_partitioned_retrieval():
+    print("\n=== Test: session / entity_type filtered retrieval ===")
+    tokenizer = BPETokenizer()
+    # Small exact cutoff so the IVF + IDSelector path is exercised too
+    policy = ann.IndexPolicy(kind="ivf", upgrade_threshold=200, nprobe=1, filter_exact_max=50, background=False)
+    store = manager.HCMSManager(tokenizer, bus=None, index_policy=policy)
+    sessions = ["tenant-a", "tenant-b", "tenant-c"]
+    for i in range(0, 300, 10):
+        store.store_many(sessions[(i // 10) % 3], TEXTS[i:i + 10], entity_type="fact" if i % 20 else "context")
+    assert store.vector_index.kind == "ivf"
+
+    def owned(session, entity_type=None):
+        return {store.memory_map[i]["text"] for i in store.memory_map
+                if store.memory_map[i]["session"] == session
+                and (entity_type is None or store.memory_map[i]["type"] == entity_type)}
+
+    for session in sessions:
+        for query in ["refund for customer 3", "schema migration"]:
+            hits = store.retrieve_relevant_context(query, top_k=8, session_id=session)
+            assert len(hits) == 8 and set(hits) <= owned(session)
+    print("  ✓ 8 hits per tenant, none from other tenants (nprobe=1 short results fall back to exact)")
+
+    hits = store.retrieve_relevant_context("invoice", top_k=50, session_id="tenant-b", entity_type="context")
+    assert len(hits) == len(owned("tenant-b", "context")) and set(hits) == owned("tenant-b", "context")
+    assert store.retrieve_relevant_context("invoice", session_id="nobody") == []
+    print("  ✓ Combined filters; top_k capped at partition size; unknown session is empty")
+
+    # Exact partition ranking matches a brute-force scan of the partition
+    query_vector = store._embed_batch(["latency for customer 5"])
+    ids = store._partition_ids("tenant-a", None)
+    vectors = store.vector_index.reconstruct_n(0, store.current_idx)[ids]
+    expected = [store.memory_map[int(ids[i])]["text"]
+                for i in np.argsort(((vectors - query_vector) ** 2).sum(axis=1), kind="stable")[:5]]
+    store.vector_index.policy.filter_exact_max = 10_000
+    assert store.retrieve_relevant_context("latency for customer 5", top_k=5, session_id="tenant-a") == expected
+    print("  ✓ Exact partition scan ranks like brute force")
+
+    with tempfile.TemporaryDirectory() as path:
+        store.save(path)
+        restored = manager.HCMSManager(tokenizer, bus=None, index_policy=policy).load(path)
+        restored.store_many("tenant-a", ["fresh tenant-a memory"])
+        hits = restored.retrieve_relevant_context("fresh tenant-a memory", top_k=101, session_id="tenant-a")
+        assert len(hits) == 101 and set(hits) == owned("tenant-a") | {"fresh tenant-a memory"}
+    print("  ✓ Partitions rebuilt from saved columns plus rows stored after load")
+
+
+if __name__ == "__main__":
+    test_store_many_matches_sequential()
+    test_save_and_mmap_load()
+    test_load_after_upgrade()
+    test_partitioned_retrieval()
+    print("\nAll HCMS manager tests passed.")
@@ -0,0 +1,132 @@
+"""Test: DistributedEventBus framed peer protocol"""
+import asyncio
+import importlib.util
+import os
+import sys
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__
+load_module("hanerma.core.config", "hanerma/core/config.py")
+exceptions = load_module("hanerma.core.exceptions", "hanerma/core/exceptions.py")
+message_bus = load_module("hanerma.orchestrator.message_bus", "hanerma/orchestrator/message_bus.py")
+
+
+class EchoBus(message_bus.DistributedEventBus):
+    """Event bus whose tools echo a payload of the requested size."""
+
+    async def _execute_tool(self, tool_name, args):
+        await asyncio.sleep(args.get("delay", 0))
+        return {"tool": tool_name, "data": "x" * args.get("size", 0)}
+
+
+def test_large_and_concurrent_dispatch():
+    print("\n=== Test: Framed Multiplexed Dispatch ===")
+
+    async def scenario():
+        server = EchoBus(node_id="server", host="127.0.0.1", port=15711)
+        client = EchoBus(node_id="client", host="127.0.0.1", port=15712)
+        await server.start()
+        try:
+            await client.discover_peer("127.0.0.1", 15711)
+            peer = "127.0.0.1:15711"
+            assert peer in client.get_peers()
+            assert "client" in server.get_peers()
+
+            # Results far beyond the old 4 KB read are delivered intact
+            result = await client.dispatch_tool(peer, "echo", {"size": 1_000_000})
+            assert len(result["data"]) == 1_000_000
+            print("  ✓ 1 MB result delivered intact")
+
+            # Many in-flight requests share the pooled connections
+            results = await asyncio.gather(*[
+                client.dispatch_tool(peer, "echo", {"size": i, "delay": 0.05}) for i in range(100)
+            ])
+            assert [len(r["data"]) for r in results] == list(range(100))
+            assert len(client._pools[("127.0.0.1", 15711)]) == client.pool_size
+            print(f"  ✓ 100 concurrent dispatches over {client.pool_size} connections")
+        finally:
+            await client.stop()
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_reconnect_after_peer_restart():
+    print("\n=== Test: Reconnect ===")
+
+    async def scenario():
+        server = EchoBus(node_id="server", host="127.0.0.1", port=15713)
+        client = EchoBus(node_id="client", host="127.0.0.1", port=15714)
+        await server.start()
+        await client.discover_peer("127.0.0.1", 15713)
+        peer = "127.0.0.1:15713"
+        assert (await client.dispatch_tool(peer, "echo", {"size": 3}))["data"] == "xxx"
+
+        await server.stop()
+        server = EchoBus(node_id="server", host="127.0.0.1", port=15713)
+        await server.start()
+        try:
+            assert (await client.dispatch_tool(peer, "echo", {"size": 2}))["data"] == "xx"
+        finally:
+            await client.stop()
+            await server.stop()
+        print("  ✓ Dispatch reconnects after peer restart")
+
+    asyncio.run(scenario())
+
+
+def test_bounded_topic_queue_policies():
+    print("\n=== Test: Per-Topic Worker Pools & Backpressure ===")
+
+    async def scenario(policy):
+        bus = message_bus.DistributedEventBus(node_id="local", queue_maxsize=5, workers_per_topic=3,
+                                              overflow_policy=policy)
+        delivered, active, peak = [], [0], [0]
+
+        async def listener(payload):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.005)
+            delivered.append(payload["i"])
+            active[0] -= 1
+
+        bus.subscribe("handoff", listener)
+        rejected = 0
+        for i in range(40):
+            try:
+                await bus.publish("handoff", {"i": i})
+            except exceptions.BackpressureError:
+                rejected += 1
+        await bus.drain()
+        metrics = bus.get_queue_metrics()["handoff"]
+        await bus.stop()
+        return delivered, rejected, peak[0], metrics
+
+    delivered, rejected, peak, metrics = asyncio.run(scenario("block"))
+    assert sorted(delivered) == list(range(40)) and rejected == 0
+    assert peak <= 3 and metrics["high_watermark"] <= 5 and metrics["workers"] == 3
+    print(f"  ✓ block: all 40 delivered, peak concurrency {peak}")
+
+    delivered, rejected, _, metrics = asyncio.run(scenario("drop_oldest"))
+    assert metrics["dropped"] == 40 - len(delivered) and delivered[-1] == 39
+    print(f"  ✓ drop_oldest: {metrics['dropped']} dropped, newest kept")
+
+    delivered, rejected, _, metrics = asyncio.run(scenario("reject"))
+    assert rejected == metrics["rejected"] and len(delivered) + rejected == 40
+    print(f"  ✓ reject: {rejected} rejected with BackpressureError")
+
+
+if __name__ == "__main__":
+    test_large_and_concurrent_dispatch()
+    test_reconnect_after_peer_restart()
+    test_bounded_topic_queue_policies()
@@ -0,0 +1,103 @@
+"""Test: Content-addressed node result memoization"""
+import ast
+import importlib.util
+import os
+import tempfile
+
+# Direct-load result_cache (bypass broken hanerma.__init__)
+spec = importlib.util.spec_from_file_location(
+    "result_cache",
+    os.path.join(os.path.dirname(__file__), "src", "hanerma", "orchestrator", "result_cache.py"),
+)
+result_cache = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(result_cache)
+
+node_cache_key = result_cache.node_cache_key
+result_digest = result_cache.result_digest
+
+
+def _stmt(src):
+    return ast.parse(src).body[0]
+
+
+def test_cache_key_is_content_addressed():
+    print("\n=== Test: Cache Key ===")
+    base = node_cache_key(_stmt('a = coder("x")'), "coder", "llama3", [])
+
+    # Formatting does not change the normalized AST
+    assert node_cache_key(_stmt('a  =  coder( "x" )'), "coder", "llama3", []) == base
+    # Prompt, agent, model and inputs all do
+    assert node_cache_key(_stmt('a = coder("y")'), "coder", "llama3", []) != base
+    assert node_cache_key(_stmt('a = coder("x")'), "coder", "qwen", []) != base
+    assert node_cache_key(_stmt('a = coder("x")'), "coder", "llama3", [result_digest("up")]) != base
+    print("  ✓ Key tracks AST, agent, model and input digests")
+
+
+def test_in_memory_lru():
+    print("\n=== Test: InMemoryResultCache ===")
+    cache = result_cache.InMemoryResultCache(max_entries=2)
+    cache.put("k1", "v1")
+    cache.put("k2", "v2")
+    assert cache.get("k1") == "v1"  # k1 becomes most recent
+    cache.put("k3", "v3")           # evicts k2
+    assert cache.get("k2") is None
+    assert cache.get("k1") == "v1" and cache.get("k3") == "v3"
+    assert cache.hits == 3 and cache.misses == 1
+    print("  ✓ LRU eviction and hit/miss counters")
+
+
+def test_sqlite_persistence():
+    print("\n=== Test: SQLiteResultCache ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "results.db")
+        cache = result_cache.SQLiteResultCache(path)
+        cache.put("k1", {"answer": 42})
+        cache.put("k2", object())  # not JSON-serializable: skipped
+        cache.close()
+
+        reopened = result_cache.SQLiteResultCache(path)
+        assert reopened.get("k1") == {"answer": 42}
+        assert reopened.get("k2") is None
+        reopened.close()
+    print("  ✓ Results survive reopen")
+
+
+class DictCapacitor:
+    """Stands in for hanerma_core.StateCapacitor: the same key-value methods over a dict."""
+
+    def __init__(self):
+        self.data = {}
+
+    def put_state(self, key, value):
+        self.data[key] = value
+
+    def get_state(self, key):
+        return self.data.get(key)
+
+    def keys(self):
+        return list(self.data)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_capacitor_clear_is_prefix_scoped():
+    print("\n=== Test: CapacitorResultCache.clear ===")
+    capacitor = DictCapacitor()
+    capacitor.put_state("agent_state", {"keep": True})
+    cache = result_cache.CapacitorResultCache(capacitor)
+    cache.put("k1", "v1")
+    cache.put("k2", {"v": 2})
+    assert cache.get("k1") == "v1"
+
+    cache.clear()
+    assert cache.get("k1") is None and cache.get("k2") is None
+    assert capacitor.keys() == ["agent_state"]
+    print("  ✓ Only this cache's prefixed keys are deleted")
+
+
+if __name__ == "__main__":
+    test_cache_key_is_content_addressed()
+    test_in_memory_lru()
+    test_sqlite_persistence()
+    test_capacitor_clear_is_prefix_scoped()
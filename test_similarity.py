@@ -0,0 +1,72 @@
+"""Test: Thresholded similarity neighbours (exact matrix vs FAISS HNSW)"""
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__
+similarity = load_module("hanerma.memory.compression.similarity", "hanerma/memory/compression/similarity.py")
+
+
+def redundant_blocks(n, dim=64, topics=None, noise=0.15, seed=0):
+    """Blocks that restate one of `topics` themes, plus noise."""
+    rng = np.random.default_rng(seed)
+    topics = topics or max(2, n // 20)
+    centers = rng.normal(size=(topics, dim))
+    return (centers[rng.integers(0, topics, n)] + noise * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_exact_matches_matrix():
+    print("\n=== Test 1: Exact mode equals the cosine_similarity matrix ===")
+    embeddings = redundant_blocks(400)
+    matrix = cosine_similarity(embeddings)
+    neighbors = similarity.threshold_neighbors(embeddings, 0.85, method="exact")
+    for i, row in enumerate(neighbors):
+        expected = [j for j in range(len(embeddings)) if j != i and matrix[i, j] > 0.85]
+        assert list(row) == expected
+    assert [len(row) for row in similarity.threshold_neighbors(embeddings[:1], 0.85)] == [0]
+    print("  ✓ Same neighbour lists as the O(n^2) matrix")
+
+
+def test_ann_recall_and_dense_clusters():
+    print("\n=== Test 2: ANN mode recall, dense clusters beyond k ===")
+    # 5 topics over 3000 blocks: ~600 neighbours each, far more than k=32
+    embeddings = redundant_blocks(3000, topics=5, seed=1)
+    exact = similarity.threshold_neighbors(embeddings, 0.85, method="exact")
+    ann = similarity.threshold_neighbors(embeddings, 0.85, method="ann", k=32)
+    found = sum(len(np.intersect1d(a, e)) for a, e in zip(ann, exact))
+    total = sum(len(e) for e in exact)
+    assert all(np.isin(a, e).all() for a, e in zip(ann, exact))  # never invents neighbours
+    assert found / total >= 0.95, found / total
+    print(f"  ✓ recall {found / total:.3f} with ~{total // len(exact)} neighbours per block")
+
+
+def test_ann_scales():
+    print("\n=== Test 3: ANN mode on a long transcript ===")
+    embeddings = redundant_blocks(10000, dim=128, topics=2000, seed=2)
+    started = time.perf_counter()
+    neighbors = similarity.threshold_neighbors(embeddings, 0.85)  # auto -> ann
+    elapsed = time.perf_counter() - started
+    assert len(neighbors) == 10000 and sum(len(n) for n in neighbors) > 0
+    print(f"  ✓ 10000 blocks in {elapsed:.1f}s without a 10000 x 10000 matrix")
+
+
+if __name__ == "__main__":
+    test_exact_matches_matrix()
+    test_ann_recall_and_dense_clusters()
+    test_ann_scales()
+    print("\nAll similarity tests passed.")
@@ -0,0 +1,143 @@
+"""Test: Bounded, pipelined streaming compression stages"""
+import asyncio
+import importlib.util
+import os
+import sys
+import threading
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__
+streaming = load_module("hanerma.memory.compression.streaming", "hanerma/memory/compression/streaming.py")
+
+
+async def collect(aiter):
+    return [item async for item in aiter]
+
+
+def test_word_windows():
+    print("\n=== Test 1: Word windows over str, sync and async chunks ===")
+    text = " ".join(f"w{i}" for i in range(25))
+    windows = asyncio.run(collect(streaming.word_windows(text, 10)))
+    assert [len(w.split()) for w in windows] == [10, 10, 5]
+    assert " ".join(windows) == text
+
+    # Chunks that cut words in half
+    chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+    assert asyncio.run(collect(streaming.word_windows(chunks, 10))) == windows
+
+    async def agen():
+        for chunk in chunks:
+            yield chunk
+    assert asyncio.run(collect(streaming.word_windows(agen(), 10))) == windows
+    assert asyncio.run(collect(streaming.word_windows("   ", 10))) == []
+    print("  ✓ Same windows however the input is chunked")
+
+
+def test_pipeline_order_offload_and_bound():
+    print("\n=== Test 2: Pipeline keeps order, offloads analysis, stays bounded ===")
+    loop_thread = []
+    analyse_threads = set()
+    analysed = []
+    finished = []
+
+    def analyse(window):
+        analyse_threads.add(threading.get_ident())
+        analysed.append(window)
+        return window.upper()
+
+    async def finish(window, result):
+        finished.append(window)
+        # Analysis may run ahead of the consumer by at most max_pending + 1 windows
+        assert len(analysed) - len(finished) <= 3
+        await asyncio.sleep(0)
+        return result
+
+    def source():
+        for i in range(50):
+            yield f"chunk{i} "
+
+    async def main():
+        loop_thread.append(threading.get_ident())
+        windows = streaming.word_windows(source(), 1)
+        return await collect(streaming.pipeline(windows, analyse, finish, max_pending=2))
+
+    out = asyncio.run(main())
+    assert out == [f"CHUNK{i}" for i in range(50)]
+    assert loop_thread[0] not in analyse_threads
+    print("  ✓ 50 windows in order, analysed off the event loop")
+
+
+def test_pipeline_errors_and_early_exit():
+    print("\n=== Test 3: Errors propagate, early exit stops the producer ===")
+
+    def analyse(window):
+        if window == "bad":
+            raise ValueError(window)
+        return window
+
+    async def finish(window, result):
+        return result
+
+    async def failing():
+        return await collect(streaming.pipeline(streaming.word_windows("ok bad ok", 1), analyse, finish))
+
+    try:
+        asyncio.run(failing())
+        raise AssertionError("expected ValueError")
+    except ValueError as exc:
+        assert str(exc) == "bad"
+
+    async def first_only():
+        stream = streaming.pipeline(streaming.word_windows("a b c d e f", 1), analyse, finish, max_pending=1)
+        async for item in stream:
+            await stream.aclose()
+            return item
+
+    assert asyncio.run(first_only()) == "a"
+    print("  ✓ Analysis errors reach the consumer; aclose() does not hang")
+
+
+def test_redundancy_is_only_detected_within_a_window():
+    print("\n=== Test 4: Redundancy is detected per window, not across windows ===")
+    # Stand-in for block clustering: drops repeated sentences within one window
+    def analyse(window):
+        kept = []
+        for sentence in (part.strip() for part in window.split(".")):
+            if sentence and sentence not in kept:
+                kept.append(sentence)
+        return ". ".join(kept)
+
+    async def finish(window, result):
+        return result
+
+    async def compress(text, window_words):
+        return await collect(streaming.pipeline(streaming.word_windows(text, window_words), analyse, finish))
+
+    sentence = "the cache key hashes the prompt"  # 6 words
+    text = ". ".join([sentence] * 4)  # 24 words
+
+    # One window sees every repeat
+    assert asyncio.run(compress(text, 24)) == [sentence]
+    # Window boundaries fall on sentence boundaries: each window keeps its own copy
+    pieces = asyncio.run(compress(text, 12))
+    assert pieces == [sentence, sentence]
+    assert streaming.DEFAULT_WINDOW_WORDS == 2000
+    print("  ✓ Repeats merge inside a window; a repeat in the next window survives")
+
+
+if __name__ == "__main__":
+    test_word_windows()
+    test_pipeline_order_offload_and_bound()
+    test_pipeline_errors_and_early_exit()
+    test_redundancy_is_only_detected_within_a_window()
+    print("\nAll streaming tests passed.")
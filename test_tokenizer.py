@@ -0,0 +1,164 @@
+"""Test: BaseHyperTokenizer BPE (train once, ranked merges, word cache)"""
+import importlib.util
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__
+base_tokenizer = load_module("hanerma.memory.compression.base_tokenizer", "hanerma/memory/compression/base_tokenizer.py")
+
+
+class BPETokenizer(base_tokenizer.BaseHyperTokenizer):
+    def encode_and_compress(self, text):
+        return super().encode_and_compress(text)
+
+    def decode(self, tokens):
+        return super().decode(tokens)
+
+    def get_compression_ratio(self, original_text, compressed_tokens):
+        return super().get_compression_ratio(original_text, compressed_tokens)
+
+
+CORPUS = [
+    "the lower newest widest lowest",
+    "newer wider lower low new wide",
+    "the newest deployment of the lowest latency service",
+] * 3
+
+
+def reference_bpe(tokenizer, text):
+    """Applies every merge in rank order to every word, symbol by symbol."""
+    words = []
+    for word in text.split():
+        symbols = list(word) + ["</w>"]
+        for first, second in tokenizer.merges:
+            merged, i = [], 0
+            while i < len(symbols):
+                if i < len(symbols) - 1 and symbols[i] == first and symbols[i + 1] == second:
+                    merged.append(first + second)
+                    i += 2
+                else:
+                    merged.append(symbols[i])
+                    i += 1
+            symbols = merged
+        words.extend(symbols)
+    return words
+
+
+def test_train_once_and_rank_encoding():
+    print("\n=== Test 1: Train once, encode with merge ranks ===")
+    tokenizer = BPETokenizer()
+    tokenizer.train(CORPUS, num_merges=40)
+    assert len(tokenizer.merge_ranks) == 40
+    merges = dict(tokenizer.merges)
+
+    for text in CORPUS + ["the slowest newer widest lowly"]:
+        tokens = tokenizer.encode_and_compress(text)
+        assert [tokenizer.id_to_token[t] for t in tokens] == reference_bpe(tokenizer, text)
+    assert tokenizer.merges == merges
+    print("  ✓ Encoding matches sequential merge application")
+
+    # Merged symbols only match whole symbols
+    assert tokenizer.merge_vocab(("a", "b"), {"x a b </w>": 1, "xa b </w>": 1}) == {"x ab </w>": 1, "xa b </w>": 1}
+    print("  ✓ merge_vocab does not merge across symbol boundaries")
+
+
+def test_word_cache():
+    print("\n=== Test 2: Word LRU cache ===")
+    tokenizer = BPETokenizer(word_cache_size=3)
+    tokenizer.train(CORPUS)
+    first = tokenizer.encode_and_compress("newest lowest widest newest")
+    assert list(tokenizer._word_cache) == ["lowest", "widest", "newest"]
+    tokenizer.encode_and_compress("lower")
+    assert list(tokenizer._word_cache) == ["widest", "newest", "lower"]
+    assert tokenizer.encode_and_compress("newest lowest widest newest") == first
+    assert tokenizer.count_tokens("newest lowest") == len(first) // 2
+    print("  ✓ Cache is bounded, LRU-ordered and returns identical ids")
+
+
+def test_lazy_training_and_persistence():
+    print("\n=== Test 3: Lazy training, save/load merges ===")
+    tokenizer = BPETokenizer()
+    tokenizer.encode_and_compress(CORPUS[0])
+    merges = dict(tokenizer.merges)
+    tokenizer.encode_and_compress(CORPUS[1])
+    assert tokenizer.merges == merges
+    print("  ✓ Untrained tokenizer learns merges from its first text only")
+
+    trained = BPETokenizer()
+    trained.train(CORPUS)
+    other = BPETokenizer()
+    other.train(CORPUS)
+    assert trained.encode_and_compress("newest service") == other.encode_and_compress("newest service")
+    print("  ✓ Same corpus, same token ids across instances")
+
+    with tempfile.TemporaryDirectory() as path:
+        merges_path = os.path.join(path, "merges.json")
+        trained.encode_and_compress("zebra")  # adds unseen symbols after training
+        trained.save_merges(merges_path)
+        loaded = BPETokenizer()
+        loaded.load_merges(merges_path)
+    assert loaded.merge_ranks == trained.merge_ranks
+    for text in CORPUS + ["zebra newest"]:
+        assert loaded.encode_and_compress(text) == trained.encode_and_compress(text)
+    print("  ✓ Loaded merge table reproduces token ids")
+
+
+def reference_embed(tokens, dim):
+    """The original per-token, per-harmonic embedding loop."""
+    if not tokens:
+        return np.zeros(dim, dtype=np.float32)
+    vec = np.zeros(dim, dtype=np.float64)
+    for i, tid in enumerate(tokens):
+        pos_weight = 1.0 / (1.0 + i * 0.1)
+        for harmonic in range(1, 4):
+            freq = tid * harmonic * 0.01
+            vec[(tid * harmonic) % dim] += np.sin(freq) * pos_weight
+            vec[(tid * harmonic + dim // 2) % dim] += np.cos(freq) * pos_weight
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec = vec / norm
+    return vec.astype(np.float32)
+
+
+def test_vectorized_embed_is_bit_identical():
+    print("\n=== Test 4: Vectorized embed / embed_many ===")
+    tokenizer = BPETokenizer()
+    tokenizer.train(CORPUS)
+    texts = CORPUS + ["", "x", "a much longer text " * 40, "unicode naïve café 東京 tokens"]
+    for dim in (7, 64, 128):
+        matrix = tokenizer.embed_many(texts, dim=dim)
+        assert matrix.shape == (len(texts), dim) and matrix.dtype == np.float32
+        for text, row in zip(texts, matrix):
+            expected = reference_embed(tokenizer.encode_and_compress(text), dim)
+            assert np.array_equal(row, expected)
+            assert np.array_equal(tokenizer.embed(text, dim=dim), expected)
+    print("  ✓ embed and embed_many rows equal the original loop bit for bit")
+
+    # Large token ids (many harmonics wrap around dim)
+    tokens = list(range(5000, 5600, 3))
+    tokenizer.encode_many = lambda batch: [tokens for _ in batch]
+    assert np.array_equal(tokenizer.embed("ignored"), reference_embed(tokens, 128))
+    assert tokenizer.embed_many([]).shape == (0, 128)
+    print("  ✓ Large ids and empty batches")
+
+
+if __name__ == "__main__":
+    test_train_once_and_rank_encoding()
+    test_word_cache()
+    test_lazy_training_and_persistence()
+    test_vectorized_embed_is_bit_identical()
+    print("\nAll tokenizer tests passed.")
@@ -0,0 +1,174 @@
+"""Test: TransactionalEventBus group commit and durability levels"""
+import gc
+import importlib.util
+import os
+import sys
+import tempfile
+import weakref
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(__file__), "src")
+
+
+def load_module(name, rel_path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC, *rel_path.split("/")))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# Bypass broken hanerma.__init__ (transactional_bus imports .models)
+models = load_module("hanerma.state.models", "hanerma/state/models.py")
+exceptions = load_module("hanerma.core.exceptions", "hanerma/core/exceptions.py")
+bus_mod = load_module("hanerma.state.transactional_bus", "hanerma/state/transactional_bus.py")
+
+HANERMAState = models.HANERMAState
+TransactionalEventBus = bus_mod.TransactionalEventBus
+
+
+@pytest.mark.parametrize("durability", ["fsync", "batched", "async"])
+def test_record_and_recover(durability):
+    print(f"\n=== Test: record_step ({durability}) ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        bus = TransactionalEventBus(os.path.join(tmp, "state.db"), durability=durability)
+        state = HANERMAState()
+        for i in range(200):
+            state.history.append(models.HistoryEntry(role="user", content=f"turn {i}"))
+            bus.record_step("trace-1", i, "node_success", {"i": i}, state)
+
+        # Reads flush pending batches first
+        steps = bus.recover_trace("trace-1")
+        assert [s["step_index"] for s in steps] == list(range(200))
+        assert steps[-1]["state_hash"] == state.compute_hash()
+
+        restored = bus.get_last_valid_state("trace-1", 100)
+        assert len(restored.history) == 100
+        assert bus.get_latest_trace_id() == "trace-1"
+        bus.close()
+    print("  ✓ All steps committed and recoverable")
+
+
+def test_close_flushes_pending_steps():
+    print("\n=== Test: close() flushes ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+        bus = TransactionalEventBus(path, durability="batched")
+        for i in range(50):
+            bus.record_step("trace-2", i, "node_start", {}, HANERMAState())
+        bus.close()
+
+        reopened = TransactionalEventBus(path, durability="fsync")
+        assert len(reopened.recover_trace("trace-2")) == 50
+        reopened.close()
+    print("  ✓ No steps lost on close")
+
+
+def test_delta_snapshots_rebuild_exact_state():
+    print("\n=== Test: Delta-Encoded Snapshots ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        bus = TransactionalEventBus(os.path.join(tmp, "state.db"), checkpoint_interval=8)
+        state = HANERMAState()
+        expected = []
+        for i in range(60):
+            state.history.append(models.HistoryEntry(role="agent", content=f"step {i}"))
+            state.shared_memory.root[f"key{i % 3}"] = {"value": i}
+            if i % 10 == 0:
+                state.shared_memory.root.pop(f"key{(i + 1) % 3}", None)
+            if i == 25:
+                state.history.pop(0)  # trimmed history forces a checkpoint
+            bus.record_step("trace-3", i, "node_success", {}, state)
+            expected.append(state.to_dict())
+
+        with bus._lock:
+            checkpoints = bus._conn.execute(
+                "SELECT COUNT(*) FROM events WHERE trace_id = ? AND is_checkpoint = 1", ("trace-3",)
+            ).fetchone()[0]
+        assert checkpoints < 60 // 4, f"Expected mostly delta rows, got {checkpoints} checkpoints"
+
+        for i in (0, 7, 8, 25, 26, 59):
+            assert bus.get_last_valid_state("trace-3", i + 1).to_dict() == expected[i]
+        assert [s["full_state"] for s in bus.recover_trace("trace-3")] == expected
+        bus.close()
+    print(f"  ✓ {checkpoints} checkpoints, every step rebuilt exactly")
+
+
+def test_failed_commit_is_raised_and_trace_restarts_with_checkpoint():
+    print("\n=== Test: Failed group commit ===")
+    with tempfile.TemporaryDirectory() as tmp, pytest.MonkeyPatch.context() as monkeypatch:
+        bus = TransactionalEventBus(os.path.join(tmp, "state.db"), checkpoint_interval=100)
+        state = HANERMAState()
+        expected = []
+
+        def step(i):
+            state.history.append(models.HistoryEntry(role="agent", content=f"step {i}"))
+            bus.record_step("trace-4", i, "node_success", {}, state)
+            expected.append(state.to_dict())
+
+        for i in range(3):
+            step(i)
+        bus.flush()
+
+        insert_rows = bus_mod._insert_rows
+
+        def disk_full(conn, lock, rows):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(bus_mod, "_insert_rows", disk_full)
+        step(3)
+        with pytest.raises(exceptions.EventWriteError):
+            bus.flush()
+        bus.flush()  # reported once
+        print("  ✓ flush() raises EventWriteError for the lost batch")
+
+        step(4)
+        bus._queue.join()
+        monkeypatch.setattr(bus_mod, "_insert_rows", insert_rows)
+        with pytest.raises(exceptions.EventWriteError):
+            step(5)
+        expected.pop()
+        print("  ✓ record_step() raises for earlier lost steps")
+
+        step(6)
+        bus.flush()
+        with bus._lock:
+            rows = bus._conn.execute(
+                "SELECT step_index, is_checkpoint FROM events WHERE trace_id = ? ORDER BY id", ("trace-4",)
+            ).fetchall()
+        assert rows == [(0, 1), (1, 0), (2, 0), (6, 1)]
+        assert bus.get_last_valid_state("trace-4", 7).to_dict() == expected[-1]
+        bus.close()
+    print("  ✓ Next step is written as a full checkpoint and rebuilds exactly")
+
+
+def test_unclosed_bus_is_collected_and_flushed():
+    print("\n=== Test: Unclosed bus ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+        bus = TransactionalEventBus(path)
+        for i in range(20):
+            bus.record_step("trace-5", i, "node_start", {}, HANERMAState())
+        writer, ref = bus._writer, weakref.ref(bus)
+        del bus
+        gc.collect()
+        assert ref() is None and not writer.is_alive()
+
+        reopened = TransactionalEventBus(path, durability="fsync")
+        assert len(reopened.recover_trace("trace-5")) == 20
+        reopened.close()
+    print("  ✓ Garbage-collected bus drains its queue and stops its writer")
+
+
+def test_unknown_durability_rejected():
+    with pytest.raises(ValueError):
+        TransactionalEventBus(":memory:", durability="sometimes")
+
+
+if __name__ == "__main__":
+    for level in ("fsync", "batched", "async"):
+        test_record_and_recover(level)
+    test_close_flushes_pending_steps()
+    test_delta_snapshots_rebuild_exact_state()
+    test_failed_commit_is_raised_and_trace_restarts_with_checkpoint()
+    test_unclosed_bus_is_collected_and_flushed()